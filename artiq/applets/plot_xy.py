@@ -5,7 +5,48 @@ import PyQt6  # make sure pyqtgraph imports Qt6
 from PyQt6.QtCore import QTimer
 import pyqtgraph
 
-from artiq.applets.simple import TitleApplet
+from artiq.applets.simple import TitleApplet, dataset_changes
+
+
+class _PlotBuffer:
+    """Copy of a dataset value as a NumPy array, with room to append elements
+    without reallocating it each time."""
+    def __init__(self, value):
+        self.data = np.array(value, dtype=float)
+        self.length = len(self.data)
+
+    def update(self, value, change):
+        """Updates the copy from the new ``value`` of the dataset and its
+        ``change``, as returned by :func:`dataset_changes`. Returns ``False``
+        if the copy cannot be updated incrementally."""
+        if change is None:
+            return False
+        appended, indices = change
+        if self.length + appended != len(value):
+            return False
+        for i in indices:
+            if i < self.length:
+                self.data[i] = value[i]
+        if appended:
+            new_length = self.length + appended
+            if new_length > len(self.data):
+                data = np.empty(max(new_length, 2*len(self.data)))
+                data[:self.length] = self.data[:self.length]
+                self.data = data
+            self.data[self.length:new_length] = value[self.length:]
+            self.length = new_length
+        return True
+
+    @property
+    def view(self):
+        return self.data[:self.length]
+
+
+def _is_sorted(x):
+    try:
+        return bool(np.all(np.diff(x) >= 0))
+    except TypeError:
+        return False
 
 
 class XYPlot(pyqtgraph.PlotWidget):
@@ -18,6 +59,11 @@ class XYPlot(pyqtgraph.PlotWidget):
         self.mismatch = {'X values': False,
                          'Error bars': False,
                          'Fit values': False}
+        # Scatter plot of the Y values and copies of the plotted values,
+        # while only they are displayed and can be updated incrementally.
+        self.curve = None
+        self.x_buffer = None
+        self.y_buffer = None
 
     def data_changed(self, value, metadata, persist, mods, title):
         try:
@@ -55,9 +101,18 @@ class XYPlot(pyqtgraph.PlotWidget):
                 self.timer.start(1000)
             return
 
-        self.clear()
-        self.plot(x, y, pen=None, symbol="x")
         self.setTitle(title)
+        if (error is None and fit is None
+                and self._update_curve(value, mods)):
+            return
+
+        self.clear()
+        self.curve = self.plot(x, y, pen=None, symbol="x")
+        self._set_downsampling(self.args.x not in value or _is_sorted(x))
+        self.x_buffer = None
+        self.y_buffer = None
+        if error is None and fit is None:
+            self._set_buffers(value)
         if error is not None:
             # See https://github.com/pyqtgraph/pyqtgraph/issues/211
             if hasattr(error, "__len__") and not isinstance(error, np.ndarray):
@@ -69,8 +124,48 @@ class XYPlot(pyqtgraph.PlotWidget):
             xi = np.argsort(x)
             self.plot(x[xi], fit[xi])
 
+    def _set_buffers(self, value):
+        try:
+            self.y_buffer = _PlotBuffer(value[self.args.y])
+            if self.args.x in value:
+                self.x_buffer = _PlotBuffer(value[self.args.x])
+        except (TypeError, ValueError):
+            # not numeric; keep plotting the values as they are
+            self.x_buffer = None
+            self.y_buffer = None
+
+    def _update_curve(self, value, mods):
+        if self.curve is None or self.y_buffer is None:
+            return False
+        if (self.x_buffer is None) != (self.args.x not in value):
+            return False
+        if not self.y_buffer.update(value[self.args.y],
+                                    dataset_changes(mods, self.args.y)):
+            return False
+        if self.x_buffer is None:
+            x = np.arange(self.y_buffer.length)
+        else:
+            if not self.x_buffer.update(value[self.args.x],
+                                        dataset_changes(mods, self.args.x)):
+                return False
+            x = self.x_buffer.view
+        self.curve.setData(x, self.y_buffer.view)
+        if self.x_buffer is not None:
+            self._set_downsampling(_is_sorted(x))
+        return True
+
+    def _set_downsampling(self, enable):
+        # pyqtgraph downsamples assuming that the X values are sorted and
+        # evenly spaced, which would put the points of scans in any other
+        # order at the wrong X values.
+        if enable:
+            self.curve.setDownsampling(auto=True, method="peak")
+        else:
+            self.curve.setDownsampling(ds=1, auto=False)
+
     def length_warning(self):
         self.clear()
+        self.curve = None
         text = "⚠️ dataset lengths mismatch:\n"
         errors = ', '.join([k for k, v in self.mismatch.items() if v])
         text = ' '.join([errors, "should have the same length as Y values"])
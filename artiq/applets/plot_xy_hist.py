@@ -5,18 +5,14 @@ from PyQt6 import QtWidgets
 from PyQt6.QtCore import QTimer
 import pyqtgraph
 
-from artiq.applets.simple import SimpleApplet
+from artiq.applets.simple import SimpleApplet, dataset_changes
 
 
 def _compute_ys(histogram_bins, histograms_counts):
-        bin_centers = np.empty(len(histogram_bins)-1)
-        for i in range(len(bin_centers)):
-            bin_centers[i] = (histogram_bins[i] + histogram_bins[i+1])/2
-
-        ys = np.empty(histograms_counts.shape[0])
-        for n, counts in enumerate(histograms_counts):
-            ys[n] = sum(bin_centers*counts)/sum(counts)
-        return ys
+    histogram_bins = np.asarray(histogram_bins)
+    bin_centers = (histogram_bins[:-1] + histogram_bins[1:])/2
+    histograms_counts = np.asarray(histograms_counts)
+    return histograms_counts @ bin_centers / histograms_counts.sum(axis=1)
 
 
 # pyqtgraph.GraphicsWindow fails to behave like a regular Qt widget
@@ -52,32 +48,24 @@ class XYHistPlot(QtWidgets.QSplitter):
         self.selected_index = None
 
         self.histogram_bins = histogram_bins
+        self.histograms_counts = histograms_counts
 
         ys = _compute_ys(self.histogram_bins, histograms_counts)
         self.xy_plot_data = self.xy_plot.plot(x=xs, y=ys,
                                               pen=None,
                                               symbol="x", symbolSize=20)
         self.xy_plot_data.sigPointsClicked.connect(self._point_clicked)
-        for index, (point, counts) in (
-                enumerate(zip(self.xy_plot_data.scatter.points(),
-                              histograms_counts))):
-            point.histogram_index = index
-            point.histogram_counts = counts
 
         text = "click on a data point at the left\n"\
                "to see the corresponding histogram"
         self.hist_plot.addItem(pyqtgraph.TextItem(text))
 
     def _set_partial_data(self, xs, histograms_counts):
+        self.histograms_counts = histograms_counts
         ys = _compute_ys(self.histogram_bins, histograms_counts)
         self.xy_plot_data.setData(x=xs, y=ys,
                                   pen=None,
                                   symbol="x", symbolSize=20)
-        for index, (point, counts) in (
-                enumerate(zip(self.xy_plot_data.scatter.points(),
-                              histograms_counts))):
-            point.histogram_index = index
-            point.histogram_counts = counts
 
     def _point_clicked(self, data_item, spot_items):
         spot_item = spot_items[0]
@@ -91,36 +79,41 @@ class XYHistPlot(QtWidgets.QSplitter):
             self.xy_plot.addItem(self.arrow)
         else:
             self.arrow.setPos(position)
-        self.selected_index = spot_item.histogram_index
+        self.selected_index = spot_item.index()
+        histogram_counts = self.histograms_counts[self.selected_index]
 
         if self.hist_plot_data is None:
             self.hist_plot.clear()
             self.hist_plot_data = self.hist_plot.plot(
                 x=self.histogram_bins,
-                y=spot_item.histogram_counts,
+                y=histogram_counts,
                 stepMode=True, fillLevel=0,
                 brush=(0, 0, 255, 150))
         else:
             self.hist_plot_data.setData(x=self.histogram_bins,
-                                        y=spot_item.histogram_counts)
+                                        y=histogram_counts)
 
     def _can_use_partial(self, mods):
         if self.hist_plot_data is None:
             return False
+        if dataset_changes(mods, self.args.histogram_bins) != (0, set()):
+            return False
+        # Points may be appended or modified, except the selected one.
+        row_mods = []
+        other_mods = []
         for mod in mods:
-            if mod["action"] != "setitem":
-                return False
-            if mod["path"] == [self.args.xs, 1]:
-                if mod["key"] == self.selected_index:
-                    return False
-            elif mod["path"][:2] == [self.args.histograms_counts, 1]:
-                if len(mod["path"]) > 2:
-                    index = mod["path"][2]
-                else:
-                    index = mod["key"]
-                if index == self.selected_index:
-                    return False
+            path = mod.get("path")
+            if (path and path[:2] == [self.args.histograms_counts, 1]
+                    and len(path) > 2):
+                row_mods.append(mod)
             else:
+                other_mods.append(mod)
+        for mod in row_mods:
+            if mod["path"][2] == self.selected_index:
+                return False
+        for key in self.args.xs, self.args.histograms_counts:
+            change = dataset_changes(other_mods, key)
+            if change is None or self.selected_index in change[1]:
                 return False
         return True
 
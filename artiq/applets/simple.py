@@ -1,6 +1,7 @@
 import logging
 import argparse
 import asyncio
+import numbers
 import os
 import string
 
@@ -12,11 +13,52 @@ from sipyco import pyon
 from sipyco.pipe_ipc import AsyncioChildComm
 
 from artiq.language.scan import ScanObject
+from artiq.master.publisher import filtered_notifier_name
 
 
 logger = logging.getLogger(__name__)
 
 
+def dataset_changes(mods, key):
+    """Summarizes how the value of the dataset ``key`` was modified by
+    ``mods``, the list of modifications passed to ``data_changed``, so that
+    applets can update their display incrementally.
+
+    Returns ``None`` if the value was replaced or modified in a way other than
+    appending elements or setting elements by index; it must then be reloaded
+    entirely. Otherwise, returns a tuple ``(appended, indices)``, where
+    ``appended`` is the number of elements appended to the value and
+    ``indices`` the set of indices of the elements that were set. Both are
+    empty if the dataset was not modified.
+    """
+    appended = 0
+    indices = set()
+    for mod in mods:
+        if mod["action"] == "init":
+            return None
+        path = mod["path"]
+        if not path:
+            if mod["key"] == key:
+                return None
+            continue
+        if path[0] != key:
+            continue
+        if path[1:] != [1]:
+            if len(path) > 1 and path[1] != 1:
+                # persistence flag or metadata
+                continue
+            return None
+        if mod["action"] == "append":
+            appended += 1
+        elif (mod["action"] == "setitem"
+                and isinstance(mod["key"], numbers.Integral)
+                and mod["key"] >= 0):
+            indices.add(int(mod["key"]))
+        else:
+            return None
+    return appended, indices
+
+
 class _AppletRequestInterface:
     def __init__(self):
         raise NotImplementedError
@@ -163,10 +205,13 @@ class AppletIPCClient(AsyncioChildComm):
                              exc_info=True)
                 self.close_cb()
 
-    def subscribe(self, datasets, init_cb, mod_cb, dataset_prefixes=[], *, loop):
+    def subscribe(self, datasets, init_cb, mod_cb, dataset_prefixes=[],
+                  max_rate=None, coalesce=True, *, loop):
         self.write_pyon({"action": "subscribe",
                          "datasets": datasets,
-                         "dataset_prefixes": dataset_prefixes})
+                         "dataset_prefixes": dataset_prefixes,
+                         "max_rate": max_rate,
+                         "coalesce": coalesce})
         self.init_cb = init_cb
         self.mod_cb = mod_cb
         self.listen_task = loop.create_task(self.listen())
@@ -200,6 +245,16 @@ class SimpleApplet:
             "--update-delay", type=float, default=default_update_delay,
             help="time to wait after a mod (buffering other mods) "
                  "before updating (default: %(default).2f)")
+        self.argparser.add_argument(
+            "--max-rate", default=None, type=float,
+            help="maximum number of dataset updates per second sent by the "
+                 "master, or the dashboard in embedded mode, which drop the "
+                 "modifications superseded in between (default: unlimited)")
+        self.argparser.add_argument(
+            "--no-coalesce", default=False, action="store_true",
+            help="have the dashboard send every dataset modification, "
+                 "instead of dropping those superseded while the applet "
+                 "processes the previous ones (embedded mode only)")
 
         group = self.argparser.add_argument_group("standalone mode (default)")
         group.add_argument(
@@ -347,20 +402,59 @@ class SimpleApplet:
         else:
             self.emit_data_changed(self.data, [mod])
 
+    async def connect_subscriber(self, notifier_name):
+        self.subscriber = Subscriber(notifier_name,
+                                     self.subscriber_init, self.sub_mod,
+                                     self.subscriber_disconnected)
+        await self.subscriber.connect(self.args.server, self.args.port_notify)
+
+    def subscriber_init(self, data):
+        self.subscriber_fallback = None
+        return self.sub_init(data)
+
+    def subscriber_disconnected(self):
+        if self.subscriber_fallback is None:
+            return
+        # Masters serving the notifiers with the sipyco Publisher (before
+        # ARTIQ-9) close the connection of filtered subscriptions without
+        # sending the datasets.
+        logger.warning("master does not support filtered dataset "
+                       "subscriptions, receiving all datasets%s",
+                       "" if self.args.max_rate is None
+                       else " (--max-rate is ignored)")
+        notifier_name = self.subscriber_fallback
+        self.subscriber_fallback = None
+        self.subscriber_fallback_task = asyncio.ensure_future(
+            self.connect_subscriber(notifier_name))
+
     def subscribe(self):
         if self.embed is None:
-            self.subscriber = Subscriber("datasets",
-                                         self.sub_init, self.sub_mod)
-            self.loop.run_until_complete(self.subscriber.connect(
-                self.args.server, self.args.port_notify))
+            # Let the master send only the datasets we display, and
+            # fall back to filtering them here with older masters.
+            notifier_name = filtered_notifier_name(
+                "datasets", self.datasets, self.dataset_prefixes,
+                self.args.max_rate)
+            self.subscriber_fallback = "datasets"
+            self.subscriber_fallback_task = None
+            self.loop.run_until_complete(
+                self.connect_subscriber(notifier_name))
         else:
             self.ipc.subscribe(self.datasets, self.sub_init, self.sub_mod,
                                dataset_prefixes=self.dataset_prefixes,
+                               max_rate=self.args.max_rate,
+                               coalesce=not self.args.no_coalesce,
                                loop=self.loop)
 
     def unsubscribe(self):
         if self.embed is None:
-            self.loop.run_until_complete(self.subscriber.close())
+            self.subscriber_fallback = None
+            task = self.subscriber_fallback_task
+            if task is not None and not task.done():
+                task.cancel()
+                self.loop.run_until_complete(
+                    asyncio.gather(task, return_exceptions=True))
+            if hasattr(self.subscriber, "receive_task"):
+                self.loop.run_until_complete(self.subscriber.close())
 
     def run(self):
         self.args_init()
@@ -117,3 +117,5 @@ class CoerceT(ast.expr, commontyped):
     _fields = ('value',) # other_value deliberately not in _fields
 class QuoteT(ast.expr, commontyped):
     _fields = ('value',)
+class BlobT(ast.expr, commontyped):
+    _fields = ('value',) # a NumPy array with the contents of the new list or array
@@ -0,0 +1,174 @@
+"""
+Manipulation of the ELF shared libraries produced for kernels, without
+running external tools.
+"""
+
+import struct
+
+
+__all__ = ["strip_debug"]
+
+
+_SHT_RELA = 4
+_SHT_NOBITS = 8
+_SHT_REL = 9
+_SHT_SYMTAB = 2
+_SHT_DYNSYM = 11
+_SHT_GROUP = 17
+_SHT_SYMTAB_SHNDX = 18
+
+_SHF_ALLOC = 0x2
+_SHF_INFO_LINK = 0x40
+
+_SHN_LORESERVE = 0xff00
+
+_PT_LOAD = 1
+
+
+class _Layout:
+    """The structures of an ELF file of a given class and byte order."""
+    def __init__(self, data):
+        if data[:4] != b"\x7fELF":
+            raise ValueError("not an ELF file")
+        elf_class, elf_data = data[4], data[5]
+        if elf_data == 1:
+            byte_order = "<"
+        elif elf_data == 2:
+            byte_order = ">"
+        else:
+            raise ValueError("unknown ELF byte order {}".format(elf_data))
+        if elf_class == 1:
+            self.ehdr = struct.Struct(byte_order + "HHIIIIIHHHHHH")
+            # name, type, flags, addr, offset, size, link, info, addralign, entsize
+            self.shdr = struct.Struct(byte_order + "IIIIIIIIII")
+            # type, offset, filesz
+            self.phdr = struct.Struct(byte_order + "II8xI12x")
+            self.phdr_offset = struct.Struct(byte_order + "I")
+            self.phdr_offset_offset = 4
+            self.sym_shndx = struct.Struct(byte_order + "H")
+            self.sym_shndx_offset = 14
+        elif elf_class == 2:
+            self.ehdr = struct.Struct(byte_order + "HHIQQQIHHHHHH")
+            self.shdr = struct.Struct(byte_order + "IIQQQQIIQQ")
+            self.phdr = struct.Struct(byte_order + "I4xQ16xQ16x")
+            self.phdr_offset = struct.Struct(byte_order + "Q")
+            self.phdr_offset_offset = 8
+            self.sym_shndx = struct.Struct(byte_order + "H")
+            self.sym_shndx_offset = 6
+        else:
+            raise ValueError("unknown ELF class {}".format(elf_class))
+        self.word_size = 4 * elf_class
+
+
+def _is_debug(name):
+    return name.startswith((b".debug", b".zdebug"))
+
+
+def strip_debug(library):
+    """Returns the ELF file ``library`` without its debug information, like
+    ``llvm-strip --strip-debug``.
+
+    The loaded contents of the file are left in place, and only the sections
+    that are not loaded are rewritten. :class:`ValueError` is raised if the
+    file is not laid out as expected, e.g. if a debug section is not located
+    after all the loaded contents."""
+    layout = _Layout(library)
+    (e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags,
+     e_ehsize, e_phentsize, e_phnum, e_shentsize, e_shnum,
+     e_shstrndx) = layout.ehdr.unpack_from(library, 16)
+    if e_shnum == 0 or e_shstrndx >= e_shnum or e_shentsize != layout.shdr.size:
+        raise ValueError("unsupported section header table")
+
+    sections = [list(layout.shdr.unpack_from(library, e_shoff + index * e_shentsize))
+                for index in range(e_shnum)]
+    shstrtab_offset = sections[e_shstrndx][4]
+
+    def name_of(section):
+        start = shstrtab_offset + section[0]
+        return library[start:library.index(b"\0", start)]
+
+    removed = set()
+    for index, section in enumerate(sections):
+        if index != 0 and not section[2] & _SHF_ALLOC and _is_debug(name_of(section)):
+            removed.add(index)
+    for index, section in enumerate(sections):
+        # relocations of debug sections
+        if section[1] in (_SHT_REL, _SHT_RELA) and section[7] in removed:
+            removed.add(index)
+    if not removed:
+        return library
+    if any(section[1] in (_SHT_GROUP, _SHT_SYMTAB_SHNDX) for section in sections):
+        raise ValueError("unsupported section type")
+
+    # Loaded contents are kept as they are.
+    end = e_ehsize
+    if e_phnum:
+        end = max(end, e_phoff + e_phnum * e_phentsize)
+    segments = [layout.phdr.unpack_from(library, e_phoff + index * e_phentsize)
+                for index in range(e_phnum)]
+    for p_type, p_offset, p_filesz in segments:
+        if p_type == _PT_LOAD:
+            end = max(end, p_offset + p_filesz)
+    for section in sections:
+        if section[2] & _SHF_ALLOC and section[1] != _SHT_NOBITS:
+            end = max(end, section[4] + section[5])
+
+    new_indices = {}
+    for index in range(e_shnum):
+        if index not in removed:
+            new_indices[index] = len(new_indices)
+
+    def new_index(index):
+        try:
+            return new_indices[index]
+        except KeyError:
+            raise ValueError("reference to a removed section") from None
+
+    output = bytearray(library[:end])
+    new_offsets = {}
+    new_sections = []
+    for index, section in enumerate(sections):
+        if index in removed:
+            continue
+        section = list(section)
+        if index != 0 and not section[2] & _SHF_ALLOC and section[1] != _SHT_NOBITS:
+            if section[4] < end:
+                raise ValueError("section not located after the loaded contents")
+            contents = library[section[4]:section[4] + section[5]]
+            output += bytes(-len(output) % max(section[8], 1))
+            new_offsets[section[4], section[5]] = len(output)
+            section[4] = len(output)
+            output += contents
+        section[6] = new_index(section[6])
+        if section[1] in (_SHT_REL, _SHT_RELA) or section[2] & _SHF_INFO_LINK:
+            section[7] = new_index(section[7])
+        new_sections.append(section)
+
+    # Segments made of sections that are not loaded, e.g. target attributes,
+    # follow their section.
+    for index, (p_type, p_offset, p_filesz) in enumerate(segments):
+        if p_type != _PT_LOAD and p_filesz and p_offset + p_filesz > end:
+            try:
+                new_offset = new_offsets[p_offset, p_filesz]
+            except KeyError:
+                raise ValueError("segment not made of a single section") from None
+            layout.phdr_offset.pack_into(
+                output, e_phoff + index * e_phentsize + layout.phdr_offset_offset, new_offset)
+
+    for section in new_sections:
+        if section[1] in (_SHT_SYMTAB, _SHT_DYNSYM) and section[9]:
+            for offset in range(section[4] + layout.sym_shndx_offset,
+                                section[4] + section[5], section[9]):
+                shndx, = layout.sym_shndx.unpack_from(output, offset)
+                if 0 < shndx < _SHN_LORESERVE:
+                    layout.sym_shndx.pack_into(output, offset, new_index(shndx))
+
+    output += bytes(-len(output) % layout.word_size)
+    e_shoff = len(output)
+    for section in new_sections:
+        output += layout.shdr.pack(*section)
+    layout.ehdr.pack_into(output, 16,
+        e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags,
+        e_ehsize, e_phentsize, e_phnum, e_shentsize, len(new_sections),
+        new_indices[e_shstrndx])
+    return bytes(output)
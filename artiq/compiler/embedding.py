@@ -15,7 +15,7 @@ from pythonparser import lexer as source_lexer, parser as source_parser
 from Levenshtein import ratio as similarity, jaro_winkler
 
 from ..language import core as language_core
-from . import types, builtins, asttyped, math_fns, prelude
+from . import types, builtins, asttyped, math_fns, prelude, profiling
 from .transforms import ASTTypedRewriter, Inferencer, IntMonomorphizer, TypedtreePrinter
 from .transforms.asttyped_rewriter import LocalExtractor
 
@@ -27,6 +27,19 @@ except ImportError:
     _ArrayFunctionDispatcher = None    
 
 
+# Lists of numbers with at least this many elements are quoted as a single
+# constant instead of a list literal.
+_MIN_BLOB_LENGTH = 64
+
+# Element types of the NumPy arrays that are quoted as a single constant,
+# and the corresponding scalar types.
+_BLOB_DTYPES = {
+    numpy.float64: float,
+    numpy.int32: numpy.int32,
+    numpy.int64: numpy.int64,
+}
+
+
 class SpecializedFunction:
     def __init__(self, instance_type, host_function):
         self.instance_type = instance_type
@@ -326,41 +339,70 @@ class ASTSynthesizer:
             self.source_last_new_line = len(self.source) + 2
         return self._add(fragment)
 
+    @staticmethod
+    def _numeric_elt_type(value):
+        """Returns the type of the elements of ``value``, a list or tuple, if
+        they all are numbers of the same type, or ``None``."""
+        if len(value) == 0:
+            return None
+        v = value[0]
+        if isinstance(v, bool):
+            return None
+        elif isinstance(v, int):
+            T = int
+        elif isinstance(v, float):
+            T = float
+        elif isinstance(v, numpy.int32):
+            T = numpy.int32
+        elif isinstance(v, numpy.int64):
+            T = numpy.int64
+        else:
+            return None
+        for v in value:
+            if not isinstance(v, T):
+                return None
+        return T
+
+    @staticmethod
+    def _numeric_type(T):
+        if T == int:
+            return builtins.TInt()
+        elif T == float:
+            return builtins.TFloat()
+        elif T == numpy.int32:
+            return builtins.TInt32()
+        elif T == numpy.int64:
+            return builtins.TInt64()
+        else:
+            assert False
+
+    def quote_blob(self, array, typ):
+        """Construct an AST fragment creating a new list or array of type
+        `typ` with the contents of the NumPy array `array`, which is
+        embedded as a single constant instead of one literal per element."""
+        loc = self._add_iterable("`<{} of {} numbers>`".format(
+            typ.find().name, array.size))
+        return asttyped.BlobT(value=array, type=typ, loc=loc)
+
+    def _quote_list_blob(self, value):
+        T = self._numeric_elt_type(value)
+        if T is None:
+            return None
+        try:
+            # the width of Python integers is chosen by IntMonomorphizer
+            dtype = {int: numpy.int64, float: numpy.float64}.get(T, T)
+            array = numpy.array(value, dtype=dtype)
+        except OverflowError:
+            # leave the diagnostic to the literals
+            return None
+        return self.quote_blob(array, builtins.TList(self._numeric_type(T)))
+
     def fast_quote_list(self, value):
         elts = [None] * len(value)
-        is_T = False
-        if len(value) > 0:
-            v = value[0]
-            is_T = True
-            if isinstance(v, bool):
-                is_T = False
-            elif isinstance(v, int):
-                T = int
-            elif isinstance(v, float):
-                T = float
-            elif isinstance(v, numpy.int32):
-                T = numpy.int32
-            elif isinstance(v, numpy.int64):
-                T = numpy.int64
-            else:
-                is_T = False
-            if is_T:
-                for v in value:
-                    if not isinstance(v, T):
-                        is_T = False
-                        break
-        if is_T:
+        T = self._numeric_elt_type(value)
+        if T is not None:
             is_int = T != float
-            if T == int:
-                typ = builtins.TInt()
-            elif T == float:
-                typ = builtins.TFloat()
-            elif T == numpy.int32:
-                typ = builtins.TInt32()
-            elif T == numpy.int64:
-                typ = builtins.TInt64()
-            else:
-                assert False
+            typ = self._numeric_type(T)
             text = [repr(elt) for elt in value]
             start = len(self.source)
             self.source += ", ".join(text)
@@ -449,6 +491,10 @@ class ASTSynthesizer:
 
             return asttyped.QuoteT(value=value, type=builtins.TByteArray(), loc=loc)
         elif isinstance(value, list):
+            if len(value) >= _MIN_BLOB_LENGTH:
+                blob = self._quote_list_blob(value)
+                if blob is not None:
+                    return blob
             begin_loc = self._add_iterable("[")
             elts = self.fast_quote_list(value)
             end_loc   = self._add_iterable("]")
@@ -464,6 +510,11 @@ class ASTSynthesizer:
                                    begin_loc=begin_loc, end_loc=end_loc,
                                    loc=begin_loc.join(end_loc))
         elif isinstance(value, numpy.ndarray):
+            if value.ndim > 0 and value.dtype.type in _BLOB_DTYPES:
+                typ = builtins.TArray(
+                    self._numeric_type(_BLOB_DTYPES[value.dtype.type]),
+                    value.ndim)
+                return self.quote_blob(numpy.array(value), typ)
             return self.call(numpy.array, [list(value)], {})
         elif inspect.isfunction(value) or inspect.ismethod(value) or \
                 isinstance(value, pytypes.BuiltinFunctionType) or \
@@ -724,6 +775,10 @@ class StitchingInferencer(Inferencer):
         self.value_map = value_map
         self.quote = quote
         self.attr_type_cache = {}
+        # the top-level node being inferred, and the nodes that have used
+        # attributes of host objects, by type of the objects
+        self.root = None
+        self.attribute_users = defaultdict(set)
 
     def _compute_attr_type(self, object_value, object_type, object_loc, attr_name, loc):
         if not hasattr(object_value, attr_name):
@@ -830,6 +885,8 @@ class StitchingInferencer(Inferencer):
         # are now adding at the code generation stage.
         object_type = value_node.type.find()
         values: _ValueInfo = self.value_map[object_type]
+        if self.root is not None:
+            self.attribute_users[object_type].add(id(self.root))
 
         # Take all objects whose attribute we haven't checked yet.
         attribute_objects = values.unchecked_attributes.get(attr_name, values.objects)
@@ -893,8 +950,10 @@ class TypedtreeHasher(algorithm.Visitor):
         return hash(tuple(freeze(getattr(node, field_name)) for field_name in fields))
 
 class Stitcher:
-    def __init__(self, core, dmgr, engine=None, print_as_rpc=True, destination=0, subkernel_arg_types=[], old_embedding_map=None):
+    def __init__(self, core, dmgr, engine=None, print_as_rpc=True, destination=0, subkernel_arg_types=[], old_embedding_map=None,
+                 profiler=profiling.null_profiler):
         self.core = core
+        self.profiler = profiler
         self.dmgr = dmgr
         if engine is None:
             self.engine = diagnostic.Engine(all_errors_are_fatal=True)
@@ -917,7 +976,7 @@ class Stitcher:
 
         self.embedding_map = EmbeddingMap(old_embedding_map)
         self.value_map = defaultdict(_ValueInfo)
-        self.definitely_changed = False
+        self.injected = None
 
         self.destination = destination
         self.first_call = True
@@ -941,24 +1000,49 @@ class Stitcher:
                                          quote=self._quote)
         typedtree_hasher = TypedtreeHasher()
 
-        # Iterate inference to fixed point.
-        old_typedtree_hash = None
-        old_attr_count = None
+        # Iterate inference to fixed point. After a pass over every function, only
+        # the functions whose types changed since they were last inferred, and those
+        # that use attributes of host objects of a type that gained objects since,
+        # are inferred again. Once none are left, a pass over every function confirms
+        # the fixed point.
+        hashes = {}
+        object_counts = {}
+        nodes = list(self.typedtree)
+        full_pass = True
+        iteration = 0
         while True:
-            inferencer.visit(self.typedtree)
-            if self.definitely_changed:
-                changed = True
-                self.definitely_changed = False
-            else:
-                typedtree_hash = typedtree_hasher.visit(self.typedtree)
-                attr_count = self.embedding_map.attribute_count()
-                changed = old_attr_count != attr_count or \
-                          old_typedtree_hash != typedtree_hash
-                old_typedtree_hash = typedtree_hash
-                old_attr_count = attr_count
-
-            if not changed:
+            iteration += 1
+            with self.profiler.stage("inference #{}".format(iteration)):
+                old_attr_count = self.embedding_map.attribute_count()
+                # Functions quoted while inferring are inferred in the same pass.
+                self.injected = nodes
+                for node in nodes:
+                    inferencer.root = node
+                    inferencer.visit(node)
+                inferencer.root = self.injected = None
+
+                changed = set()
+                for node in nodes:
+                    typedtree_hash = typedtree_hasher.visit(node)
+                    if hashes.get(id(node)) != typedtree_hash:
+                        hashes[id(node)] = typedtree_hash
+                        changed.add(id(node))
+
+                # The attributes of new host objects have to be checked.
+                for object_type, users in inferencer.attribute_users.items():
+                    object_count = len(self.value_map[object_type].objects)
+                    if object_counts.get(object_type) != object_count:
+                        object_counts[object_type] = object_count
+                        changed.update(users)
+
+            if changed:
+                nodes = [node for node in self.typedtree if id(node) in changed]
+                full_pass = False
+            elif full_pass and old_attr_count == self.embedding_map.attribute_count():
                 break
+            else:
+                nodes = list(self.typedtree)
+                full_pass = True
 
         # After we've discovered every referenced attribute, check if any kernel_invariant
         # specifications refers to ones we didn't encounter.
@@ -997,6 +1081,8 @@ class Stitcher:
     def _inject(self, node):
         self.typedtree.insert(self.inject_at, node)
         self.inject_at += 1
+        if self.injected is not None:
+            self.injected.append(node)
 
     def _synthesizer(self, expanded_from=None):
         return ASTSynthesizer(expanded_from=expanded_from,
@@ -1097,9 +1183,6 @@ class Stitcher:
         return types.TVar()
 
     def _quote_embedded_function(self, function, flags, remote_fn=False):
-        # we are now parsing new functions... definitely changed the type
-        self.definitely_changed = True
-
         if isinstance(function, SpecializedFunction):
             host_function = function.host_function
         else:
@@ -0,0 +1,135 @@
+"""
+The :class:`KernelCache` class keeps compiled kernel libraries on disk,
+so that a kernel which is recompiled with the same code, types and embedded
+values does not go through LLVM optimization, code generation and linking
+again.
+
+The cache is keyed on the unoptimized LLVM IR emitted for the kernel. This
+IR contains everything the host side contributes to the binary (the stitched
+code, the inferred types, the values of the quoted host attributes and the
+object IDs of the embedding map), and the embedding map is fully populated by
+the time it is generated, so a cached library can be used with the embedding
+map of the current compilation.
+"""
+
+import os
+import struct
+import hashlib
+import tempfile
+import logging
+
+from artiq import __version__ as artiq_version
+
+
+__all__ = ["KernelCache"]
+
+
+logger = logging.getLogger(__name__)
+
+
+class KernelCache:
+    """On-disk cache of linked kernel libraries.
+
+    Entries are stored as individual files in ``path``, which may be shared
+    between processes. When the total size of the entries exceeds
+    ``max_size`` bytes, the least recently used entries are evicted.
+
+    :param path: Directory holding the cache entries. Created if necessary.
+    :param max_size: Maximum total size of the cache, in bytes.
+    """
+    def __init__(self, path, max_size=256*1024*1024):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, target, llvm_ir):
+        """Returns the cache key of a kernel compiled for ``target`` from the
+        unoptimized LLVM IR ``llvm_ir`` (as text)."""
+        h = hashlib.sha256()
+        for part in (artiq_version, type(target).__name__, target.triple,
+                     ",".join(target.features), str(target.subkernel_id)):
+            h.update(part.encode())
+            h.update(b"\0")
+        h.update(llvm_ir.encode())
+        return h.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + ".kernel")
+
+    def get(self, key):
+        """Returns the ``(library, stripped_library)`` pair stored under
+        ``key``, or ``None`` if there is no such entry."""
+        filename = self._filename(key)
+        try:
+            with open(filename, "rb") as f:
+                data = f.read()
+            # Mark as recently used.
+            os.utime(filename)
+        except FileNotFoundError:
+            return None
+        library_length, = struct.unpack_from("<I", data)
+        library = data[4:4 + library_length]
+        stripped_library = data[4 + library_length:]
+        return library, stripped_library
+
+    def put(self, key, library, stripped_library):
+        """Stores a compiled kernel under ``key`` and evicts old entries if
+        the cache has grown too large."""
+        fd, tmpname = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(struct.pack("<I", len(library)))
+                f.write(library)
+                f.write(stripped_library)
+            os.replace(tmpname, self._filename(key))
+        except:
+            os.unlink(tmpname)
+            raise
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        for de in os.scandir(self.path):
+            if not de.name.endswith(".kernel"):
+                continue
+            try:
+                st = de.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, de.path))
+            total_size += st.st_size
+        entries.sort()
+        for _, size, filename in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(filename)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def compile_and_link(self, target, module):
+        """Compiles, links and strips ``module`` for ``target``, using the
+        cached result if available.
+
+        Returns a ``(library, stripped_library)`` pair."""
+        llvm_ir = target.generate_llvm_ir(module)
+        key = self.key(target, llvm_ir)
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            logger.debug("kernel cache hit for %s", key)
+            return entry
+        self.misses += 1
+        logger.debug("kernel cache miss for %s", key)
+        library = target.link([target.assemble(target.compile(module, llvm_ir))])
+        stripped_library = target.strip(library)
+        self.put(key, library, stripped_library)
+        return library, stripped_library
+
+    def get_stats(self):
+        """Returns the hit and miss counters of this instance."""
+        return {"hits": self.hits, "misses": self.misses}
@@ -10,7 +10,7 @@ string and infers types for it using a trivial :module:`prelude`.
 
 import os
 from pythonparser import source, diagnostic, parse_buffer
-from . import prelude, types, transforms, analyses, validators, embedding
+from . import prelude, types, transforms, analyses, validators, embedding, profiling
 
 class Source:
     def __init__(self, source_buffer, engine=None):
@@ -40,7 +40,8 @@ class Source:
             return cls(source.Buffer(f.read(), filename, 1), engine=engine)
 
 class Module:
-    def __init__(self, src, ref_period=1e-6, attribute_writeback=True, remarks=False):
+    def __init__(self, src, ref_period=1e-6, attribute_writeback=True, remarks=False,
+                 profiler=profiling.null_profiler):
         self.attribute_writeback = attribute_writeback
         self.engine = src.engine
         self.embedding_map = src.embedding_map
@@ -67,23 +68,38 @@ class Module:
         interleaver = transforms.Interleaver(engine=self.engine)
         invariant_detection = analyses.InvariantDetection(engine=self.engine)
 
-        int_monomorphizer.visit(src.typedtree)
-        cast_monomorphizer.visit(src.typedtree)
-        inferencer.visit(src.typedtree)
-        monomorphism_validator.visit(src.typedtree)
-        escape_validator.visit(src.typedtree)
-        iodelay_estimator.visit_fixpoint(src.typedtree)
-        constness_validator.visit(src.typedtree)
-        devirtualization.visit(src.typedtree)
-        self.artiq_ir = artiq_ir_generator.visit(src.typedtree)
-        artiq_ir_generator.annotate_calls(devirtualization)
-        dead_code_eliminator.process(self.artiq_ir)
-        interleaver.process(self.artiq_ir)
-        local_access_validator.process(self.artiq_ir)
-        local_demoter.process(self.artiq_ir)
-        constant_hoister.process(self.artiq_ir)
+        with profiler.stage("IntMonomorphizer"):
+            int_monomorphizer.visit(src.typedtree)
+        with profiler.stage("CastMonomorphizer"):
+            cast_monomorphizer.visit(src.typedtree)
+        with profiler.stage("Inferencer"):
+            inferencer.visit(src.typedtree)
+        with profiler.stage("MonomorphismValidator"):
+            monomorphism_validator.visit(src.typedtree)
+        with profiler.stage("EscapeValidator"):
+            escape_validator.visit(src.typedtree)
+        with profiler.stage("IODelayEstimator"):
+            iodelay_estimator.visit_fixpoint(src.typedtree)
+        with profiler.stage("ConstnessValidator"):
+            constness_validator.visit(src.typedtree)
+        with profiler.stage("Devirtualization"):
+            devirtualization.visit(src.typedtree)
+        with profiler.stage("ARTIQIRGenerator"):
+            self.artiq_ir = artiq_ir_generator.visit(src.typedtree)
+            artiq_ir_generator.annotate_calls(devirtualization)
+        with profiler.stage("DeadCodeEliminator"):
+            dead_code_eliminator.process(self.artiq_ir)
+        with profiler.stage("Interleaver"):
+            interleaver.process(self.artiq_ir)
+        with profiler.stage("LocalAccessValidator"):
+            local_access_validator.process(self.artiq_ir)
+        with profiler.stage("LocalDemoter"):
+            local_demoter.process(self.artiq_ir)
+        with profiler.stage("ConstantHoister"):
+            constant_hoister.process(self.artiq_ir)
         if remarks:
-            invariant_detection.process(self.artiq_ir)
+            with profiler.stage("InvariantDetection"):
+                invariant_detection.process(self.artiq_ir)
         # for subkernels: main kernel inferencer output, to be passed to further compilations
         self.subkernel_arg_types = inferencer.subkernel_arg_types
 
@@ -0,0 +1,138 @@
+"""
+The :class:`Profiler` class records the wall time, and optionally the
+memory allocated by Python, of each stage of a kernel compilation, so that
+slow compilations can be attributed to a stage.
+
+Profiling is enabled with the ``profile_compiler`` argument of
+:class:`artiq.coredevice.core.Core`, or with the ``ARTIQ_PROFILE_COMPILER``
+environment variable, set to ``time`` (or any other non-empty value)
+to record wall times only, or to ``memory`` to record memory as well.
+"""
+
+import os
+import time
+import logging
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+
+
+__all__ = ["Stage", "Profiler", "null_profiler", "profiler_from_env"]
+
+
+logger = logging.getLogger(__name__)
+
+
+Stage = namedtuple("Stage", "name depth time allocated peak")
+Stage.__doc__ = """A stage of a compilation.
+
+:param name: Name of the stage.
+:param depth: Number of stages the stage is nested in.
+:param time: Wall time spent in the stage, in seconds.
+:param allocated: Memory allocated by Python during the stage and not freed
+    at its end, in bytes, or ``None`` if memory is not recorded.
+:param peak: Maximum memory allocated by Python during the stage, relative
+    to the start of the stage, in bytes, or ``None``.
+"""
+
+
+class _NullProfiler:
+    def stage(self, name):
+        return nullcontext()
+
+
+#: A profiler that records nothing, used when profiling is disabled.
+null_profiler = _NullProfiler()
+
+
+class Profiler:
+    """Records the stages of a compilation.
+
+    Stages may be nested, and are listed in the order they start.
+    Memory is traced with :mod:`tracemalloc`, which slows down the stages
+    running Python code; allocations made by LLVM are not included.
+
+    :param memory: Whether to record memory as well as wall time.
+    """
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = []
+        self._depth = 0
+        # traced memory peaks of the current stages; the peak counter of
+        # tracemalloc is reset when a stage starts
+        self._peaks = []
+
+    @contextmanager
+    def stage(self, name):
+        """Records the stage ``name`` while the ``with`` block executes."""
+        if self.memory:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            self._update_peak()
+            start_memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            self._peaks.append(start_memory)
+        index = len(self.stages)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._depth -= 1
+            allocated = peak = None
+            if self.memory:
+                self._update_peak()
+                end_memory, _ = tracemalloc.get_traced_memory()
+                peak = self._peaks.pop()
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                if started_tracing:
+                    tracemalloc.stop()
+                allocated = end_memory - start_memory
+                peak -= start_memory
+            # nested stages complete first but are listed after their parent
+            self.stages.insert(index, Stage(name, self._depth, elapsed, allocated, peak))
+
+    def _update_peak(self):
+        if self._peaks:
+            _, peak = tracemalloc.get_traced_memory()
+            self._peaks[-1] = max(self._peaks[-1], peak)
+
+    def format(self):
+        """Returns the recorded stages as a table."""
+        lines = ["{:<40} {:>10}".format("stage", "time")]
+        if self.memory:
+            lines[0] += " {:>12} {:>12}".format("allocated", "peak")
+        for stage in self.stages:
+            line = "{:<40} {:>8.1f}ms".format(
+                "  " * stage.depth + stage.name, stage.time * 1000)
+            if self.memory:
+                line += " {:>10.1f}kB {:>10.1f}kB".format(
+                    stage.allocated / 1000, stage.peak / 1000)
+            lines.append(line)
+        return "\n".join(lines)
+
+    def log(self, title):
+        """Logs the recorded stages, at the ``INFO`` level."""
+        logger.info("%s:\n%s", title, self.format())
+
+    def datasets(self, prefix):
+        """Returns the recorded stages as a dictionary of datasets, with one
+        list per column, named ``prefix`` followed by ``.stage``, ``.depth``,
+        ``.time`` and, if memory is recorded, ``.allocated`` and ``.peak``."""
+        columns = ["stage", "depth", "time"]
+        if self.memory:
+            columns += ["allocated", "peak"]
+        return {"{}.{}".format(prefix, column): [stage[index] for stage in self.stages]
+                for index, column in enumerate(columns)}
+
+
+def profiler_from_env():
+    """Returns a :class:`Profiler` configured by the ``ARTIQ_PROFILE_COMPILER``
+    environment variable, or :data:`null_profiler` if it is not set."""
+    setting = os.getenv("ARTIQ_PROFILE_COMPILER")
+    if not setting:
+        return null_profiler
+    return Profiler(memory=setting == "memory")
@@ -1,5 +1,5 @@
-import os, sys, tempfile, subprocess, io
-from artiq.compiler import types, ir
+import os, sys, gc, tempfile, subprocess, io, threading
+from artiq.compiler import types, ir, elf, profiling
 from llvmlite import ir as ll, binding as llvm
 
 llvm.initialize()
@@ -49,6 +49,49 @@ class RunTool:
         for filename in self._tempnames.values():
             os.unlink(filename)
 
+# Whether tools can read their inputs from pipes, named /dev/fd/N.
+_pipes_supported = os.name == "posix" and os.path.isdir("/dev/fd")
+
+def _run_tool_piped(pattern, **inputs):
+    """Runs a tool like :class:`RunTool`, but passes it the contents of
+    ``inputs`` through pipes instead of temporary files, and returns its
+    standard output as bytes."""
+    pipes = {}
+    try:
+        for key in inputs:
+            pipes[key] = os.pipe()
+        filenames = {key: "/dev/fd/{}".format(read_fd)
+                     for key, (read_fd, write_fd) in pipes.items()}
+        cmdline = [argument.format(**filenames) for argument in pattern]
+        process = subprocess.Popen(cmdline, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   pass_fds=[read_fd for read_fd, write_fd in pipes.values()])
+    except:
+        for read_fd, write_fd in pipes.values():
+            os.close(write_fd)
+        raise
+    finally:
+        for read_fd, write_fd in pipes.values():
+            os.close(read_fd)
+
+    def feed(write_fd, data):
+        try:
+            with open(write_fd, "wb") as f:
+                f.write(data)
+        except BrokenPipeError:
+            # the tool exited early; its error is reported below
+            pass
+    feeders = [threading.Thread(target=feed, args=(write_fd, inputs[key]))
+               for key, (read_fd, write_fd) in pipes.items()]
+    for feeder in feeders:
+        feeder.start()
+    stdout, stderr = process.communicate()
+    for feeder in feeders:
+        feeder.join()
+    if process.returncode != 0:
+        raise Exception("{} invocation failed: {}".
+                        format(cmdline[0], stderr.decode(errors="replace")))
+    return stdout
+
 def _dump(target, kind, suffix, content):
     if target is not None:
         print("====== {} DUMP ======".format(kind.upper()), file=sys.stderr)
@@ -81,6 +124,19 @@ class Target:
         provided by the target, e.g. ``"printf"``.
     :var now_pinning: (boolean)
         Whether the target implements the now-pinning RTIO optimization.
+    :var use_pipes: (boolean)
+        Whether to pass data to the linker and symbolizer through pipes rather
+        than temporary files. Cleared if the tools fail with pipes but not with
+        temporary files.
+    :var strip_in_process: (boolean)
+        Whether to strip debug information from shared libraries in Python
+        rather than with ``llvm-strip``, when their layout allows it.
+    :var release_llvm_ir: (boolean)
+        Whether to free the llvmlite IR of a module as soon as it has been
+        serialized. It is made of reference cycles, and would otherwise be
+        kept alive while LLVM parses, optimizes and emits the module.
+    :var profiler: (:class:`artiq.compiler.profiling.Profiler`)
+        Profiler recording the stages of compilation, linking and stripping.
     """
     triple = "unknown"
     data_layout = ""
@@ -88,6 +144,9 @@ class Target:
     additional_linker_options = []
     print_function = "printf"
     now_pinning = True
+    use_pipes = _pipes_supported
+    strip_in_process = True
+    release_llvm_ir = True
 
     tool_ld = "ld.lld"
     tool_strip = "llvm-strip"
@@ -97,6 +156,7 @@ class Target:
     def __init__(self, subkernel_id=None):
         self.llcontext = ll.Context()
         self.subkernel_id = subkernel_id
+        self.profiler = profiling.null_profiler
 
     def target_machine(self):
         lltarget = llvm.Target.from_triple(self.triple)
@@ -138,8 +198,11 @@ class Target:
 
         llpassmgr.run(llmodule)
 
-    def compile(self, module):
-        """Compile the module to a relocatable object for this target."""
+    def _dump_suffix(self):
+        return "_subkernel_{}".format(self.subkernel_id) if self.subkernel_id is not None else ""
+
+    def generate_llvm_ir(self, module):
+        """Generate the unoptimized LLVM IR of the module, as text."""
 
         if os.getenv("ARTIQ_DUMP_SIG"):
             print("====== MODULE_SIGNATURE DUMP ======", file=sys.stderr)
@@ -149,23 +212,48 @@ class Target:
             ir.BasicBlock._dump_loc = False
 
         type_printer = types.TypePrinter()
-        suffix = "_subkernel_{}".format(self.subkernel_id) if self.subkernel_id is not None else ""
+        suffix = self._dump_suffix()
         _dump(os.getenv("ARTIQ_DUMP_IR"), "ARTIQ IR", suffix + ".txt",
               lambda: "\n".join(fn.as_entity(type_printer) for fn in module.artiq_ir))
 
-        llmod = module.build_llvm_ir(self)
+        with self.profiler.stage("LLVM IR generation"):
+            if not (self.release_llvm_ir and gc.isenabled()):
+                return str(module.build_llvm_ir(self))
+
+            # Keep the llvmlite IR in the youngest generation of the garbage
+            # collector, so that collecting it is proportional to its size rather
+            # than to the size of the whole heap.
+            gc.disable()
+            try:
+                llvm_ir = str(module.build_llvm_ir(self))
+            finally:
+                gc.enable()
+            gc.collect(0)
+            return llvm_ir
+
+    def compile(self, module, llvm_ir=None):
+        """Compile the module to a relocatable object for this target.
+
+        If the LLVM IR of the module has already been generated with
+        :meth:`generate_llvm_ir`, it can be passed as ``llvm_ir``."""
+
+        if llvm_ir is None:
+            llvm_ir = self.generate_llvm_ir(module)
+        suffix = self._dump_suffix()
 
         try:
-            llparsedmod = llvm.parse_assembly(str(llmod))
-            llparsedmod.verify()
+            with self.profiler.stage("LLVM parsing"):
+                llparsedmod = llvm.parse_assembly(llvm_ir)
+                llparsedmod.verify()
         except RuntimeError:
-            _dump("", "LLVM IR (broken)", ".ll", lambda: str(llmod))
+            _dump("", "LLVM IR (broken)", ".ll", lambda: llvm_ir)
             raise
 
         _dump(os.getenv("ARTIQ_DUMP_UNOPT_LLVM"), "LLVM IR (generated)", suffix + "_unopt.ll",
               lambda: str(llparsedmod))
 
-        self.optimize(llparsedmod)
+        with self.profiler.stage("LLVM optimization"):
+            self.optimize(llparsedmod)
 
         _dump(os.getenv("ARTIQ_DUMP_LLVM"), "LLVM IR (optimized)", suffix + ".ll",
               lambda: str(llparsedmod))
@@ -181,34 +269,58 @@ class Target:
         _dump(os.getenv("ARTIQ_DUMP_OBJ"), "Object file", ".o",
               lambda: llmachine.emit_object(llmodule))
 
-        return llmachine.emit_object(llmodule)
+        with self.profiler.stage("emission"):
+            return llmachine.emit_object(llmodule)
+
+    def _try_run_tool_piped(self, pattern, **inputs):
+        """Runs a tool with :func:`_run_tool_piped` if :attr:`use_pipes` is set.
+        Returns ``None`` if it is not, or if the tool fails, which clears
+        :attr:`use_pipes`; the caller then runs the tool with temporary files,
+        and reports its errors."""
+        if not self.use_pipes:
+            return None
+        try:
+            return _run_tool_piped(pattern, **inputs)
+        except Exception:
+            self.use_pipes = False
+            return None
 
     def link(self, objects):
         """Link the relocatable objects into a shared library for this target."""
-        with RunTool([self.tool_ld, "-shared", "--eh-frame-hdr"] +
-                     self.additional_linker_options +
-                     ["-T" + os.path.join(os.path.dirname(__file__), "kernel.ld")] +
-                     ["{{obj{}}}".format(index) for index in range(len(objects))] +
-                     ["-x"] +
-                     ["-o", "{output}"],
-                     output=None,
-                     **{"obj{}".format(index): obj for index, obj in enumerate(objects)}) \
-                as results:
-            library = results["output"].read()
-
-            _dump(os.getenv("ARTIQ_DUMP_ELF"), "Shared library", ".elf",
-                  lambda: library)
-
-            return library
+        pattern = ([self.tool_ld, "-shared", "--eh-frame-hdr"] +
+                   self.additional_linker_options +
+                   ["-T" + os.path.join(os.path.dirname(__file__), "kernel.ld")] +
+                   ["{{obj{}}}".format(index) for index in range(len(objects))] +
+                   ["-x"])
+        objects = {"obj{}".format(index): obj for index, obj in enumerate(objects)}
+
+        with self.profiler.stage("linking"):
+            library = self._try_run_tool_piped(pattern + ["-o", "-"], **objects)
+            if library is None:
+                with RunTool(pattern + ["-o", "{output}"], output=None, **objects) \
+                        as results:
+                    library = results["output"].read()
+
+        _dump(os.getenv("ARTIQ_DUMP_ELF"), "Shared library", ".elf",
+              lambda: library)
+
+        return library
 
     def compile_and_link(self, modules):
         return self.link([self.assemble(self.compile(module)) for module in modules])
 
     def strip(self, library):
-        with RunTool([self.tool_strip, "--strip-debug", "{library}", "-o", "{output}"],
-                     library=library, output=None) \
-                as results:
-            return results["output"].read()
+        with self.profiler.stage("stripping"):
+            if self.strip_in_process:
+                try:
+                    return elf.strip_debug(library)
+                except ValueError:
+                    # unexpected layout, leave it to llvm-strip
+                    pass
+            with RunTool([self.tool_strip, "--strip-debug", "{library}", "-o", "{output}"],
+                         library=library, output=None) \
+                    as results:
+                return results["output"].read()
 
     def symbolize(self, library, addresses):
         if addresses == []:
@@ -220,42 +332,46 @@ class Target:
         # the backtrace entry should point at.
         last_inlined = None
         offset_addresses = [hex(addr - 1) for addr in addresses]
-        with RunTool([self.tool_symbolizer, "--addresses",  "--functions", "--inlines",
-                      "--demangle", "--output-style=GNU", "--exe={library}"] + offset_addresses,
-                     library=library) \
-                as results:
-            lines = iter(results["__stdout__"].read().rstrip().split("\n"))
-            backtrace = []
-            while True:
-                try:
-                    address_or_function = next(lines)
-                except StopIteration:
-                    break
-                if address_or_function[:2] == "0x":
-                    address  = int(address_or_function[2:], 16) + 1 # remove offset
-                    function = next(lines)
-                    inlined = False
-                else:
-                    address  = backtrace[-1][4] # inlined
-                    function = address_or_function
-                    inlined = True
-                location = next(lines)
-
-                filename, line = location.rsplit(":", 1)
-                if filename == "??" or filename == "<synthesized>":
-                    continue
-                if line == "?":
-                    line = -1
-                else:
-                    line = int(line)
-                # can't get column out of addr2line D:
-                if inlined:
-                    last_inlined.append((filename, line, -1, function, address))
-                else:
-                    last_inlined = []
-                    backtrace.append((filename, line, -1, function, address,
-                                      last_inlined))
-            return backtrace
+        pattern = [self.tool_symbolizer, "--addresses",  "--functions", "--inlines",
+                   "--demangle", "--output-style=GNU", "--exe={library}"] + offset_addresses
+        output = self._try_run_tool_piped(pattern, library=library)
+        if output is None:
+            with RunTool(pattern, library=library) as results:
+                output = results["__stdout__"].read()
+        else:
+            output = output.decode()
+        lines = iter(output.rstrip().split("\n"))
+        backtrace = []
+        while True:
+            try:
+                address_or_function = next(lines)
+            except StopIteration:
+                break
+            if address_or_function[:2] == "0x":
+                address  = int(address_or_function[2:], 16) + 1 # remove offset
+                function = next(lines)
+                inlined = False
+            else:
+                address  = backtrace[-1][4] # inlined
+                function = address_or_function
+                inlined = True
+            location = next(lines)
+
+            filename, line = location.rsplit(":", 1)
+            if filename == "??" or filename == "<synthesized>":
+                continue
+            if line == "?":
+                line = -1
+            else:
+                line = int(line)
+            # can't get column out of addr2line D:
+            if inlined:
+                last_inlined.append((filename, line, -1, function, address))
+            else:
+                last_inlined = []
+                backtrace.append((filename, line, -1, function, address,
+                                  last_inlined))
+        return backtrace
 
     def demangle(self, names):
         if not any(names):
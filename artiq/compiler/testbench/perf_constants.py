@@ -0,0 +1,71 @@
+import sys, os, time
+import numpy
+from ...language.core import kernel
+from ...master.databases import DeviceDB
+from ...master.worker_db import DeviceManager
+from ..module import Module
+from ..embedding import Stitcher
+from ..targets import RV32GTarget
+
+
+# Host values referenced by the kernel, replaced for each size
+samples = []
+indices = numpy.zeros(0, dtype=numpy.int32)
+
+
+class Benchmark:
+    def __init__(self, core, size):
+        self.core = core
+        self.table = numpy.linspace(0., 1., size)
+
+    @kernel
+    def run(self):
+        acc = 0.
+        ws = samples
+        ix = indices
+        for i in range(len(ws)):
+            acc += ws[i] * self.table[ix[i]]
+
+
+def make_benchmark(core, size):
+    global samples, indices
+    samples = [0.5 * i for i in range(size)]
+    indices = numpy.arange(size, dtype=numpy.int32)
+    return Benchmark(core, size)
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - start
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+
+    device_db_path = os.path.join(os.path.dirname(__file__), "..", "..",
+                                  "test", "lit", "embedding", "device_db.py")
+    device_mgr = DeviceManager(DeviceDB(device_db_path))
+    core = device_mgr.get("core")
+    target = RV32GTarget()
+
+    print("{:>10} {:>12} {:>12} {:>12} {:>12}".format(
+        "elements", "embedding", "transforms", "LLVM", "emission"))
+    for size in sizes:
+        experiment = make_benchmark(core, size)
+
+        def embed():
+            stitcher = Stitcher(core=core, dmgr=device_mgr)
+            stitcher.stitch_call(experiment.run, (), {})
+            stitcher.finalize()
+            return stitcher
+
+        stitcher, t_embed = timed(embed)
+        module, t_module = timed(lambda: Module(stitcher))
+        llvm_ir, t_llvm = timed(lambda: target.compile(module))
+        _, t_emit = timed(lambda: target.assemble(llvm_ir))
+        print("{:>10} {:>11.3f}s {:>11.3f}s {:>11.3f}s {:>11.3f}s".format(
+            size, t_embed, t_module, t_llvm, t_emit))
+
+if __name__ == "__main__":
+    main()
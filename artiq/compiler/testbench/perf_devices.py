@@ -0,0 +1,123 @@
+import sys, os, time, argparse, importlib, tempfile
+from ...master.databases import DeviceDB
+from ...master.worker_db import DeviceManager
+from ..module import Module
+from ..embedding import Stitcher
+from ..profiling import Profiler
+
+
+def device_source(index, depth):
+    lines = [
+        "class Device{}:".format(index),
+        "    def __init__(self, core, bus):",
+        "        self.core = core",
+        "        self.bus = bus",
+        "        self.addr = {}".format(index),
+        "        self.scale = {}".format(index + 0.5),
+        "",
+        "    @kernel",
+        "    def level{}(self, value):".format(depth),
+        "        self.bus.write(self.addr, int(value * self.scale))",
+    ]
+    for level in reversed(range(depth)):
+        lines += [
+            "",
+            "    @kernel",
+            "    def level{}(self, value):".format(level),
+            "        self.level{}(value + {}.)".format(level + 1, level),
+        ]
+    lines += [
+        "",
+        "    @kernel",
+        "    def pulse(self, value):",
+        "        self.core.break_realtime()",
+        "        self.level0(value)",
+    ]
+    return lines
+
+
+def experiment_source(count, depth):
+    """Returns the source of a module with ``count`` device driver classes,
+    with kernels calling each other ``depth`` levels deep before writing to
+    a shared bus, and an experiment using every device."""
+    lines = [
+        "from artiq.language.core import kernel",
+        "",
+        "class Bus:",
+        "    def __init__(self, core):",
+        "        self.core = core",
+        "        self.writes = 0",
+        "",
+        "    @kernel",
+        "    def write(self, addr, data):",
+        "        self.writes += 1",
+        "",
+    ]
+    for index in range(count):
+        lines += device_source(index, depth) + [""]
+    lines += [
+        "class Experiment:",
+        "    def __init__(self, core, devices):",
+        "        self.core = core",
+    ]
+    lines += ["        self.dev{0} = devices[{0}]".format(index) for index in range(count)]
+    lines += [
+        "",
+        "    @kernel",
+        "    def run(self):",
+    ]
+    lines += ["        self.dev{}.pulse(1.0)".format(index) for index in range(count)]
+    return "\n".join(lines) + "\n"
+
+
+def make_experiment(directory, core, count, depth):
+    module_name = "devices_{}_{}".format(count, depth)
+    with open(os.path.join(directory, module_name + ".py"), "w") as f:
+        f.write(experiment_source(count, depth))
+    module = importlib.import_module(module_name)
+    bus = module.Bus(core)
+    devices = [getattr(module, "Device{}".format(index))(core, bus)
+               for index in range(count)]
+    return module.Experiment(core, devices)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Embedding benchmark on a synthetic experiment using many devices")
+    parser.add_argument("--depth", type=int, default=3,
+                        help="depth of the kernel calls of each device")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="number of runs per size; the fastest one is reported")
+    parser.add_argument("counts", type=int, nargs="*", default=[10, 50, 100, 200],
+                        help="numbers of devices")
+    args = parser.parse_args()
+
+    device_db_path = os.path.join(os.path.dirname(__file__), "..", "..",
+                                  "test", "lit", "embedding", "device_db.py")
+    device_mgr = DeviceManager(DeviceDB(device_db_path))
+    core = device_mgr.get("core")
+
+    print("{:>8} {:>10} {:>8} {:>12} {:>12}".format(
+        "devices", "functions", "passes", "embedding", "transforms"))
+    with tempfile.TemporaryDirectory() as directory:
+        sys.path.insert(0, directory)
+        for count in args.counts:
+            experiment = make_experiment(directory, core, count, args.depth)
+            t_embed = t_module = float("inf")
+            for _ in range(args.runs):
+                profiler = Profiler()
+                start = time.perf_counter()
+                stitcher = Stitcher(core=core, dmgr=device_mgr, profiler=profiler)
+                stitcher.stitch_call(experiment.run, (), {})
+                stitcher.finalize()
+                t_embed = min(t_embed, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                Module(stitcher)
+                t_module = min(t_module, time.perf_counter() - start)
+            print("{:>8} {:>10} {:>8} {:>11.3f}s {:>11.3f}s".format(
+                count, len(stitcher.typedtree.body), len(profiler.stages),
+                t_embed, t_module))
+
+if __name__ == "__main__":
+    main()
@@ -32,12 +32,12 @@ def main():
 
     dataset_db_path = os.path.join(os.path.dirname(sys.argv[1]), "dataset_db.mdb")
     dataset_db = DatasetDB(dataset_db_path)
-    dataset_mgr = DatasetManager()
+    dataset_mgr = DatasetManager(dataset_db)
 
     argument_mgr = ProcessArgumentManager({})
 
     def embed():
-        experiment = testcase_vars["Benchmark"]((device_mgr, dataset_mgr, argument_mgr))
+        experiment = testcase_vars["Benchmark"]((device_mgr, dataset_mgr, argument_mgr, {}))
 
         stitcher = Stitcher(core=experiment.core, dmgr=device_mgr)
         stitcher.stitch_call(experiment.run, (), {})
@@ -69,6 +69,17 @@ def main():
     benchmark(lambda: target.strip(elf_shlib),
               "Stripping debug information")
 
+    # For comparison, with temporary files and external tools only.
+    tool_target = RV32GTarget()
+    tool_target.use_pipes = False
+    tool_target.strip_in_process = False
+
+    benchmark(lambda: tool_target.link([elf_obj]),
+              "Linking (temporary files)")
+
+    benchmark(lambda: tool_target.strip(elf_shlib),
+              "Stripping debug information (llvm-strip)")
+
     dataset_db.close_db()
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+import sys, os, glob, gc, time, tokenize, tracemalloc
+from ...master.databases import DeviceDB
+from ...master.worker_db import DeviceManager
+from ..module import Module
+from ..embedding import Stitcher
+from ..targets import RV32GTarget
+
+
+def load(filename, dmgr):
+    with tokenize.open(filename) as f:
+        testcase_code = compile(f.read(), f.name, "exec")
+        testcase_vars = {'__name__': 'testbench', 'dmgr': dmgr}
+        exec(testcase_code, testcase_vars)
+
+    stitcher = Stitcher(core=dmgr.get("core"), dmgr=dmgr)
+    stitcher.stitch_call(testcase_vars["entrypoint"], (), {})
+    stitcher.finalize()
+    return Module(stitcher)
+
+
+def measure(module, release_llvm_ir):
+    """Returns the time spent generating LLVM IR and in LLVM, the peak
+    Python memory while generating LLVM IR, and the Python memory still in
+    use when LLVM takes over."""
+    target = RV32GTarget()
+    target.release_llvm_ir = release_llvm_ir
+
+    gc.collect()
+    start = time.perf_counter()
+    llvm_ir = target.generate_llvm_ir(module)
+    t_generate = time.perf_counter() - start
+    start = time.perf_counter()
+    target.assemble(target.compile(module, llvm_ir))
+    t_llvm = time.perf_counter() - start
+    del llvm_ir
+
+    gc.collect()
+    tracemalloc.start()
+    llvm_ir = target.generate_llvm_ir(module)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return t_generate, t_llvm, peak, retained
+
+
+def main():
+    lit_dir = os.path.join(os.path.dirname(__file__), "..", "..", "test", "lit", "embedding")
+    filenames = sys.argv[1:] or sorted(
+        filename for filename in glob.glob(os.path.join(lit_dir, "*.py"))
+        if not os.path.basename(filename).startswith(("error_", "warning_", "device_db")))
+
+    print("{:>28} {:>7} {:>10} {:>10} {:>10} {:>10}".format(
+        "", "release", "IR gen", "LLVM", "peak", "retained"))
+    totals = {False: [0, 0, 0, 0], True: [0, 0, 0, 0]}
+    for filename in filenames:
+        dmgr = DeviceManager(DeviceDB(os.path.join(os.path.dirname(filename), "device_db.py")))
+        try:
+            module = load(filename, dmgr)
+        except Exception as error:
+            print("{:>28} skipped: {}".format(os.path.basename(filename), error))
+            continue
+        for release_llvm_ir in (False, True):
+            result = measure(module, release_llvm_ir)
+            for index, value in enumerate(result):
+                totals[release_llvm_ir][index] += value
+            print("{:>28} {:>7} {:>9.1f}ms {:>9.1f}ms {:>8.1f}kB {:>8.1f}kB".format(
+                os.path.basename(filename), str(release_llvm_ir),
+                result[0] * 1000, result[1] * 1000, result[2] / 1000, result[3] / 1000))
+    for release_llvm_ir, total in totals.items():
+        print("{:>28} {:>7} {:>9.1f}ms {:>9.1f}ms {:>8.1f}kB {:>8.1f}kB".format(
+            "total", str(release_llvm_ir),
+            total[0] * 1000, total[1] * 1000, total[2] / 1000, total[3] / 1000))
+
+if __name__ == "__main__":
+    main()
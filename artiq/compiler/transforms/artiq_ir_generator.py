@@ -1436,6 +1436,32 @@ class ARTIQIRGenerator(algorithm.Visitor):
                 finally:
                     self.current_assign = old_assign
 
+    def visit_BlobT(self, node):
+        # The contents are quoted as a constant list, and copied into
+        # a new list or array every time the expression is evaluated.
+        flattened = node.value.reshape((-1,))
+        elt = builtins.get_iterable_elt(node.type)
+        contents = self.append(ir.Quote(flattened, builtins.TList(elt)))
+        length = ir.Constant(len(flattened), self._size_type)
+        if builtins.is_array(node.type):
+            shape = self._make_array_shape(
+                [ir.Constant(n, self._size_type) for n in node.value.shape])
+            result, _ = self._allocate_new_array(elt, shape)
+            buffer = self.append(ir.GetAttr(result, "buffer"))
+        else:
+            result = buffer = self.append(ir.Alloc([length], node.type))
+
+        def body_gen(index):
+            self.append(ir.SetElem(buffer, index,
+                                   self.append(ir.GetElem(contents, index))))
+            return self.append(ir.Arith(ast.Add(loc=None), index,
+                                        ir.Constant(1, self._size_type)))
+        self._make_loop(
+            ir.Constant(0, self._size_type),
+            lambda index: self.append(ir.Compare(ast.Lt(loc=None), index, length)),
+            body_gen, name="blob")
+        return result
+
     def visit_ListCompT(self, node):
         assert len(node.generators) == 1
         comprehension = node.generators[0]
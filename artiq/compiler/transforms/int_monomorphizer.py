@@ -4,6 +4,7 @@ width to 32 bits, assuming they fit into 32 bits, or 64 bits if they
 do not.
 """
 
+import numpy
 from pythonparser import algorithm, diagnostic
 from .. import types, builtins, asttyped
 
@@ -26,3 +27,12 @@ class IntMonomorphizer(algorithm.Visitor):
                     return
 
                 node.type["width"].unify(types.TValue(width))
+
+    def visit_BlobT(self, node):
+        elt = builtins.get_iterable_elt(node.type)
+        if builtins.is_int(elt) and types.is_var(elt["width"]):
+            if -2**31 <= numpy.min(node.value) and numpy.max(node.value) <= 2**31-1:
+                width = 32
+            else:
+                width = 64
+            elt["width"].unify(types.TValue(width))
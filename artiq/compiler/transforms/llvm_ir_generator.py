@@ -1874,23 +1874,50 @@ class LLVMIRGenerator:
 
         return llresult
 
-    def _quote_listish_to_llglobal(self, value, elt_type, path, kind_name):
-        fail_msg = "at " + ".".join(path())
-        if len(value) > 0:
+    def _quote_numbers_to_llglobal(self, value, elt_type, fail_msg, kind_name):
+        # Numbers are emitted as the bytes of their in-memory representation,
+        # which is much cheaper to generate and parse than one constant per element.
+        if isinstance(value, numpy.ndarray):
+            if builtins.is_int(elt_type):
+                assert value.dtype.kind == "i", fail_msg
+            else:
+                assert value.dtype.kind == "f", fail_msg
+        else:
+            int_typ = (int, numpy.int32, numpy.int64)
             if builtins.is_int(elt_type):
-                int_typ = (int, numpy.int32, numpy.int64)
                 for v in value:
                     assert isinstance(v, int_typ), fail_msg
-                llty = self.llty_of_type(elt_type)
-                llelts = [ll.Constant(llty, int(v)) for v in value]
-            elif builtins.is_float(elt_type):
+            else:
                 for v in value:
                     assert isinstance(v, float), fail_msg
-                llty = self.llty_of_type(elt_type)
-                llelts = [ll.Constant(llty, v) for v in value]
-            else:
-                llelts = [self._quote(value[i], elt_type, lambda: path() + [str(i)])
-                          for i in range(len(value))]
+        byteorder = ">" if "E" in self.llmodule.data_layout.split("-") else "<"
+        if builtins.is_int(elt_type):
+            dtype = "{}i{}".format(byteorder, builtins.get_int_width(elt_type) // 8)
+        else:
+            dtype = byteorder + "f8"
+        data = numpy.asarray(value).astype(dtype)
+        if builtins.is_int(elt_type):
+            # the values must fit in the integer type; floats are converted
+            # to float64 exactly
+            assert numpy.array_equal(data, value), fail_msg
+
+        llelty = self.llty_of_type(elt_type)
+        lldataty = ll.ArrayType(lli8, data.nbytes)
+        name = self.llmodule.scope.deduplicate("quoted.{}".format(kind_name))
+        llglobal = ll.GlobalVariable(self.llmodule, lldataty, name)
+        llglobal.initializer = ll.Constant(lldataty, bytearray(data.tobytes()))
+        llglobal.linkage = "private"
+        # at least the alignment of the elements
+        llglobal.align = data.dtype.itemsize
+        return llglobal.bitcast(llelty.as_pointer())
+
+    def _quote_listish_to_llglobal(self, value, elt_type, path, kind_name):
+        fail_msg = "at " + ".".join(path())
+        if len(value) > 0:
+            if builtins.is_int(elt_type) or builtins.is_float(elt_type):
+                return self._quote_numbers_to_llglobal(value, elt_type, fail_msg, kind_name)
+            llelts = [self._quote(value[i], elt_type, lambda: path() + [str(i)])
+                      for i in range(len(value))]
         else:
             llelts = []
         lleltsary = ll.Constant(ll.ArrayType(self.llty_of_type(elt_type), len(llelts)),
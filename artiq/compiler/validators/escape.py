@@ -151,6 +151,7 @@ class RegionOf(algorithm.Visitor):
     def visit_allocating(self, node):
         return self.youngest_region
 
+    visit_BlobT = visit_allocating
     visit_DictT = visit_allocating
     visit_DictCompT = visit_allocating
     visit_GeneratorExpT = visit_allocating
@@ -1,7 +1,7 @@
 from operator import itemgetter
 from collections import namedtuple
 from itertools import count
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 from sipyco import keepalive
 import asyncio
 from enum import Enum
@@ -9,6 +9,10 @@ import struct
 import logging
 import socket
 import math
+import heapq
+import tempfile
+
+import numpy
 
 
 logger = logging.getLogger(__name__)
@@ -51,15 +55,15 @@ class WaveformType(Enum):
 def get_analyzer_dump(host, port=1382):
     sock = socket.create_connection((host, port))
     try:
-        r = bytes()
+        r = bytearray()
         while True:
-            buf = sock.recv(8192)
+            buf = sock.recv(65536)
             if not buf:
                 break
             r += buf
     finally:
         sock.close()
-    return r
+    return bytes(r)
 
 
 OutputMessage = namedtuple(
@@ -99,11 +103,151 @@ def decode_message(data):
         raise ValueError
 
 
+# Layout of a 32-byte analyzer message. Exception messages carry the
+# exception type in the least significant byte of the address field.
+MESSAGE_DTYPE = numpy.dtype([
+    ("data", ">u8"),
+    ("address", ">u4"),
+    ("rtio_counter", ">u8"),
+    ("timestamp", ">u8"),
+    ("type_channel", ">u4"),
+])
+
+_valid_exception_types = numpy.array([e.value for e in ExceptionType])
+
+
+class DecodedMessages:
+    """Columnar representation of decoded analyzer messages.
+
+    Each field is a numpy array with one element per message:
+    ``message_type`` (a :class:`MessageType` value), ``channel``,
+    ``timestamp``, ``rtio_counter``, ``address`` and ``data``, as well as
+    ``time``, the timestamp of output and input messages and the RTIO
+    counter of the other ones. Fields that do not apply to a message type
+    are undefined.
+
+    Indexing with an integer and iterating produce the
+    :class:`OutputMessage`, :class:`InputMessage`, :class:`ExceptionMessage`
+    and :class:`StoppedMessage` tuples.
+    """
+    fields = ("message_type", "channel", "timestamp", "rtio_counter",
+              "address", "data", "time")
+
+    def __init__(self, message_type, channel, timestamp, rtio_counter,
+                 address, data, time):
+        self.message_type = message_type
+        self.channel = channel
+        self.timestamp = timestamp
+        self.rtio_counter = rtio_counter
+        self.address = address
+        self.data = data
+        self.time = time
+
+    @classmethod
+    def from_records(cls, records):
+        """Decodes an array of :data:`MESSAGE_DTYPE` records."""
+        type_channel = records["type_channel"].astype(numpy.uint32)
+        message_type = (type_channel & 0b11).astype(numpy.uint8)
+        channel = type_channel >> 2
+        timestamp = records["timestamp"].astype(numpy.uint64)
+        rtio_counter = records["rtio_counter"].astype(numpy.uint64)
+        address = records["address"].astype(numpy.uint32)
+
+        exception_types = address[message_type == MessageType.exception.value] & 0xff
+        invalid = ~numpy.isin(exception_types, _valid_exception_types)
+        if invalid.any():
+            raise ValueError("invalid exception type {}".format(
+                exception_types[invalid][0]))
+
+        time = numpy.where(message_type <= MessageType.input.value,
+                           timestamp, rtio_counter)
+        return cls(message_type, channel, timestamp, rtio_counter,
+                   address, records["data"].astype(numpy.uint64), time)
+
+    @classmethod
+    def from_messages(cls, messages):
+        """Builds the columnar representation of a sequence of message
+        tuples."""
+        rows = []
+        for message in messages:
+            if isinstance(message, OutputMessage):
+                rows.append((MessageType.output.value, message.channel,
+                             message.timestamp, message.rtio_counter,
+                             message.address, message.data,
+                             message.timestamp))
+            elif isinstance(message, InputMessage):
+                rows.append((MessageType.input.value, message.channel,
+                             message.timestamp, message.rtio_counter,
+                             0, message.data, message.timestamp))
+            elif isinstance(message, ExceptionMessage):
+                rows.append((MessageType.exception.value, message.channel,
+                             0, message.rtio_counter,
+                             message.exception_type.value, 0,
+                             message.rtio_counter))
+            else:
+                rows.append((MessageType.stopped.value, 0,
+                             0, message.rtio_counter,
+                             0, 0, message.rtio_counter))
+        dtypes = (numpy.uint8, numpy.uint32, numpy.uint64, numpy.uint64,
+                  numpy.uint32, numpy.uint64, numpy.uint64)
+        columns = zip(*rows) if rows else [()]*len(dtypes)
+        return cls(*(numpy.array(column, dtype)
+                     for column, dtype in zip(columns, dtypes)))
+
+    @classmethod
+    def concatenate(cls, chunks):
+        chunks = list(chunks)
+        if not chunks:
+            return cls.from_messages([])
+        return cls(*(numpy.concatenate([getattr(chunk, field)
+                                        for chunk in chunks])
+                     for field in cls.fields))
+
+    def take(self, indices):
+        """Returns the messages selected by ``indices``, which may be
+        anything numpy accepts as an index (a slice, an integer array or a
+        boolean mask)."""
+        return DecodedMessages(*(getattr(self, field)[indices]
+                                 for field in self.fields))
+
+    def sorted(self):
+        """Returns the messages in (stable) time order."""
+        return self.take(numpy.argsort(self.time, kind="stable"))
+
+    def __len__(self):
+        return len(self.message_type)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(index)
+        index = range(len(self))[index]
+        return next(iter(self.take(slice(index, index + 1))))
+
+    def __iter__(self):
+        # Bulk conversion to Python integers is much faster than
+        # converting each numpy scalar separately.
+        columns = zip(self.message_type.tolist(), self.channel.tolist(),
+                      self.timestamp.tolist(), self.rtio_counter.tolist(),
+                      self.address.tolist(), self.data.tolist())
+        for message_type, channel, timestamp, rtio_counter, address, data \
+                in columns:
+            if message_type == 0b00:
+                yield OutputMessage(channel, timestamp, rtio_counter,
+                                    address, data)
+            elif message_type == 0b01:
+                yield InputMessage(channel, timestamp, rtio_counter, data)
+            elif message_type == 0b10:
+                yield ExceptionMessage(channel, rtio_counter,
+                                       ExceptionType(address & 0xff))
+            else:
+                yield StoppedMessage(rtio_counter)
+
+
 DecodedDump = namedtuple(
     "DecodedDump", "log_channel dds_onehot_sel messages")
 
 
-def decode_dump(data):
+def _decode_dump_header(data):
     # extract endian byte
     if data[0] == ord('E'):
         endian = '>'
@@ -111,20 +255,19 @@ def decode_dump(data):
         endian = '<'
     else:
         raise ValueError
-    data = data[1:]
     # only header is device endian
     # messages are big endian
-    parts = struct.unpack(endian + "IQbbb", data[:15])
+    parts = struct.unpack_from(endian + "IQbbb", data, 1)
     (sent_bytes, total_byte_count,
      error_occurred, log_channel, dds_onehot_sel) = parts
 
     logger.debug("analyzer dump has length %d", sent_bytes)
 
     expected_len = sent_bytes + 15
-    if expected_len != len(data):
+    if expected_len != len(data) - 1:
         raise ValueError("analyzer dump has incorrect length "
                          "(got {}, expected {})".format(
-                            len(data), expected_len))
+                            len(data) - 1, expected_len))
     if error_occurred:
         logger.warning("error occurred within the analyzer, "
                        "data may be corrupted")
@@ -134,16 +277,20 @@ def decode_dump(data):
     if sent_bytes == 0:
         logger.warning("analyzer dump is empty")
 
-    position = 15
-    messages = []
-    for _ in range(sent_bytes//32):
-        messages.append(decode_message(data[position:position+32]))
-        position += 32
+    records = numpy.frombuffer(data, MESSAGE_DTYPE,
+                               count=sent_bytes//32, offset=16)
+    return log_channel, bool(dds_onehot_sel), records
 
-    if len(messages) == 1 and isinstance(messages[0], StoppedMessage):
+
+def decode_dump(data):
+    log_channel, dds_onehot_sel, records = _decode_dump_header(data)
+    messages = DecodedMessages.from_records(records)
+
+    if (len(messages) == 1
+            and messages.message_type[0] == MessageType.stopped.value):
         logger.warning("analyzer dump is empty aside from stop message")
 
-    return DecodedDump(log_channel, bool(dds_onehot_sel), messages)
+    return DecodedDump(log_channel, dds_onehot_sel, messages)
 
 
 # simplified from sipyco broadcast Receiver
@@ -616,6 +763,10 @@ class LogHandler:
 
 
 def get_log_channels(log_channel, messages):
+    if isinstance(messages, DecodedMessages):
+        messages = messages.take(
+            (messages.message_type == MessageType.output.value)
+            & (messages.channel == log_channel))
     log_channels = dict()
     log_entry = ""
     for message in messages:
@@ -715,7 +866,119 @@ def decoded_dump_to_waveform_data(devices, dump, uniform_interval=False):
     return manager.trace
 
 
+def dump_to_vcd(fileobj, devices, data, uniform_interval=False):
+    vcd_manager = VCDManager(fileobj)
+    dump_to_target(vcd_manager, devices, data, uniform_interval)
+
+
+def dump_to_waveform_data(devices, data, uniform_interval=False):
+    manager = WaveformManager()
+    dump_to_target(manager, devices, data, uniform_interval)
+    return manager.trace
+
+
+def _get_start_time(times):
+    nonzero_times = times[times != 0]
+    return int(nonzero_times.min()) if len(nonzero_times) else None
+
+
+def _get_handled_channels(devices, log_channel):
+    channel_handlers = create_channel_handlers(
+        ChannelSignatureManager(), devices, DEFAULT_REF_PERIOD, 3e9, False)
+    return list(channel_handlers.keys()) + [log_channel]
+
+
 def decoded_dump_to_target(manager, devices, dump, uniform_interval):
+    messages = dump.messages
+    if not isinstance(messages, DecodedMessages):
+        messages = DecodedMessages.from_messages(messages)
+    messages = messages.sorted()
+
+    start_time = _get_start_time(messages.time) or 0
+    log_channels = get_log_channels(dump.log_channel, messages)
+    # Messages that are not handled are skipped without being converted to
+    # tuples, but keep their index for uniform_interval.
+    handled = numpy.flatnonzero(
+        (messages.message_type == MessageType.stopped.value)
+        | numpy.isin(messages.channel,
+                     _get_handled_channels(devices, dump.log_channel)))
+    _messages_to_target(manager, devices,
+                        dump.log_channel, dump.dds_onehot_sel, log_channels,
+                        start_time,
+                        zip(handled.tolist(), messages.take(handled)),
+                        uniform_interval)
+
+
+def _merge_sorted_runs(runs, block_size):
+    def iter_run(run):
+        for start in range(0, len(run), block_size):
+            yield from DecodedMessages.from_records(run[start:start+block_size])
+    # heapq.merge is stable, so messages with equal times from earlier runs,
+    # i.e. earlier in the dump, come first as with a global stable sort.
+    return heapq.merge(*(iter_run(run) for run in runs),
+                       key=get_message_time)
+
+
+def dump_to_target(manager, devices, data, uniform_interval,
+                   chunk_size=1 << 20, tmpdir=None):
+    """Converts the raw analyzer dump ``data`` (any buffer, e.g. a
+    memory-mapped file) for ``manager``, with bounded memory use.
+
+    The messages are decoded and sorted by chunks of ``chunk_size``
+    messages. If there are several chunks, the sorted chunks are written to
+    temporary files in ``tmpdir`` and merged when the messages are handled.
+    The output is the same as with :func:`decoded_dump_to_target`.
+    """
+    log_channel, dds_onehot_sel, records = _decode_dump_header(data)
+    if uniform_interval:
+        handled_channels = None
+    else:
+        handled_channels = _get_handled_channels(devices, log_channel)
+
+    with ExitStack() as stack:
+        start_times = []
+        log_messages = []
+        runs = []
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start+chunk_size]
+            messages = DecodedMessages.from_records(chunk)
+            start_time = _get_start_time(messages.time)
+            if start_time is not None:
+                start_times.append(start_time)
+            log_messages.append(messages.take(
+                (messages.message_type == MessageType.output.value)
+                & (messages.channel == log_channel)))
+
+            order = numpy.argsort(messages.time, kind="stable")
+            if handled_channels is not None:
+                handled = ((messages.message_type == MessageType.stopped.value)
+                           | numpy.isin(messages.channel, handled_channels))
+                order = order[handled[order]]
+            run = chunk[order]
+            if len(run) and len(records) > chunk_size:
+                f = stack.enter_context(tempfile.TemporaryFile(dir=tmpdir))
+                run.tofile(f)
+                f.flush()
+                run = numpy.memmap(f, MESSAGE_DTYPE, mode="r", shape=len(run))
+            runs.append(run)
+
+        start_time = min(start_times, default=0)
+        log_channels = get_log_channels(
+            log_channel, DecodedMessages.concatenate(log_messages).sorted())
+        messages = _merge_sorted_runs(runs, min(chunk_size, 1 << 16))
+        if uniform_interval:
+            messages = enumerate(messages)
+        else:
+            # indices are only used with uniform_interval
+            messages = ((None, message) for message in messages)
+        _messages_to_target(manager, devices,
+                            log_channel, dds_onehot_sel, log_channels,
+                            start_time, messages, uniform_interval)
+
+
+def _messages_to_target(manager, devices,
+                        log_channel, dds_onehot_sel, log_channels,
+                        start_time, messages, uniform_interval):
     ref_period = get_ref_period(devices)
 
     if ref_period is None:
@@ -728,13 +991,10 @@ def decoded_dump_to_target(manager, devices, dump, uniform_interval):
         logger.warning("unable to determine DDS sysclk")
         dds_sysclk = 3e9  # guess
 
-    messages = sorted(dump.messages, key=get_message_time)
-
     channel_handlers = create_channel_handlers(
         manager, devices, ref_period,
-        dds_sysclk, dump.dds_onehot_sel)
-    log_channels = get_log_channels(dump.log_channel, messages)
-    channel_handlers[dump.log_channel] = LogHandler(
+        dds_sysclk, dds_onehot_sel)
+    channel_handlers[log_channel] = LogHandler(
         manager, log_channels)
     if uniform_interval:
         # RTIO event timestamp in machine units
@@ -744,20 +1004,15 @@ def decoded_dump_to_target(manager, devices, dump, uniform_interval):
         interval = manager.get_channel("interval", 64, ty=WaveformType.ANALOG)
     slack = manager.get_channel("rtio_slack", 64, ty=WaveformType.ANALOG)
 
-    stopped_messages = []
+    stopped_message = None
 
     manager.set_time(0)
-    start_time = 0
-    for m in messages:
-        start_time = get_message_time(m)
-        if start_time:
-            break
     if not uniform_interval:
         manager.set_start_time(start_time)
     t0 = start_time
-    for i, message in enumerate(messages):
+    for i, message in messages:
         if isinstance(message, StoppedMessage):
-            stopped_messages.append(message)
+            stopped_message = message
             logger.debug(f"StoppedMessage at {get_message_time(message)}")
         elif message.channel in channel_handlers:
             t = get_message_time(message)
@@ -774,8 +1029,8 @@ def decoded_dump_to_target(manager, devices, dump, uniform_interval):
                 slack.set_value_double(
                     (message.timestamp - message.rtio_counter)*ref_period)
 
-    if not stopped_messages:
+    if stopped_message is None:
         logger.warning("StoppedMessage missing")
     else:
-        end_time = get_message_time(stopped_messages[-1])
+        end_time = get_message_time(stopped_message)
         manager.set_end_time(end_time)
@@ -4,6 +4,9 @@ import traceback
 import numpy
 import socket
 import builtins
+import queue
+import threading
+import time
 from enum import Enum
 from fractions import Fraction
 from collections import namedtuple
@@ -67,17 +70,13 @@ def _receive_list(kernel, embedding_map):
     length = kernel._read_int32()
     tag = chr(kernel._read_int8())
     if tag == "b":
-        buffer = kernel._read(length)
-        return list(struct.unpack(kernel.endian + "%s?" % length, buffer))
+        return kernel._read_ndarray(length, '?').tolist()
     elif tag == "i":
-        buffer = kernel._read(4 * length)
-        return list(struct.unpack(kernel.endian + "%sl" % length, buffer))
+        return kernel._read_ndarray(length, kernel.endian + 'i4').tolist()
     elif tag == "I":
-        buffer = kernel._read(8 * length)
-        return list(numpy.ndarray((length, ), kernel.endian + 'i8', buffer))
+        return list(kernel._read_ndarray(length, kernel.endian + 'i8'))
     elif tag == "f":
-        buffer = kernel._read(8 * length)
-        return list(struct.unpack(kernel.endian + "%sd" % length, buffer))
+        return kernel._read_ndarray(length, kernel.endian + 'd').tolist()
     else:
         fn = receivers[tag]
         elems = []
@@ -95,19 +94,15 @@ def _receive_array(kernel, embedding_map):
     shape = tuple(kernel._read_int32() for _ in range(num_dims))
     tag = chr(kernel._read_int8())
     fn = receivers[tag]
-    length = numpy.prod(shape)
+    length = int(numpy.prod(shape))
     if tag == "b":
-        buffer = kernel._read(length)
-        elems = numpy.ndarray((length, ), '?', buffer)
+        elems = kernel._read_ndarray(length, '?')
     elif tag == "i":
-        buffer = kernel._read(4 * length)
-        elems = numpy.ndarray((length, ), kernel.endian + 'i4', buffer)
+        elems = kernel._read_ndarray(length, kernel.endian + 'i4')
     elif tag == "I":
-        buffer = kernel._read(8 * length)
-        elems = numpy.ndarray((length, ), kernel.endian + 'i8', buffer)
+        elems = kernel._read_ndarray(length, kernel.endian + 'i8')
     elif tag == "f":
-        buffer = kernel._read(8 * length)
-        elems = numpy.ndarray((length, ), kernel.endian + 'd', buffer)
+        elems = kernel._read_ndarray(length, kernel.endian + 'd')
     else:
         fn = receivers[tag]
         elems = []
@@ -172,6 +167,111 @@ class CommKernelDummy:
     def check_system_info(self):
         pass
 
+    def set_async_rpc_stats_hook(self, stats_hook):
+        pass
+
+    def get_async_rpc_stats(self):
+        return None
+
+
+class AsyncRPCDispatcher:
+    """Executes asynchronous RPCs on background threads, so that slow
+    handlers do not stall the reception of data from the core device.
+
+    A given service is always executed by the same thread, in the order the
+    RPCs were received. The dispatcher is flushed before a synchronous RPC
+    is executed and when the kernel terminates, so that the kernel and the
+    host observe the side effects of asynchronous RPCs in the same order as
+    with inline execution. An exception raised by an asynchronous RPC is
+    re-raised at the next flush, and the RPCs queued after it are dropped.
+
+    :param threads: Number of threads. Different services only run
+        concurrently with each other if this is larger than 1, in which case
+        their handlers must be thread-safe with respect to each other.
+    :param queue_size: Maximum number of pending RPCs per thread. When it is
+        reached, reception from the core device blocks until the oldest RPC
+        has been executed.
+    :param stats_hook: Optional callable, invoked from the dispatcher thread
+        as ``stats_hook(service, latency, queue_depth)`` after each RPC,
+        where ``latency`` includes the time spent in the queue.
+    """
+    def __init__(self, threads=1, queue_size=1024, stats_hook=None):
+        self.queues = [queue.Queue(queue_size) for _ in range(threads)]
+        self.stats_hook = stats_hook
+        self._threads = []
+        self._error = None
+        self._stats_lock = threading.Lock()
+        self._stats = dict()  # service name -> [count, total latency, max latency]
+
+    def submit(self, service_id, service, args, kwargs):
+        if not self._threads:
+            for q in self.queues:
+                thread = threading.Thread(target=self._run, args=(q, ),
+                                          name="async_rpc", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        q = self.queues[service_id % len(self.queues)]
+        q.put((service, args, kwargs, time.monotonic()))
+
+    def _run(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is None:
+                    return
+                service, args, kwargs, t_submit = item
+                if self._error is not None:
+                    continue
+                try:
+                    service(*args, **kwargs)
+                except BaseException as exn:
+                    # Also forward SystemExit raised by terminated workers.
+                    self._error = exn
+                    continue
+                latency = time.monotonic() - t_submit
+                name = getattr(service, "__qualname__", repr(service))
+                with self._stats_lock:
+                    stats = self._stats.setdefault(name, [0, 0.0, 0.0])
+                    stats[0] += 1
+                    stats[1] += latency
+                    stats[2] = max(stats[2], latency)
+                if self.stats_hook is not None:
+                    self.stats_hook(service, latency, q.qsize())
+            finally:
+                q.task_done()
+
+    def flush(self):
+        """Wait until all pending RPCs have been executed, and re-raise the
+        exception of a failed RPC, if any."""
+        for q in self.queues:
+            q.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def get_stats(self):
+        """Return the number of pending RPCs and, for each service, the
+        number of calls and the mean and maximum latency in seconds."""
+        with self._stats_lock:
+            services = {
+                name: {"count": count,
+                       "mean_latency": total/count,
+                       "max_latency": max_latency}
+                for name, (count, total, max_latency) in self._stats.items()
+            }
+        return {
+            "queue_depth": sum(q.qsize() for q in self.queues),
+            "services": services
+        }
+
+    def close(self):
+        for q in self.queues:
+            if self._threads:
+                q.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
 
 def incompatible_versions(v1, v2):
     if v1.endswith(".beta") or v2.endswith(".beta"):
@@ -186,11 +286,24 @@ def incompatible_versions(v1, v2):
 class CommKernel:
     warned_of_mismatch = False
 
-    def __init__(self, host, port=1381):
+    # Initial size of the receive buffer. Reads larger than the buffer are
+    # received directly into their destination.
+    read_buffer_size = 65536
+
+    def __init__(self, host, port=1381, async_rpc_threads=0,
+                 async_rpc_queue_size=1024, async_rpc_stats_hook=None):
         self._read_type = None
         self.host = host
         self.port = port
-        self.read_buffer = bytearray()
+        if async_rpc_threads:
+            self.async_rpc_dispatcher = AsyncRPCDispatcher(
+                async_rpc_threads, async_rpc_queue_size, async_rpc_stats_hook)
+        else:
+            self.async_rpc_dispatcher = None
+        # Received data is kept in read_buffer[read_start:read_end]
+        self.read_buffer = bytearray(self.read_buffer_size)
+        self.read_start = 0
+        self.read_end = 0
         self.write_buffer = bytearray()
 
 
@@ -199,6 +312,9 @@ class CommKernel:
             return
         self.socket = create_connection(self.host, self.port)
         self.socket.sendall(b"ARTIQ coredev\n")
+        self._read_endian()
+
+    def _read_endian(self):
         endian = self._read(1)
         if endian == b"e":
             self.endian = "<"
@@ -206,9 +322,9 @@ class CommKernel:
             self.endian = ">"
         else:
             raise IOError("Incorrect reply from device: expected e/E.")
-        self.unpack_int32 = struct.Struct(self.endian + "l").unpack
-        self.unpack_int64 = struct.Struct(self.endian + "q").unpack
-        self.unpack_float64 = struct.Struct(self.endian + "d").unpack
+        self.unpack_int32 = struct.Struct(self.endian + "l").unpack_from
+        self.unpack_int64 = struct.Struct(self.endian + "q").unpack_from
+        self.unpack_float64 = struct.Struct(self.endian + "d").unpack_from
 
         self.pack_header = struct.Struct(self.endian + "lB").pack
         self.pack_int8 = struct.Struct(self.endian + "B").pack
@@ -216,7 +332,18 @@ class CommKernel:
         self.pack_int64 = struct.Struct(self.endian + "q").pack
         self.pack_float64 = struct.Struct(self.endian + "d").pack
 
+    def set_async_rpc_stats_hook(self, stats_hook):
+        if self.async_rpc_dispatcher is not None:
+            self.async_rpc_dispatcher.stats_hook = stats_hook
+
+    def get_async_rpc_stats(self):
+        if self.async_rpc_dispatcher is None:
+            return None
+        return self.async_rpc_dispatcher.get_stats()
+
     def close(self):
+        if self.async_rpc_dispatcher is not None:
+            self.async_rpc_dispatcher.close()
         if not hasattr(self, "socket"):
             return
         self.socket.close()
@@ -227,21 +354,62 @@ class CommKernel:
     # Reader interface
     #
 
+    def _fill(self, length):
+        """Ensure that at least ``length`` (at most the buffer size) bytes
+        are available in the read buffer."""
+        available = self.read_end - self.read_start
+        if available >= length:
+            return
+        if self.read_start + length > len(self.read_buffer):
+            # Move the unread bytes to the beginning of the buffer.
+            self.read_buffer[:available] = \
+                self.read_buffer[self.read_start:self.read_end]
+            self.read_start = 0
+            self.read_end = available
+        with memoryview(self.read_buffer) as view:
+            while self.read_end - self.read_start < length:
+                # recv_into returns early when there is not much data
+                received = self.socket.recv_into(view[self.read_end:])
+                if not received:
+                    raise ConnectionResetError("Core device connection closed unexpectedly")
+                self.read_end += received
+
+    def _read_into(self, buffer):
+        """Fill the writable bytes-like object ``buffer`` with received data.
+
+        Data that is not in the read buffer yet is received directly into
+        ``buffer``, without intermediate copies."""
+        with memoryview(buffer) as raw, raw.cast("B") as view:
+            length = len(view)
+            available = min(self.read_end - self.read_start, length)
+            view[:available] = \
+                self.read_buffer[self.read_start:self.read_start + available]
+            self.read_start += available
+            while available < length:
+                flag = 0
+                if length - available > len(self.read_buffer):
+                    flag |= socket.MSG_WAITALL
+                received = self.socket.recv_into(view[available:], 0, flag)
+                if not received:
+                    raise ConnectionResetError("Core device connection closed unexpectedly")
+                available += received
+
     def _read(self, length):
-        # cache the reads to avoid frequent call to recv
-        while len(self.read_buffer) < length:
-            # the number is just the maximum amount
-            # when there is not much data, it would return earlier
-            diff = length - len(self.read_buffer)
-            flag = 0
-            if diff > 8192:
-                flag |= socket.MSG_WAITALL
-            new_buffer = self.socket.recv(8192, flag)
-            if not new_buffer:
-                raise ConnectionResetError("Core device connection closed unexpectedly")
-            self.read_buffer += new_buffer
-        result = self.read_buffer[:length]
-        self.read_buffer = self.read_buffer[length:]
+        if length > len(self.read_buffer):
+            result = bytearray(length)
+            self._read_into(result)
+            return result
+        self._fill(length)
+        result = self.read_buffer[self.read_start:self.read_start + length]
+        self.read_start += length
+        return result
+
+    def _read_ndarray(self, length, dtype):
+        """Read a one-dimensional array of ``length`` elements of the
+        NumPy type ``dtype``."""
+        result = numpy.empty(length, dtype)
+        if length:
+            self._read_into(result)
         return result
 
     def _read_header(self):
@@ -250,14 +418,14 @@ class CommKernel:
         # Wait for a synchronization sequence, 5a 5a 5a 5a.
         sync_count = 0
         while sync_count < 4:
-            sync_byte = self._read(1)[0]
+            sync_byte = self._read_int8()
             if sync_byte == 0x5a:
                 sync_count += 1
             else:
                 sync_count = 0
 
         # Read message header.
-        raw_type = self._read(1)[0]
+        raw_type = self._read_int8()
         self._read_type = Reply(raw_type)
 
         logger.debug("receiving message: type=%r",
@@ -273,18 +441,27 @@ class CommKernel:
         self._read_expect(ty)
 
     def _read_int8(self):
-        return self._read(1)[0]
+        self._fill(1)
+        value = self.read_buffer[self.read_start]
+        self.read_start += 1
+        return value
 
     def _read_int32(self):
-        (value, ) = self.unpack_int32(self._read(4))
+        self._fill(4)
+        (value, ) = self.unpack_int32(self.read_buffer, self.read_start)
+        self.read_start += 4
         return value
 
     def _read_int64(self):
-        (value, ) = self.unpack_int64(self._read(8))
+        self._fill(8)
+        (value, ) = self.unpack_int64(self.read_buffer, self.read_start)
+        self.read_start += 8
         return value
 
     def _read_float64(self):
-        (value, ) = self.unpack_float64(self._read(8))
+        self._fill(8)
+        (value, ) = self.unpack_float64(self.read_buffer, self.read_start)
+        self.read_start += 8
         return value
 
     def _read_bool(self):
@@ -587,9 +764,16 @@ class CommKernel:
                      (" (async)" if is_async else ""), args, kwargs, return_tags)
 
         if is_async:
-            service(*args, **kwargs)
+            if self.async_rpc_dispatcher is not None:
+                self.async_rpc_dispatcher.submit(service_id, service,
+                                                 args, kwargs)
+            else:
+                service(*args, **kwargs)
             return
 
+        if self.async_rpc_dispatcher is not None:
+            self.async_rpc_dispatcher.flush()
+
         try:
             result = service(*args, **kwargs)
         except RPCReturnValueError as exn:
@@ -731,15 +915,27 @@ class CommKernel:
                            f"reported during kernel execution")
 
     def serve(self, embedding_map, symbolizer, demangler):
-        while True:
-            self._read_header()
-            if self._read_type == Reply.RPCRequest:
-                self._serve_rpc(embedding_map)
-            elif self._read_type == Reply.KernelException:
-                self._serve_exception(embedding_map, symbolizer, demangler)
-            elif self._read_type == Reply.ClockFailure:
-                raise exceptions.ClockFailure
-            else:
-                self._read_expect(Reply.KernelFinished)
-                self._process_async_error()
-                return
+        try:
+            while True:
+                self._read_header()
+                if self._read_type == Reply.RPCRequest:
+                    self._serve_rpc(embedding_map)
+                elif self._read_type == Reply.KernelException:
+                    self._serve_exception(embedding_map, symbolizer, demangler)
+                elif self._read_type == Reply.ClockFailure:
+                    raise exceptions.ClockFailure
+                else:
+                    self._read_expect(Reply.KernelFinished)
+                    self._process_async_error()
+                    break
+        except:
+            # Do not let the error of an asynchronous RPC mask the exception
+            # of the kernel.
+            if self.async_rpc_dispatcher is not None:
+                try:
+                    self.async_rpc_dispatcher.flush()
+                except:
+                    logger.error("Asynchronous RPC failed", exc_info=True)
+            raise
+        if self.async_rpc_dispatcher is not None:
+            self.async_rpc_dispatcher.flush()
@@ -13,6 +13,8 @@ from artiq.language.units import *
 
 from artiq.compiler.module import Module
 from artiq.compiler.embedding import Stitcher
+from artiq.compiler.kernel_cache import KernelCache
+from artiq.compiler import profiling
 from artiq.compiler.targets import RV32IMATarget, RV32GTarget, CortexA9Target
 
 from artiq.coredevice.comm_kernel import CommKernel, CommKernelDummy
@@ -87,6 +89,32 @@ class Core:
         proxy after the Experiment's run stage finishes.
     :param report_invariants: report variables which are not changed inside
         kernels and are thus candidates for inclusion in kernel_invariants
+    :param kernel_cache: directory of an on-disk cache of compiled kernels
+        (optional). Kernels that are recompiled with identical code, argument
+        types and embedded values are then loaded from the cache instead of
+        going through LLVM optimization and linking again. The directory may
+        be shared between workers.
+    :param kernel_cache_size: maximum size of the kernel cache in bytes.
+        The least recently used kernels are evicted first.
+    :param async_rpc_threads: number of background threads executing
+        asynchronous RPCs (optional). By default, asynchronous RPCs are
+        executed inline, which stalls the reception of further RPCs from
+        the core device until they return. Each service is always executed
+        by the same thread; with more than one thread, different services
+        may run concurrently and must be thread-safe.
+    :param async_rpc_queue_size: maximum number of asynchronous RPCs queued
+        per thread before the reception of further RPCs blocks.
+        The statistics of the dispatcher are returned by
+        :meth:`get_async_rpc_stats`, and :meth:`set_async_rpc_stats_hook`
+        installs a callback invoked after each asynchronous RPC.
+    :param profile_compiler: record the wall time of each stage of kernel
+        compilation (``True``), or its wall time and the memory allocated by
+        Python (``"memory"``), and log it at the ``INFO`` level. By default,
+        this is set by the ``ARTIQ_PROFILE_COMPILER`` environment variable.
+        The profile of the last compiled kernel is kept in the
+        ``compile_profile`` attribute, and can be saved as datasets with e.g.
+        ``for key, value in self.core.compile_profile.datasets("compile_profile").items():
+        self.set_dataset(key, value)``.
     """
 
     kernel_invariants = {
@@ -98,7 +126,10 @@ class Core:
                  analyzer_proxy=None, analyze_at_run_end=False,
                  ref_multiplier=8,
                  target="rv32g", satellite_cpu_targets={},
-                 report_invariants=False):
+                 report_invariants=False,
+                 kernel_cache=None, kernel_cache_size=256*1024*1024,
+                 async_rpc_threads=0, async_rpc_queue_size=1024,
+                 profile_compiler=None):
         self.ref_period = ref_period
         self.ref_multiplier = ref_multiplier
         self.satellite_cpu_targets = satellite_cpu_targets
@@ -107,10 +138,17 @@ class Core:
         if host is None:
             self.comm = CommKernelDummy()
         else:
-            self.comm = CommKernel(host)
+            self.comm = CommKernel(host, async_rpc_threads=async_rpc_threads,
+                                   async_rpc_queue_size=async_rpc_queue_size)
         self.analyzer_proxy_name = analyzer_proxy
         self.analyze_at_run_end = analyze_at_run_end
         self.report_invariants = report_invariants
+        if kernel_cache is None:
+            self.kernel_cache = None
+        else:
+            self.kernel_cache = KernelCache(kernel_cache, kernel_cache_size)
+        self.profile_compiler = profile_compiler
+        self.compile_profile = None
 
         self.first_run = True
         self.dmgr = dmgr
@@ -127,28 +165,64 @@ class Core:
         """
         self.comm.close()
 
+    def set_async_rpc_stats_hook(self, stats_hook):
+        """Set a callable invoked from the dispatcher thread as
+        ``stats_hook(service, latency, queue_depth)`` after each asynchronous
+        RPC, where ``latency`` includes the time spent in the queue.
+        Pass ``None`` to remove it.
+
+        Has no effect unless ``async_rpc_threads`` is set."""
+        self.comm.set_async_rpc_stats_hook(stats_hook)
+
+    def get_async_rpc_stats(self):
+        """Return the number of pending asynchronous RPCs and, for each
+        service, the number of calls and the mean and maximum latency in
+        seconds, or ``None`` unless ``async_rpc_threads`` is set."""
+        return self.comm.get_async_rpc_stats()
+
     def compile(self, function, args, kwargs, set_result=None,
                 attribute_writeback=True, print_as_rpc=True,
                 target=None, destination=0, subkernel_arg_types=[],
                 old_embedding_map=None):
+        if self.profile_compiler is None:
+            profiler = profiling.profiler_from_env()
+        elif self.profile_compiler:
+            profiler = profiling.Profiler(memory=self.profile_compiler == "memory")
+        else:
+            profiler = profiling.null_profiler
+
         try:
             engine = _DiagnosticEngine(all_errors_are_fatal=True)
 
             stitcher = Stitcher(engine=engine, core=self, dmgr=self.dmgr,
                                 print_as_rpc=print_as_rpc,
                                 destination=destination, subkernel_arg_types=subkernel_arg_types,
-                                old_embedding_map=old_embedding_map)
-            stitcher.stitch_call(function, args, kwargs, set_result)
-            stitcher.finalize()
-
-            module = Module(stitcher,
-                ref_period=self.ref_period,
-                attribute_writeback=attribute_writeback,
-                remarks=self.report_invariants)
+                                old_embedding_map=old_embedding_map,
+                                profiler=profiler)
+            with profiler.stage("stitching"):
+                stitcher.stitch_call(function, args, kwargs, set_result)
+                stitcher.finalize()
+
+            with profiler.stage("transforms"):
+                module = Module(stitcher,
+                    ref_period=self.ref_period,
+                    attribute_writeback=attribute_writeback,
+                    remarks=self.report_invariants,
+                    profiler=profiler)
             target = target if target is not None else self.target_cls()
-
-            library = target.compile_and_link([module])
-            stripped_library = target.strip(library)
+            target.profiler = profiler
+
+            if self.kernel_cache is not None:
+                library, stripped_library = \
+                    self.kernel_cache.compile_and_link(target, module)
+            else:
+                library = target.compile_and_link([module])
+                stripped_library = target.strip(library)
+
+            if profiler is not profiling.null_profiler:
+                profiler.log("Compilation of {}".format(
+                    function.artiq_embedded.function.__qualname__))
+                self.compile_profile = profiler
 
             return stitcher.embedding_map, stripped_library, \
                    lambda addresses: target.symbolize(library, addresses), \
@@ -801,8 +801,7 @@ class WaveformDock(QtWidgets.QDockWidget):
 
     def on_dump_receive(self, dump):
         self._dump = dump
-        decoded_dump = comm_analyzer.decode_dump(dump)
-        waveform_data = comm_analyzer.decoded_dump_to_waveform_data(self._ddb, decoded_dump)
+        waveform_data = comm_analyzer.dump_to_waveform_data(self._ddb, dump)
         self._waveform_data.update(waveform_data)
         self._channel_model.update(self._waveform_data['logs'])
         self._waveform_model.update_all(self._waveform_data['data'])
@@ -862,9 +861,8 @@ class WaveformDock(QtWidgets.QDockWidget):
             return
         self._current_dir = os.path.dirname(filename)
         try:
-            decoded_dump = comm_analyzer.decode_dump(self._dump)
             with open(filename, 'w') as f:
-                comm_analyzer.decoded_dump_to_vcd(f, self._ddb, decoded_dump)
+                comm_analyzer.dump_to_vcd(f, self._ddb, self._dump)
         except:
             logger.error("Failed to save trace as VCD", exc_info=True)
 
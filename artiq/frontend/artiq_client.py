@@ -68,6 +68,10 @@ def get_argparser():
                                  "(defaults to head, ignored without -R)")
     parser_add.add_argument("--devarg-override", default="",
                             help="specify device arguments to override")
+    parser_add.add_argument("--stream-results", default=False,
+                            action="store_true",
+                            help="write the results file while the "
+                                 "experiment runs, instead of at the end")
     parser_add.add_argument("--content", default=False,
                             action="store_true",
                             help="submit by content")
@@ -137,6 +141,9 @@ def get_argparser():
         "scan-repository", help="trigger a repository (re)scan")
     parser_scan_repos.add_argument("--async", action="store_true",
                                    help="trigger scan and return immediately")
+    parser_scan_repos.add_argument("--full", action="store_true",
+                                   help="examine all files, even if their "
+                                        "cached examine results are valid")
     parser_scan_repos.add_argument("revision", metavar="REVISION",
                                    default=None, nargs="?",
                                    help="use a specific repository revision "
@@ -164,6 +171,8 @@ def _action_submit(remote, args):
         "class_name": args.class_name,
         "arguments": arguments,
     }
+    if args.stream_results:
+        expid["stream_results"] = True
     if args.content:
         with open(args.file, "r") as f:
             expid["content"] = f.read()
@@ -229,9 +238,9 @@ def _action_cancel_interactive(remote, args):
 
 def _action_scan_repository(remote, args):
     if getattr(args, "async"):
-        remote.scan_repository_async(args.revision)
+        remote.scan_repository_async(args.revision, args.full)
     else:
-        remote.scan_repository(args.revision)
+        remote.scan_repository(args.revision, args.full)
 
 
 def _action_ls(remote, args):
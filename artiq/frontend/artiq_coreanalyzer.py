@@ -2,13 +2,14 @@
 
 import argparse
 import sys
+import mmap
 
 from sipyco import common_args
 
 from artiq.master.databases import DeviceDB
 from artiq.master.worker_db import DeviceManager
 from artiq.coredevice.comm_analyzer import (get_analyzer_dump,
-                                            decode_dump, decoded_dump_to_vcd)
+                                            decode_dump, dump_to_vcd)
 
 
 def get_argparser():
@@ -47,22 +48,23 @@ def main():
 
     device_mgr = DeviceManager(DeviceDB(args.device_db))
     if args.read_dump:
+        # Map the file instead of reading it, so that large dumps are
+        # paged in as they are converted.
         with open(args.read_dump, "rb") as f:
-            dump = f.read()
+            dump = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     else:
         core_addr = device_mgr.get_desc("core")["arguments"]["host"]
         dump = get_analyzer_dump(core_addr)
-    decoded_dump = decode_dump(dump)
     if args.print_decoded:
+        decoded_dump = decode_dump(dump)
         print("Log channel:", decoded_dump.log_channel)
         print("DDS one-hot:", decoded_dump.dds_onehot_sel)
         for message in decoded_dump.messages:
             print(message)
     if args.write_vcd:
         with open(args.write_vcd, "w") as f:
-            decoded_dump_to_vcd(f, device_mgr.get_device_db(),
-                                decoded_dump,
-                                uniform_interval=args.vcd_uniform_interval)
+            dump_to_vcd(f, device_mgr.get_device_db(), dump,
+                        uniform_interval=args.vcd_uniform_interval)
     if args.write_dump:
         with open(args.write_dump, "wb") as f:
             f.write(dump)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import argparse
+
+import lmdb
+
+from artiq import __version__ as artiq_version
+from artiq.master.databases import (is_chunk_key, is_binary_dataset_record,
+                                    dataset_record_size, read_dataset,
+                                    write_dataset)
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(description="ARTIQ dataset database "
+                                                 "maintenance tool")
+
+    parser.add_argument("--version", action="version",
+                        version="ARTIQ v{}".format(artiq_version),
+                        help="print the ARTIQ version number")
+
+    parser.add_argument("file", metavar="FILE", type=str,
+                        help="dataset database file")
+
+    action = parser.add_subparsers(dest="action")
+    action.required = True
+
+    action.add_parser("show", help="show the number and size of the "
+                                   "records in each format")
+
+    p_migrate = action.add_parser(
+        "migrate", help="rewrite all records in the given format")
+    p_migrate.add_argument("--format", default="binary",
+                           choices=["binary", "pyon"],
+                           help="record format (default: %(default)s). "
+                                "Use 'pyon' before downgrading to a version "
+                                "of ARTIQ that does not read binary records")
+    p_migrate.add_argument("--chunk-size", default=64*1024, type=int,
+                           help="size in bytes of the chunks in which large "
+                                "arrays of binary records are stored "
+                                "(default: %(default)s)")
+
+    return parser
+
+
+def show(env):
+    counts = {"binary": [0, 0], "pyon": [0, 0]}
+    with env.begin() as txn:
+        for db_key, record in txn.cursor():
+            if is_chunk_key(db_key):
+                continue
+            fmt = "binary" if is_binary_dataset_record(record) else "pyon"
+            counts[fmt][0] += 1
+            counts[fmt][1] += dataset_record_size(record)
+    for fmt, (count, size) in counts.items():
+        print("{}: {} records, {} bytes".format(fmt, count, size))
+
+
+def migrate(env, binary, chunk_size=64*1024):
+    migrated = 0
+    with env.begin(write=True) as txn:
+        keys = [db_key.decode() for db_key, _ in txn.cursor()
+                if not is_chunk_key(db_key)]
+        for key in keys:
+            record = txn.get(key.encode())
+            if is_binary_dataset_record(record) == binary:
+                continue
+            value, metadata = read_dataset(txn, key, record)
+            write_dataset(txn, key, value, metadata, binary, chunk_size)
+            migrated += 1
+    print("migrated {} of {} records".format(migrated, len(keys)))
+
+
+def main():
+    args = get_argparser().parse_args()
+
+    env = lmdb.open(args.file, subdir=False, map_size=2**30)
+    try:
+        if args.action == "show":
+            show(env)
+        elif args.action == "migrate":
+            migrate(env, args.format == "binary", args.chunk_size)
+    finally:
+        env.close()
+
+
+if __name__ == "__main__":
+    main()
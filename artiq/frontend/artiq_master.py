@@ -7,7 +7,6 @@ import logging
 from types import SimpleNamespace
 
 from sipyco.pc_rpc import Server as RPCServer
-from sipyco.sync_struct import Publisher
 from sipyco.logs import Server as LoggingServer
 from sipyco.broadcast import Broadcaster
 from sipyco import common_args
@@ -17,7 +16,9 @@ from artiq import __version__ as artiq_version
 from artiq.master.log import log_args, init_log
 from artiq.master.databases import (DeviceDB, DatasetDB,
                                     InteractiveArgDB)
+from artiq.master.publisher import Publisher
 from artiq.master.scheduler import Scheduler
+from artiq.master.worker import WorkerPool
 from artiq.master.rid_counter import RIDCounter
 from artiq.master.experiments import (FilesystemBackend, GitBackend,
                                       ExperimentDB)
@@ -43,6 +44,44 @@ def get_argparser():
                        help="device database file (default: %(default)s)")
     group.add_argument("--dataset-db", default="dataset_db.mdb",
                        help="dataset file (default: %(default)s)")
+    group.add_argument("--dataset-lazy-threshold", default=None, type=int,
+                       help="do not keep persistent datasets larger than "
+                            "this number of bytes in memory, load them "
+                            "when requested (default: keep all)")
+    group.add_argument("--dataset-cache-size", default=256*1024*1024,
+                       type=int,
+                       help="maximum size in bytes of the lazily loaded "
+                            "datasets kept in memory (default: %(default)s)")
+    group.add_argument("--dataset-pyon-records", default=False,
+                       action="store_true",
+                       help="write persistent datasets as PYON text, "
+                            "readable by earlier versions, instead of "
+                            "binary records")
+    group.add_argument("--dataset-chunk-size", default=64*1024, type=int,
+                       help="size in bytes of the chunks in which large "
+                            "persistent arrays are stored, so that in-place "
+                            "modifications only rewrite the modified chunks "
+                            "(default: %(default)s)")
+    group.add_argument("--dataset-fsync", default="save",
+                       choices=["save", "close"],
+                       help="flush the dataset file to disk at each autosave "
+                            "or only when the master exits "
+                            "(default: %(default)s)")
+
+    group = parser.add_argument_group("results")
+    group.add_argument("--hdf5-compression", default=None,
+                       choices=["gzip", "lzf"],
+                       help="compress the NumPy arrays of the results files "
+                            "with this filter, unless the experiment sets "
+                            "other HDF5 options for the dataset "
+                            "(default: no compression)")
+    group.add_argument("--hdf5-compression-level", default=None, type=int,
+                       help="gzip compression level, from 0 to 9 "
+                            "(default: 4)")
+    group.add_argument("--hdf5-shuffle", default=False, action="store_true",
+                       help="apply the shuffle filter to the NumPy arrays of "
+                            "the results files, which usually improves their "
+                            "compression")
 
     group = parser.add_argument_group("repository")
     group.add_argument(
@@ -55,6 +94,31 @@ def get_argparser():
         "--experiment-subdir", default="",
         help=("path to the experiment folder from the repository root "
               "(default: %(default)s)"))
+    group.add_argument(
+        "--scan-workers", default=4, type=int,
+        help=("number of worker processes examining experiment files in "
+              "parallel during repository scans (default: %(default)s)"))
+    group.add_argument(
+        "--scan-timeout", default=20.0, type=float,
+        help=("time in seconds after which examining a single experiment "
+              "file is aborted (default: %(default)s)"))
+    group.add_argument(
+        "--examine-cache", default=None,
+        help=("file storing the results of examining experiment files, so "
+              "that repository scans only examine the files that changed, "
+              "or whose imported repository modules, or device database "
+              "and dataset entries read when examining them, changed "
+              "(default: disabled)"))
+
+    group = parser.add_argument_group("worker pool")
+    group.add_argument(
+        "--worker-pool-size", default=0, type=int,
+        help=("number of idle worker processes to keep ready for new runs, "
+              "0 to start a new process for each run (default: %(default)s)"))
+    group.add_argument(
+        "--worker-pool-max-runs", default=1, type=int,
+        help=("number of runs after which a pooled worker process is "
+              "replaced (default: %(default)s)"))
     log_args(parser)
 
     parser.add_argument("--name",
@@ -92,7 +156,12 @@ def main():
         server_broadcast.broadcast("ccb", msg)
 
     device_db = DeviceDB(args.device_db)
-    dataset_db = DatasetDB(args.dataset_db)
+    dataset_db = DatasetDB(args.dataset_db,
+                           lazy_threshold=args.dataset_lazy_threshold,
+                           cache_size=args.dataset_cache_size,
+                           binary_records=not args.dataset_pyon_records,
+                           chunk_size=args.dataset_chunk_size,
+                           fsync=args.dataset_fsync)
     atexit.register(dataset_db.close_db)
     dataset_db.start(loop=loop)
     atexit_register_coroutine(dataset_db.stop, loop=loop)
@@ -104,11 +173,20 @@ def main():
     else:
         repo_backend = FilesystemBackend(args.repository)
     experiment_db = ExperimentDB(
-        repo_backend, worker_handlers, args.experiment_subdir)
+        repo_backend, worker_handlers, args.experiment_subdir,
+        args.scan_workers, args.scan_timeout, args.examine_cache)
     atexit.register(experiment_db.close)
 
+    if args.worker_pool_size > 0:
+        worker_pool = WorkerPool(args.worker_pool_size,
+                                 args.worker_pool_max_runs)
+        worker_pool.start(loop=loop)
+        atexit_register_coroutine(worker_pool.stop, loop=loop)
+    else:
+        worker_pool = None
+
     scheduler = Scheduler(RIDCounter(), worker_handlers, experiment_db,
-                          args.log_submissions)
+                          args.log_submissions, worker_pool)
     scheduler.start(loop=loop)
     atexit_register_coroutine(scheduler.stop, loop=loop)
 
@@ -116,12 +194,21 @@ def main():
     def get_interactive_arguments(*args, **kwargs):
         return interactive_arg_db.get(*args, **kwargs)
     get_interactive_arguments._worker_pass_rid = True
+    hdf5_options = dict()
+    if args.hdf5_compression is not None:
+        hdf5_options["compression"] = args.hdf5_compression
+        if args.hdf5_compression_level is not None:
+            hdf5_options["compression_opts"] = args.hdf5_compression_level
+    if args.hdf5_shuffle:
+        hdf5_options["shuffle"] = True
+
     worker_handlers.update({
         "get_device_db": device_db.get_device_db,
         "get_device": device_db.get,
         "get_dataset": dataset_db.get,
         "get_dataset_metadata": dataset_db.get_metadata,
         "update_dataset": dataset_db.update,
+        "get_hdf5_options": lambda: hdf5_options,
         "get_interactive_arguments": get_interactive_arguments,
         "scheduler_submit": scheduler.submit,
         "scheduler_delete": scheduler.delete,
@@ -139,14 +226,18 @@ def main():
         terminate=lambda: signal_handler_task.cancel()
     )
 
-    server_control = RPCServer({
+    rpc_targets = {
         "master_management": master_management,
         "device_db": device_db,
         "dataset_db": dataset_db,
         "interactive_arg_db": interactive_arg_db,
         "schedule": scheduler,
         "experiment_db": experiment_db,
-    }, allow_parallel=True)
+    }
+    if worker_pool is not None:
+        rpc_targets["worker_pool"] = SimpleNamespace(
+            get_stats=worker_pool.get_stats)
+    server_control = RPCServer(rpc_targets, allow_parallel=True)
     loop.run_until_complete(server_control.start(
         bind, args.port_control))
     atexit_register_coroutine(server_control.stop, loop=loop)
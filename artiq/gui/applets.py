@@ -17,6 +17,7 @@ from sipyco import pyon
 
 from artiq.gui.entries import procdesc_to_entry, EntryTreeWidget
 from artiq.gui.tools import QDockWidgetCloseDetect, LayoutWidget
+from artiq.master.publisher import ModQueue
 
 
 logger = logging.getLogger(__name__)
@@ -90,6 +91,10 @@ class EntryArea(EntryTreeWidget):
 
 
 class AppletIPCServer(AsyncioParentComm):
+    # Number of queued modifications above which an applet that does not
+    # keep up is sent the current values of its datasets instead.
+    max_queued_mods = 1000
+
     def __init__(self, dataset_sub, dataset_ctl, expmgr):
         AsyncioParentComm.__init__(self)
         self.dataset_sub = dataset_sub
@@ -97,6 +102,12 @@ class AppletIPCServer(AsyncioParentComm):
         self.expmgr = expmgr
         self.datasets = set()
         self.dataset_prefixes = []
+        # Modifications are queued, with their encodings, while the applet
+        # reads the previous ones or until the end of its update interval.
+        self.mod_queue = ModQueue()
+        self.mod_event = asyncio.Event()
+        self.resync = False
+        self.update_interval = 0.0
 
     def write_pyon(self, obj):
         self.write(pyon.encode(obj).encode() + b"\n")
@@ -135,10 +146,48 @@ class AppletIPCServer(AsyncioParentComm):
             elif mod["action"] in {"setitem", "delitem"}:
                 if not self._is_dataset_subscribed(mod["key"]):
                     return
-        self.write_pyon({"action": "mod", "mod": mod})
+        self._queue_mod(mod)
+
+    def _queue_mod(self, mod):
+        if self.resync:
+            return
+        if len(self.mod_queue) >= self.max_queued_mods:
+            # Drop the queued modifications and send the latest values
+            # when the applet is ready.
+            self.mod_queue.clear()
+            self.resync = True
+        else:
+            # Values may be modified in place by later modifications, so
+            # encode them now.
+            line = pyon.encode({"action": "mod", "mod": mod}).encode() + b"\n"
+            self.mod_queue.put(mod, line)
+        self.mod_event.set()
+
+    async def _send_mods(self):
+        try:
+            while True:
+                await self.mod_event.wait()
+                self.mod_event.clear()
+                if self.resync:
+                    self.resync = False
+                    if self.dataset_sub.model is not None:
+                        mod = self._synthesize_init(
+                            self.dataset_sub.model.backing_store)
+                        self.write_pyon({"action": "mod", "mod": mod})
+                lines = [line for _, line in self.mod_queue.take()]
+                if lines:
+                    self.write(b"".join(lines))
+                # wait for the applet to keep up
+                await self.drain()
+                if self.update_interval:
+                    await asyncio.sleep(self.update_interval)
+        except ConnectionError:
+            # the applet exited; the server stops when reading from it
+            pass
 
     async def serve(self, embed_cb):
         self.dataset_sub.notify_cbs.append(self._on_mod)
+        send_task = asyncio.ensure_future(self._send_mods())
         try:
             while True:
                 obj = await self.read_pyon()
@@ -153,10 +202,14 @@ class AppletIPCServer(AsyncioParentComm):
                     elif action == "subscribe":
                         self.datasets = obj["datasets"]
                         self.dataset_prefixes = obj["dataset_prefixes"]
+                        max_rate = obj.get("max_rate")
+                        if max_rate:
+                            self.update_interval = 1/max_rate
+                        self.mod_queue.coalesce = obj.get("coalesce", True)
                         if self.dataset_sub.model is not None:
                             mod = self._synthesize_init(
                                 self.dataset_sub.model.backing_store)
-                            self.write_pyon({"action": "mod", "mod": mod})
+                            self._queue_mod(mod)
                     elif action == "set_dataset":
                         await self.dataset_ctl.set(obj["key"], obj["value"], metadata=obj["metadata"], persist=obj["persist"])
                     elif action == "update_dataset":
@@ -176,6 +229,7 @@ class AppletIPCServer(AsyncioParentComm):
                          "server stopped", exc_info=True)
         finally:
             self.dataset_sub.notify_cbs.remove(self._on_mod)
+            send_task.cancel()
 
     def start_server(self, embed_cb, *, loop=None):
         self.server_task = asyncio.ensure_future(
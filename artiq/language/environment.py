@@ -392,7 +392,8 @@ class HasEnvironment:
     @rpc(flags={"async"})
     def set_dataset(self, key, value, *,
                     unit=None, scale=None, precision=None,
-                    broadcast=False, persist=False, archive=True):
+                    broadcast=False, persist=False, archive=True,
+                    hdf5_options=None):
         """Sets the contents and handling modes of a dataset.
 
         Datasets must be scalars (``bool``, ``int``, ``float`` or NumPy scalar)
@@ -411,6 +412,13 @@ class HasEnvironment:
             broadcast.
         :param archive: the data is saved into the local storage of the current
             run (archived as a HDF5 file).
+        :param hdf5_options: dictionary of keyword arguments of
+            ``h5py.Group.create_dataset`` controlling how the archived dataset
+            is stored in the HDF5 file, e.g.
+            ``{"chunks": (1, 512, 512), "compression": "gzip", "shuffle": True}``.
+            They replace the default options set on the master with
+            ``--hdf5-compression``/``--hdf5-shuffle``; use ``{}`` to store the
+            dataset contiguously and uncompressed.
         """
         metadata = {}
         if unit is not None:
@@ -419,7 +427,8 @@ class HasEnvironment:
             metadata["scale"] = scale
         if precision is not None:
             metadata["precision"] = precision
-        self.__dataset_mgr.set(key, value, metadata, broadcast, persist, archive)
+        self.__dataset_mgr.set(key, value, metadata, broadcast, persist, archive,
+                               hdf5_options)
 
     @rpc(flags={"async"})
     def mutate_dataset(self, key, index, value):
@@ -427,7 +436,8 @@ class HasEnvironment:
         a given position in a NumPy array)
 
         If the dataset was created in broadcast mode, the modification is
-        immediately transmitted.
+        transmitted to the master, batched with the other modifications made
+        within a short delay.
 
         If the index is a tuple of integers, it is interpreted as
         ``slice(*index)``.
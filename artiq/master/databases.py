@@ -1,6 +1,9 @@
 import asyncio
+import struct
+from collections import OrderedDict
 
 import lmdb
+import numpy
 
 from sipyco.sync_struct import (Notifier, process_mod, ModAction,
                                 update_from_dict)
@@ -9,6 +12,7 @@ from sipyco.tools import TaskObject
 
 from artiq import compat
 from artiq.tools import file_import
+from artiq.master.worker_ipc import extract_arrays, insert_arrays
 
 
 def device_db_from_file(filename):
@@ -42,35 +46,354 @@ class DeviceDB:
         return self.data.raw_view["satellite_cpu_targets"][destination]
 
 
+# Persistent datasets are stored either as PYON text encoding the
+# (value, metadata) pair, as written by earlier versions, or as binary
+# records made of a header, the PYON metadata, the PYON value with the large
+# NumPy arrays replaced by placeholders, and the raw array buffers.
+#
+# The buffers of chunked binary records are not part of the record, but are
+# stored back to back in separate entries of a fixed size, whose keys are
+# made of a NUL byte, the dataset key, a NUL byte and the big-endian chunk
+# index. This lets in-place modifications of large arrays rewrite only the
+# modified chunks.
+_RECORD_MAGIC = b"\x00ADS"
+_RECORD_VERSION = 1
+_RECORD_VERSION_CHUNKED = 2
+_record_header = struct.Struct("<4sBII")
+# total length of the buffers, chunk size
+_chunked_header = struct.Struct("<QI")
+_chunk_index = struct.Struct(">I")
+
+
+def is_chunk_key(db_key):
+    """Returns whether an entry of the dataset DB file holds a chunk of
+    array buffers rather than a dataset."""
+    return db_key[:1] == b"\x00"
+
+
+def _chunk_key(db_key, index):
+    return b"\x00" + db_key + b"\x00" + _chunk_index.pack(index)
+
+
+def _encode_binary(value, metadata):
+    buffers = []
+    value = pyon.encode(extract_arrays(value, buffers)).encode()
+    metadata = pyon.encode(metadata).encode()
+    return metadata, value, [memoryview(buffer).cast("B")
+                             for buffer in buffers]
+
+
+def encode_dataset_record(value, metadata, binary=True):
+    """Encodes a persistent dataset for the dataset DB file, as a single
+    record."""
+    if not binary:
+        return pyon.encode((value, metadata)).encode()
+    metadata, value, buffers = _encode_binary(value, metadata)
+    header = _record_header.pack(_RECORD_MAGIC, _RECORD_VERSION,
+                                 len(metadata), len(value))
+    return b"".join([header, metadata, value] + buffers)
+
+
+def is_binary_dataset_record(record):
+    return bytes(record[:len(_RECORD_MAGIC)]) == _RECORD_MAGIC
+
+
+def _decode_record_header(record):
+    # Returns the offset of the metadata, the lengths of the metadata and of
+    # the value, and for chunked records, the length of the buffers and the
+    # chunk size.
+    magic, version, metadata_length, value_length = \
+        _record_header.unpack_from(record)
+    offset = _record_header.size
+    if version == _RECORD_VERSION:
+        chunking = None
+    elif version == _RECORD_VERSION_CHUNKED:
+        chunking = _chunked_header.unpack_from(record, offset)
+        offset += _chunked_header.size
+    else:
+        raise ValueError("unsupported dataset record version {}"
+                         .format(version))
+    return offset, metadata_length, value_length, chunking
+
+
+def _chunking(record):
+    if record is None or not is_binary_dataset_record(record):
+        return None
+    return _decode_record_header(record)[3]
+
+
+def _chunk_count(chunking):
+    if chunking is None:
+        return 0
+    payload_length, chunk_size = chunking
+    return -(-payload_length // chunk_size)
+
+
+def _decode_binary(record, payload=None):
+    # The arrays are backed by ``payload`` for chunked records, or else by
+    # ``record``, which must then be writable.
+    offset, metadata_length, value_length, _ = _decode_record_header(record)
+    metadata = pyon.decode(bytes(record[offset:offset+metadata_length])
+                           .decode())
+    offset += metadata_length
+    value = pyon.decode(bytes(record[offset:offset+value_length]).decode())
+    offset += value_length
+    if payload is None:
+        payload = record
+    else:
+        offset = 0
+    return insert_arrays(value, payload, offset), metadata
+
+
+def decode_dataset_record(record):
+    """Decodes a record of the dataset DB file into a (value, metadata)
+    pair. The arrays of binary records are copied out of ``record``.
+
+    Chunked records are decoded by :func:`read_dataset`."""
+    if not is_binary_dataset_record(record):
+        return compat.pyon_decode(bytes(record).decode())
+    if _chunking(record) is not None:
+        raise ValueError("chunked dataset records must be read with "
+                         "read_dataset")
+    return _decode_binary(bytearray(record))
+
+
+def decode_dataset_metadata(record):
+    """Decodes only the metadata of a record of the dataset DB file. This
+    does not decode the value of binary records."""
+    if not is_binary_dataset_record(record):
+        return decode_dataset_record(record)[1]
+    offset, metadata_length, _, _ = _decode_record_header(record)
+    return pyon.decode(bytes(record[offset:offset+metadata_length]).decode())
+
+
+def dataset_record_size(record):
+    """Returns the size in bytes of a record of the dataset DB file,
+    including its chunks."""
+    chunking = _chunking(record)
+    return len(record) + (0 if chunking is None else chunking[0])
+
+
+def read_dataset(txn, key, record=None):
+    """Reads a persistent dataset from the dataset DB file, in the LMDB
+    transaction ``txn``, and returns a (value, metadata) pair.
+
+    ``record`` is the record of the dataset, if it has already been
+    read."""
+    db_key = key.encode()
+    if record is None:
+        record = txn.get(db_key)
+        if record is None:
+            raise KeyError(key)
+    chunking = _chunking(record)
+    if chunking is None:
+        return decode_dataset_record(record)
+    payload = bytearray(chunking[0])
+    chunk_size = chunking[1]
+    for i in range(_chunk_count(chunking)):
+        chunk = txn.get(_chunk_key(db_key, i))
+        payload[i*chunk_size:i*chunk_size+len(chunk)] = chunk
+    return _decode_binary(record, payload)
+
+
+def _delete_chunks(txn, db_key, start, stop):
+    for i in range(start, stop):
+        txn.delete(_chunk_key(db_key, i))
+
+
+def write_dataset(txn, key, value, metadata, binary=True, chunk_size=None):
+    """Writes a persistent dataset to the dataset DB file, in the LMDB
+    transaction ``txn``.
+
+    If ``chunk_size`` is not ``None``, the array buffers of binary records
+    are stored in chunks of this number of bytes when they are larger, so
+    that they can be updated by :func:`write_dataset_ranges`."""
+    db_key = key.encode()
+    old_chunks = _chunk_count(_chunking(txn.get(db_key)))
+    chunks = 0
+    if not binary:
+        txn.put(db_key, encode_dataset_record(value, metadata, False))
+    else:
+        metadata, value, buffers = _encode_binary(value, metadata)
+        payload_length = sum(len(buffer) for buffer in buffers)
+        if chunk_size is None or payload_length <= chunk_size:
+            header = _record_header.pack(_RECORD_MAGIC, _RECORD_VERSION,
+                                         len(metadata), len(value))
+            txn.put(db_key, b"".join([header, metadata, value] + buffers))
+        else:
+            header = (_record_header.pack(_RECORD_MAGIC,
+                                          _RECORD_VERSION_CHUNKED,
+                                          len(metadata), len(value))
+                      + _chunked_header.pack(payload_length, chunk_size))
+            txn.put(db_key, header + metadata + value)
+            if len(buffers) == 1:
+                payload = buffers[0]
+            else:
+                payload = memoryview(b"".join(buffers))
+            chunks = _chunk_count((payload_length, chunk_size))
+            for i in range(chunks):
+                txn.put(_chunk_key(db_key, i),
+                        payload[i*chunk_size:(i+1)*chunk_size])
+    _delete_chunks(txn, db_key, chunks, old_chunks)
+
+
+def write_dataset_ranges(txn, key, array, ranges):
+    """Rewrites the chunks of a persistent dataset whose value is the
+    C-contiguous NumPy array ``array`` that overlap the given ranges of byte
+    offsets in its buffer.
+
+    Returns ``False``, without writing anything, if the dataset is not
+    stored as a chunked record of the same size, in which case it must be
+    written by :func:`write_dataset`."""
+    db_key = key.encode()
+    chunking = _chunking(txn.get(db_key))
+    if chunking is None or chunking[0] != array.nbytes:
+        return False
+    payload = memoryview(array).cast("B")
+    chunk_size = chunking[1]
+    chunks = set()
+    for start, stop in ranges:
+        if start < stop:
+            chunks.update(range(start//chunk_size, (stop - 1)//chunk_size + 1))
+    for i in chunks:
+        txn.put(_chunk_key(db_key, i),
+                payload[i*chunk_size:(i+1)*chunk_size])
+    return True
+
+
+def delete_dataset(txn, key):
+    """Deletes a persistent dataset from the dataset DB file, in the LMDB
+    transaction ``txn``."""
+    db_key = key.encode()
+    record = txn.get(db_key)
+    if record is not None:
+        _delete_chunks(txn, db_key, 0, _chunk_count(_chunking(record)))
+        txn.delete(db_key)
+
+
+def _byte_range(array, index):
+    # Returns the range of offsets in the buffer of the C-contiguous
+    # ``array`` of the elements selected by ``index``, or None if the index
+    # is not made of integers and slices only, or is invalid.
+    if type(index) is not tuple:
+        index = (index, )
+    if not all((isinstance(i, (int, numpy.integer)) and type(i) is not bool)
+               or isinstance(i, slice) for i in index):
+        return None
+    try:
+        # indexing with an ellipsis always returns a view
+        view = array[index + (Ellipsis, )]
+    except (IndexError, TypeError):
+        return None
+    if not view.size:
+        return 0, 0
+    start = (view.__array_interface__["data"][0]
+             - array.__array_interface__["data"][0])
+    stop = start + view.itemsize
+    for n, stride in zip(view.shape, view.strides):
+        if stride < 0:
+            start += (n - 1)*stride
+        else:
+            stop += (n - 1)*stride
+    return start, stop
+
+
 class DatasetDB(TaskObject):
-    def __init__(self, persist_file, autosave_period=30):
+    """Dataset database, persisting datasets in a LMDB file.
+
+    :param persist_file: LMDB file storing the persistent datasets.
+    :param autosave_period: Interval, in seconds, between two writes of the
+        modified datasets to the LMDB file.
+    :param lazy_threshold: If not ``None``, persistent datasets whose record
+        in the LMDB file, including its chunks, is larger than this number of
+        bytes are not kept in memory. They are still listed with their
+        metadata, but with ``None`` as value, until they are modified.
+        :meth:`get` loads their value from the file.
+    :param cache_size: Maximum total size, in bytes of the LMDB records, of
+        the lazily loaded values kept in memory for subsequent :meth:`get`
+        calls. The least recently used values are dropped first.
+    :param binary_records: Write the datasets as binary records. Otherwise,
+        they are written as PYON text, which earlier versions can read.
+        Both are always read.
+    :param chunk_size: Size in bytes of the chunks in which the arrays of
+        binary records are stored, if they are larger. When elements or
+        slices of a persistent array are modified with :meth:`update`, only
+        the modified chunks are rewritten. ``None`` stores the arrays in the
+        records.
+    :param fsync: When the LMDB file is flushed to disk: ``"save"`` at each
+        write of the modified datasets, or ``"close"`` only when the database
+        is closed. The latter avoids waiting for the disk at each write, but
+        the writes since the last flush may be lost if the operating system
+        crashes.
+    """
+    def __init__(self, persist_file, autosave_period=30,
+                 lazy_threshold=None, cache_size=256*1024*1024,
+                 binary_records=True, chunk_size=64*1024, fsync="save"):
         self.persist_file = persist_file
         self.autosave_period = autosave_period
+        self.lazy_threshold = lazy_threshold
+        self.cache_size = cache_size
+        self.binary_records = binary_records
+        self.chunk_size = chunk_size
+        if fsync not in ("save", "close"):
+            raise ValueError("invalid fsync policy {!r}".format(fsync))
+        self.fsync = fsync
 
-        self.lmdb = lmdb.open(persist_file, subdir=False, map_size=2**30)
+        self.lmdb = lmdb.open(persist_file, subdir=False, map_size=2**30,
+                              sync=fsync == "save")
         data = dict()
+        # Keys of the persistent datasets whose value is not in self.data
+        self.lazy_keys = set()
         with self.lmdb.begin() as txn:
-            for key, value_and_metadata in txn.cursor():
-                value, metadata = compat.pyon_decode(value_and_metadata.decode())
-                data[key.decode()] = (True, value, metadata)
+            for db_key, record in txn.cursor():
+                if is_chunk_key(db_key):
+                    continue
+                key = db_key.decode()
+                if (lazy_threshold is not None
+                        and dataset_record_size(record) > lazy_threshold):
+                    self.lazy_keys.add(key)
+                    value = None
+                    metadata = decode_dataset_metadata(record)
+                else:
+                    value, metadata = read_dataset(txn, key, record)
+                data[key] = (True, value, metadata)
         self.data = Notifier(data)
+        # Keys of the datasets to write in full
         self.pending_keys = set()
+        # Key -> ranges of byte offsets of the modified parts of the arrays
+        # of other persistent datasets
+        self.dirty_ranges = dict()
+
+        self._cache = OrderedDict()  # key -> (value, record size)
+        self._cache_total = 0
 
     def close_db(self):
+        if self.fsync == "close":
+            self.lmdb.sync(True)
         self.lmdb.close()
 
     def save(self):
         with self.lmdb.begin(write=True) as txn:
             for key in self.pending_keys:
+                if key in self.lazy_keys:
+                    # unmodified since it was loaded
+                    continue
                 if (key not in self.data.raw_view
                         or not self.data.raw_view[key][0]):
-                    txn.delete(key.encode())
+                    delete_dataset(txn, key)
                 else:
-                    value_and_metadata = (self.data.raw_view[key][1],
-                                          self.data.raw_view[key][2])
-                    txn.put(key.encode(),
-                            pyon.encode(value_and_metadata).encode())
+                    _, value, metadata = self.data.raw_view[key]
+                    write_dataset(txn, key, value, metadata,
+                                  self.binary_records, self.chunk_size)
+            for key, ranges in self.dirty_ranges.items():
+                if key in self.pending_keys:
+                    continue
+                _, value, metadata = self.data.raw_view[key]
+                if not write_dataset_ranges(txn, key, value, ranges):
+                    write_dataset(txn, key, value, metadata,
+                                  self.binary_records, self.chunk_size)
         self.pending_keys.clear()
+        self.dirty_ranges.clear()
 
     async def _do(self):
         try:
@@ -80,7 +403,38 @@ class DatasetDB(TaskObject):
         finally:
             self.save()
 
+    def _load(self, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key][0]
+        with self.lmdb.begin() as txn:
+            record = txn.get(key.encode())
+            value, _ = read_dataset(txn, key, record)
+            size = dataset_record_size(record)
+        self._cache[key] = value, size
+        self._cache_total += size
+        while self._cache_total > self.cache_size and len(self._cache) > 1:
+            _, (_, size) = self._cache.popitem(last=False)
+            self._cache_total -= size
+        return value
+
+    def _drop_lazy(self, key):
+        self.lazy_keys.discard(key)
+        if key in self._cache:
+            _, size = self._cache.pop(key)
+            self._cache_total -= size
+
+    def _materialize(self, key):
+        # Modifications of a value need it in memory, and subscribers need
+        # to receive it before the modifications.
+        value = self._load(key)
+        self._drop_lazy(key)
+        persist, _, metadata = self.data.raw_view[key]
+        self.data[key] = (persist, value, metadata)
+
     def get(self, key):
+        if key in self.lazy_keys:
+            return self._load(key)
         return self.data.raw_view[key][1]
 
     def get_metadata(self, key):
@@ -89,13 +443,37 @@ class DatasetDB(TaskObject):
     def update(self, mod):
         if mod["path"]:
             key = mod["path"][0]
+            if key in self.lazy_keys:
+                self._materialize(key)
         else:
             assert (mod["action"] == ModAction.setitem.value
                     or mod["action"] == ModAction.delitem.value)
             key = mod["key"]
-        self.pending_keys.add(key)
+            self._drop_lazy(key)
+        if not self._track_range(key, mod):
+            self.pending_keys.add(key)
         process_mod(self.data, mod)
 
+    def _track_range(self, key, mod):
+        # Records the part of a persistent array modified in place by mod,
+        # so that only the corresponding chunks are written by save().
+        if (self.chunk_size is None or not self.binary_records
+                or key in self.pending_keys
+                or list(mod["path"]) != [key, 1]
+                or mod["action"] != ModAction.setitem.value):
+            return False
+        persist, value, _ = self.data.raw_view[key]
+        if (not persist or type(value) is not numpy.ndarray
+                or value.dtype.kind not in "biufc"
+                or not value.flags.c_contiguous
+                or value.nbytes <= self.chunk_size):
+            return False
+        byte_range = _byte_range(value, mod["key"])
+        if byte_range is None:
+            return False
+        self.dirty_ranges.setdefault(key, []).append(byte_range)
+        return True
+
     # convenience functions (update() can be used instead)
     def set(self, key, value, persist=None, metadata=None):
         if persist is None:
@@ -108,10 +486,12 @@ class DatasetDB(TaskObject):
                 metadata = self.data.raw_view[key][2]
             else:
                 metadata = {}
+        self._drop_lazy(key)
         self.data[key] = (persist, value, metadata)
         self.pending_keys.add(key)
 
     def delete(self, key):
+        self._drop_lazy(key)
         del self.data[key]
         self.pending_keys.add(key)
     #
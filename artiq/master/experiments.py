@@ -4,9 +4,13 @@ import tempfile
 import shutil
 import time
 import logging
+import hashlib
+from collections import deque
 
 from sipyco.sync_struct import Notifier, update_from_dict
+from sipyco import pyon
 
+from artiq import __version__ as artiq_version
 from artiq.master.worker import (Worker, WorkerInternalException,
                                  log_worker_exception)
 from artiq.tools import get_windows_drives, exc_to_warning
@@ -15,19 +19,57 @@ from artiq.tools import get_windows_drives, exc_to_warning
 logger = logging.getLogger(__name__)
 
 
+# Requests of the worker to the master whose results examine results may
+# depend on, e.g. argument defaults computed from datasets.
+_EXAMINE_READS = ("get_device_db", "get_device",
+                  "get_dataset", "get_dataset_metadata")
+
+
+def _fingerprint(outcome):
+    return hashlib.sha1(pyon.encode(outcome).encode()).hexdigest()
+
+
+def _read_fingerprint(handler, args, kwargs):
+    try:
+        outcome = ("ok", handler(*args, **kwargs))
+    except Exception as exc:
+        outcome = ("error", type(exc).__name__)
+    return _fingerprint(outcome)
+
+
+def _blob_id(filename):
+    # Same as the Git blob ID of the file contents
+    with open(filename, "rb") as f:
+        data = f.read()
+    h = hashlib.sha1()
+    h.update("blob {}\0".format(len(data)).encode())
+    h.update(data)
+    return h.hexdigest()
+
+
 class _RepoScanner:
-    def __init__(self, worker_handlers):
+    def __init__(self, worker_handlers, max_workers=1, timeout=20.0,
+                 cache=None):
         self.worker_handlers = worker_handlers
-        self.worker = None
-
-    async def process_file(self, entry_dict, root, filename):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        # Examine results from previous scans, updated in place:
+        # file -> {"hash": ..., "dependencies": {file: hash},
+        #          "reads": [[action, args, kwargs, fingerprint]],
+        #          "description": ...}
+        self.cache = cache
+
+    async def examine_file(self, worker, root, filename):
         logger.debug("processing file %s %s", root, filename)
         try:
-            description = await self.worker.examine(
-                "scan", os.path.join(root, filename))
+            return await worker.examine(
+                "scan", os.path.join(root, filename), self.timeout,
+                return_dependencies=True)
         except:
             log_worker_exception()
             raise
+
+    def add_entries(self, entry_dict, filename, description):
         for class_name, class_desc in description.items():
             name = class_desc["name"]
             if "/" in name:
@@ -52,42 +94,187 @@ class _RepoScanner:
             }
             entry_dict[name] = entry
 
-    async def _scan(self, root, subdir=""):
-        entry_dict = dict()
+    def _list(self, root, subdir, filenames):
+        """Returns the directory tree below ``subdir`` as a list of file
+        names and ``(name, subtree)`` pairs, and appends the Python files
+        in it to ``filenames``."""
+        tree = []
         for de in os.scandir(os.path.join(root, subdir)):
             if de.name.startswith("."):
                 continue
             if de.is_file() and de.name.endswith(".py"):
                 filename = os.path.join(subdir, de.name)
+                filenames.append(filename)
+                tree.append(filename)
+            if de.is_dir():
+                tree.append((de.name, self._list(
+                    root, os.path.join(subdir, de.name), filenames)))
+        return tree
+
+    def _recording_handlers(self, reads):
+        """Returns the worker handlers, with the requests of
+        :data:`_EXAMINE_READS` recorded in ``reads`` with the fingerprint of
+        their results."""
+        handlers = dict(self.worker_handlers)
+        def recorder(action, handler):
+            def record(*args, **kwargs):
                 try:
-                    await self.process_file(entry_dict, root, filename)
+                    result = handler(*args, **kwargs)
                 except Exception as exc:
-                    logger.warning("Skipping file '%s'", filename,
-                        exc_info=not isinstance(exc, WorkerInternalException))
-                    # restart worker
-                    await self.worker.close()
-                    self.worker = Worker(self.worker_handlers)
-            if de.is_dir():
-                subentries = await self._scan(
-                    root, os.path.join(subdir, de.name))
-                entries = {de.name + "/" + k: v for k, v in subentries.items()}
+                    # e.g. a missing dataset, for which a default is used
+                    reads.append([action, list(args), kwargs,
+                                  _fingerprint(("error", type(exc).__name__))])
+                    raise
+                reads.append([action, list(args), kwargs,
+                              _fingerprint(("ok", result))])
+                return result
+            return record
+        for action in _EXAMINE_READS:
+            if action in handlers:
+                handlers[action] = recorder(action, handlers[action])
+        return handlers
+
+    async def _examine_files(self, root, filenames):
+        """Returns the description, the imported modules, and the recorded
+        reads if an examine cache is used, of each file that could be
+        examined."""
+        pending = deque(filenames)
+        descriptions = dict()
+
+        async def examine_task():
+            reads = []
+            if self.cache is None:
+                handlers = self.worker_handlers
+            else:
+                handlers = self._recording_handlers(reads)
+            worker = Worker(handlers)
+            try:
+                while pending:
+                    filename = pending.popleft()
+                    reads.clear()
+                    try:
+                        description, dependencies = await self.examine_file(
+                            worker, root, filename)
+                        descriptions[filename] = (description, dependencies,
+                                                  list(reads))
+                    except Exception as exc:
+                        logger.warning("Skipping file '%s'", filename,
+                            exc_info=not isinstance(exc, WorkerInternalException))
+                        # restart worker
+                        await worker.close()
+                        worker = Worker(handlers)
+            finally:
+                await worker.close()
+
+        n_workers = min(self.max_workers, len(filenames))
+        await asyncio.gather(*[examine_task() for _ in range(n_workers)])
+        return descriptions
+
+    def _collect(self, tree, descriptions):
+        entry_dict = dict()
+        for item in tree:
+            if isinstance(item, tuple):
+                name, subtree = item
+                subentries = self._collect(subtree, descriptions)
+                entries = {name + "/" + k: v for k, v in subentries.items()}
                 entry_dict.update(entries)
+            elif item in descriptions:
+                self.add_entries(entry_dict, item, descriptions[item])
         return entry_dict
 
+    async def _examine_changed_files(self, root, filenames):
+        hashes = dict()
+
+        def file_hash(filename):
+            if filename not in hashes:
+                try:
+                    hashes[filename] = _blob_id(os.path.join(root, filename))
+                except OSError:
+                    hashes[filename] = None
+            return hashes[filename]
+
+        fingerprints = dict()
+
+        def fingerprint(action, args, kwargs):
+            key = pyon.encode((action, args, kwargs))
+            if key not in fingerprints:
+                handler = self.worker_handlers.get(action)
+                if handler is None:
+                    fingerprints[key] = None
+                else:
+                    fingerprints[key] = _read_fingerprint(handler, args, kwargs)
+            return fingerprints[key]
+
+        def is_valid(filename, entry):
+            # The device database and datasets read while examining the
+            # file must be unchanged, as well as the file and its imports.
+            return (entry["hash"] == file_hash(filename)
+                    and all(file_hash(dependency) == h
+                            for dependency, h in entry["dependencies"].items())
+                    and "reads" in entry
+                    and all(fingerprint(action, args, kwargs) == f
+                            for action, args, kwargs, f in entry["reads"]))
+
+        descriptions = dict()
+        changed = []
+        for filename in filenames:
+            entry = self.cache.get(filename)
+            if entry is not None and is_valid(filename, entry):
+                descriptions[filename] = entry["description"]
+            else:
+                changed.append(filename)
+        logger.info("examining %d of %d files", len(changed), len(filenames))
+
+        results = await self._examine_files(root, changed)
+
+        root_prefix = os.path.realpath(root) + os.sep
+        new_cache = {filename: self.cache[filename]
+                     for filename in descriptions}
+        for filename, (description, dependencies, reads) in results.items():
+            # Only track modules from the repository; changes to other
+            # modules require a full rescan.
+            dependency_hashes = dict()
+            for dependency in dependencies:
+                if dependency.startswith(root_prefix):
+                    dependency = dependency[len(root_prefix):]
+                    dependency_hashes[dependency] = file_hash(dependency)
+            new_cache[filename] = {
+                "hash": file_hash(filename),
+                "dependencies": dependency_hashes,
+                "reads": reads,
+                "description": description
+            }
+            descriptions[filename] = description
+        self.cache.clear()
+        self.cache.update(new_cache)
+        return descriptions
+
     async def scan(self, root, subdir=""):
-        self.worker = Worker(self.worker_handlers)
-        try:
-            r = await self._scan(root, subdir)
-        finally:
-            await self.worker.close()
-        return r
+        filenames = []
+        tree = self._list(root, subdir, filenames)
+        if self.cache is None:
+            results = await self._examine_files(root, filenames)
+            descriptions = {filename: description
+                            for filename, (description, _, _) in results.items()}
+        else:
+            descriptions = await self._examine_changed_files(root, filenames)
+        return self._collect(tree, descriptions)
 
 
 class ExperimentDB:
-    def __init__(self, repo_backend, worker_handlers, experiment_subdir=""):
+    def __init__(self, repo_backend, worker_handlers, experiment_subdir="",
+                 scan_workers=1, scan_timeout=20.0, examine_cache=None):
         self.repo_backend = repo_backend
         self.worker_handlers = worker_handlers
         self.experiment_subdir = experiment_subdir
+        self.scan_workers = scan_workers
+        self.scan_timeout = scan_timeout
+
+        self.examine_cache_file = examine_cache
+        if examine_cache is None:
+            self.examine_cache = None
+        else:
+            self.examine_cache = self._load_examine_cache()
 
         self.cur_rev = self.repo_backend.get_head_rev()
         self.repo_backend.request_rev(self.cur_rev)
@@ -103,7 +290,37 @@ class ExperimentDB:
         # The object cannot be used anymore after calling this method.
         self.repo_backend.release_rev(self.cur_rev)
 
-    async def scan_repository(self, new_cur_rev=None):
+    def _load_examine_cache(self):
+        try:
+            data = pyon.load_file(self.examine_cache_file)
+        except FileNotFoundError:
+            return dict()
+        except:
+            logger.warning("failed to load examine cache '%s', ignoring",
+                           self.examine_cache_file, exc_info=True)
+            return dict()
+        if data.get("artiq_version") != artiq_version:
+            return dict()
+        return data["entries"]
+
+    def _save_examine_cache(self):
+        try:
+            pyon.store_file(self.examine_cache_file, {
+                "artiq_version": artiq_version,
+                "entries": self.examine_cache
+            })
+        except:
+            logger.warning("failed to save examine cache '%s'",
+                           self.examine_cache_file, exc_info=True)
+
+    async def scan_repository(self, new_cur_rev=None, full=False):
+        """Scans the repository at revision ``new_cur_rev`` (default: head)
+        for experiments.
+
+        If an examine cache is used, only the files that changed since
+        the last scan, import changed repository files, or read entries of
+        the device database or datasets that changed while they were
+        examined, are examined again, unless ``full`` is set."""
         if self._scanning:
             return
         self._scanning = True
@@ -116,17 +333,23 @@ class ExperimentDB:
             self.cur_rev = new_cur_rev
             self.status["cur_rev"] = new_cur_rev
             t1 = time.monotonic()
-            new_explist = await _RepoScanner(self.worker_handlers).scan(
-                wd, self.experiment_subdir)
+            if full and self.examine_cache is not None:
+                self.examine_cache.clear()
+            scanner = _RepoScanner(self.worker_handlers,
+                                   self.scan_workers, self.scan_timeout,
+                                   self.examine_cache)
+            new_explist = await scanner.scan(wd, self.experiment_subdir)
             logger.info("repository scan took %d seconds", time.monotonic()-t1)
             update_from_dict(self.explist, new_explist)
+            if self.examine_cache is not None:
+                self._save_examine_cache()
         finally:
             self._scanning = False
             self.status["scanning"] = False
 
-    def scan_repository_async(self, new_cur_rev=None, loop=None):
+    def scan_repository_async(self, new_cur_rev=None, full=False, loop=None):
         asyncio.ensure_future(
-            exc_to_warning(self.scan_repository(new_cur_rev)), loop=loop)
+            exc_to_warning(self.scan_repository(new_cur_rev, full)), loop=loop)
 
     async def examine(self, filename, use_repository=True, revision=None):
         if use_repository:
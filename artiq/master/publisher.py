@@ -0,0 +1,219 @@
+"""Server of the sync_struct notifiers of the master, with filtered
+subscriptions.
+
+Clients subscribe with the sipyco ``Subscriber``. Subscribing to the name of
+a notifier receives all its modifications, as with the sipyco ``Publisher``.
+The subscribers of dictionary notifiers (e.g. ``datasets``) may instead use
+the name returned by :func:`filtered_notifier_name`, and only receive the
+keys they are interested in. The modifications sent to such subscribers can
+also be rate-limited, in which case the modifications that are superseded by
+later ones before being sent are dropped.
+"""
+
+import asyncio
+import logging
+
+from sipyco.asyncio_tools import AsyncioServer
+from sipyco import pyon
+
+
+__all__ = ["filtered_notifier_name", "ModQueue", "Publisher"]
+
+
+logger = logging.getLogger(__name__)
+
+
+# Must match sipyco.sync_struct
+_PROTOCOL_BANNER = b"ARTIQ sync_struct\n"
+_FILTER_SEPARATOR = "?"
+
+
+def filtered_notifier_name(notifier_name, keys=(), prefixes=(),
+                           max_rate=None):
+    """Returns the name with which a ``Subscriber`` receives the keys of the
+    dictionary notifier ``notifier_name`` that are in ``keys`` or start with
+    one of ``prefixes``.
+
+    If ``max_rate`` is not ``None``, modifications are sent at most
+    ``max_rate`` times per second."""
+    spec = {"keys": list(keys), "prefixes": list(prefixes),
+            "max_rate": max_rate}
+    return notifier_name + _FILTER_SEPARATOR + pyon.encode(spec)
+
+
+def _mod_key(mod):
+    if mod["path"]:
+        return mod["path"][0]
+    return mod.get("key")
+
+
+class ModQueue:
+    """Queue of the modifications of a dictionary notifier waiting to be
+    sent, each with the data to be sent for it (typically, its encoding).
+
+    If ``coalesce`` is true, queueing a modification drops the queued
+    modifications it supersedes: those of a dataset that is replaced or
+    deleted, earlier assignments of the same element when no modification
+    in between could move or depend on it (appends move the elements that
+    negative indices refer to), and everything before an ``init``
+    modification."""
+    def __init__(self, coalesce=True):
+        self.coalesce = coalesce
+        self._items = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def _drop_superseded(self, mod):
+        if mod["action"] == "init":
+            self._items.clear()
+            return
+        key = _mod_key(mod)
+        path = mod["path"]
+        if not path:
+            # the whole value is replaced or deleted
+            self._items = [(m, d) for m, d in self._items
+                           if m["action"] == "init" or _mod_key(m) != key]
+        elif mod["action"] == "setitem":
+            # Appends do not move the elements with a non-negative index,
+            # but change those that negative indices and slices refer to.
+            index = mod["key"]
+            moves = not (isinstance(index, int) and index >= 0)
+            for i in range(len(self._items) - 1, -1, -1):
+                other = self._items[i][0]
+                if other["action"] == "init":
+                    break
+                if _mod_key(other) != key:
+                    continue
+                if (other["path"] != path
+                        or other["action"] not in {"setitem", "append"}
+                        or (other["action"] == "append" and moves)):
+                    break
+                if (other["action"] == "setitem"
+                        and other["key"] == mod["key"]):
+                    del self._items[i]
+                    break
+
+    def put(self, mod, data):
+        if self.coalesce:
+            self._drop_superseded(mod)
+        self._items.append((mod, data))
+
+    def clear(self):
+        self._items.clear()
+
+    def take(self):
+        """Removes all the queued modifications and returns them as a list
+        of ``(mod, data)`` pairs."""
+        items = self._items
+        self._items = []
+        return items
+
+
+class _Subscription:
+    def __init__(self, keys=None, prefixes=(), max_rate=None):
+        self.keys = None if keys is None else set(keys)
+        self.prefixes = list(prefixes)
+        if max_rate is None:
+            self.min_interval = 0.0
+        else:
+            self.min_interval = 1/max_rate
+        # modifications and their encodings
+        self.queue = ModQueue(coalesce=max_rate is not None)
+        self.event = asyncio.Event()
+
+    def is_subscribed(self, key):
+        if self.keys is None or key in self.keys:
+            return True
+        for prefix in self.prefixes:
+            if isinstance(key, str) and key.startswith(prefix):
+                return True
+        return False
+
+    def filter_struct(self, struct):
+        if self.keys is None:
+            return struct
+        return {k: v for k, v in struct.items() if self.is_subscribed(k)}
+
+    def accepts(self, mod):
+        if self.keys is None:
+            return True
+        return self.is_subscribed(_mod_key(mod))
+
+    def put(self, mod, line):
+        self.queue.put(mod, line)
+        self.event.set()
+
+    def take(self):
+        self.event.clear()
+        return [line for _, line in self.queue.take()]
+
+
+class Publisher(AsyncioServer):
+    """A sync_struct publisher, which accepts filtered subscriptions to its
+    dictionary notifiers in addition to the subscriptions of the sipyco
+    ``Publisher``.
+
+    :param notifiers: A dictionary of the notifiers to publish, with their
+        names as keys.
+    """
+    def __init__(self, notifiers):
+        AsyncioServer.__init__(self)
+        self.notifiers = notifiers
+        self._subscriptions = {name: set() for name in notifiers.keys()}
+        for name, notifier in notifiers.items():
+            notifier.publish = lambda mod, name=name: self.publish(name, mod)
+
+    def publish(self, notifier_name, mod):
+        line = None
+        for subscription in self._subscriptions[notifier_name]:
+            if subscription.accepts(mod):
+                if line is None:
+                    line = (pyon.encode(mod) + "\n").encode()
+                subscription.put(mod, line)
+
+    def _parse_name(self, name):
+        notifier_name, sep, spec = name.partition(_FILTER_SEPARATOR)
+        if not sep:
+            return notifier_name, _Subscription()
+        spec = pyon.decode(spec)
+        return notifier_name, _Subscription(spec["keys"], spec["prefixes"],
+                                            spec["max_rate"])
+
+    async def _handle_connection_cr(self, reader, writer):
+        try:
+            line = await reader.readline()
+            if line != _PROTOCOL_BANNER:
+                return
+            line = await reader.readline()
+            if not line:
+                return
+            try:
+                notifier_name, subscription = self._parse_name(
+                    line.decode()[:-1])
+                notifier = self.notifiers[notifier_name]
+            except:
+                logger.warning("invalid subscription %r", line,
+                               exc_info=True)
+                return
+
+            obj = {"action": "init",
+                   "struct": subscription.filter_struct(notifier.raw_view)}
+            writer.write((pyon.encode(obj) + "\n").encode())
+            subscriptions = self._subscriptions[notifier_name]
+            subscriptions.add(subscription)
+            try:
+                while True:
+                    await subscription.event.wait()
+                    writer.writelines(subscription.take())
+                    # raise exception on connection error
+                    await writer.drain()
+                    if subscription.min_interval:
+                        await asyncio.sleep(subscription.min_interval)
+            finally:
+                subscriptions.remove(subscription)
+        except (ConnectionError, TimeoutError):
+            # subscribers disconnecting are a normal occurrence
+            pass
+        finally:
+            writer.close()
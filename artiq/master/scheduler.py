@@ -1,4 +1,5 @@
 import asyncio
+import heapq
 import logging
 import csv
 import os.path
@@ -60,10 +61,14 @@ class Run:
         self.due_date = due_date
         self.flush = flush
 
-        self.worker = Worker(pool.worker_handlers)
-        self.termination_requested = False
+        self.worker = Worker(pool.worker_handlers,
+                             process_pool=pool.worker_pool)
+        self._termination_requested = False
 
         self._status = RunStatus.pending
+        # Maintained by _RunIndex
+        self._index_serial = 0
+        self._index_queue = None
 
         notification = {
             "pipeline": self.pipeline_name,
@@ -77,6 +82,8 @@ class Run:
         self._notifier = pool.notifier
         self._notifier[self.rid] = notification
         self._state_changed = pool.state_changed
+        self._index = pool.index
+        self._update_run_flags = pool.update_run_flags
 
     @property
     def status(self):
@@ -85,10 +92,21 @@ class Run:
     @status.setter
     def status(self, value):
         self._status = value
+        self._index.update(self)
+        self._update_run_flags(self)
         if not self.worker.closed.is_set():
             self._notifier[self.rid]["status"] = self._status.name
         self._state_changed.notify()
 
+    @property
+    def termination_requested(self):
+        return self._termination_requested
+
+    @termination_requested.setter
+    def termination_requested(self, value):
+        self._termination_requested = value
+        self._update_run_flags(self)
+
     def priority_key(self):
         """Return a comparable value that defines a run priority order.
 
@@ -114,16 +132,147 @@ class Run:
     analyze = _mk_worker_method("analyze")
 
 
+def _priority_order(run):
+    # Ascending order of this key is descending order of priority_key()
+    return -run.priority, run.due_date or 0, run.rid
+
+
+def _due_date_order(run):
+    return run.due_date, run.rid
+
+
+class _RunQueue:
+    """Heap of runs, of which the first in the given order is obtained in
+    logarithmic time.
+
+    Runs are removed by :meth:`_RunIndex.update` when their status changes,
+    which leaves a stale entry in the heap. Stale entries are dropped when
+    they reach the top of the heap, or when they make up most of it."""
+    def __init__(self, order):
+        self._order = order
+        self._heap = []
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def push(self, run):
+        # the order keys end with the RID, so runs are never compared
+        heapq.heappush(self._heap,
+                       (self._order(run), run._index_serial, run))
+        run._index_queue = self
+        self._count += 1
+
+    def discard(self, run):
+        run._index_queue = None
+        self._count -= 1
+        if len(self._heap) > 2*self._count + 64:
+            self._heap = [entry for entry in self._heap
+                          if entry[2]._index_queue is self
+                          and entry[2]._index_serial == entry[1]]
+            heapq.heapify(self._heap)
+
+    def peek(self):
+        heap = self._heap
+        while heap and not (heap[0][2]._index_queue is self
+                            and heap[0][2]._index_serial == heap[0][1]):
+            heapq.heappop(heap)
+        if heap:
+            return heap[0][2]
+        return None
+
+    def pop(self):
+        run = self.peek()
+        if run is not None:
+            heapq.heappop(self._heap)
+            self.discard(run)
+        return run
+
+
+class _RunIndex:
+    """Indexes the runs of a pool by status, so that the stages select their
+    next run without scanning the whole pool.
+
+    Pending runs whose due date has not elapsed yet are kept by due date,
+    and moved to the pending runs ordered by priority once it has."""
+    def __init__(self):
+        self.running = set()
+        self._waiting = _RunQueue(_due_date_order)
+        self._queues = {
+            RunStatus.pending: _RunQueue(_priority_order),
+            RunStatus.prepare_done: _RunQueue(_priority_order),
+            RunStatus.run_done: _RunQueue(_priority_order)
+        }
+
+    def update(self, run):
+        """Must be called when a run is created or changes status."""
+        run._index_serial += 1
+        if run._index_queue is not None:
+            run._index_queue.discard(run)
+        if run.status == RunStatus.running:
+            self.running.add(run)
+        else:
+            self.running.discard(run)
+        if (run.status == RunStatus.pending
+                and run.due_date is not None and run.due_date >= time()):
+            self._waiting.push(run)
+        elif run.status in self._queues:
+            self._queues[run.status].push(run)
+
+    def get_best(self, status):
+        """Returns the run with the given status (pending, prepare_done or
+        run_done) with the highest :meth:`Run.priority_key`, or ``None``.
+
+        For pending runs, only the runs whose due date has elapsed at
+        ``now`` are considered."""
+        if status == RunStatus.pending:
+            now = time()
+            while True:
+                run = self._waiting.peek()
+                if run is None or run.due_date >= now:
+                    break
+                self._waiting.pop()
+                self._queues[RunStatus.pending].push(run)
+        return self._queues[status].peek()
+
+    def get_next_due_date(self):
+        """Returns the earliest due date that has not elapsed yet of the
+        pending runs, or ``None``."""
+        run = self._waiting.peek()
+        if run is None:
+            return None
+        return run.due_date
+
+
 class RunPool:
-    def __init__(self, ridc, worker_handlers, notifier, experiment_db, log_submissions):
+    def __init__(self, ridc, worker_handlers, notifier, experiment_db, log_submissions,
+                 worker_pool=None):
         self.runs = dict()
         self.state_changed = Condition()
+        self.index = _RunIndex()
 
         self.ridc = ridc
         self.worker_handlers = worker_handlers
         self.notifier = notifier
         self.experiment_db = experiment_db
         self.log_submissions = log_submissions
+        self.worker_pool = worker_pool
+
+    def update_run_flags(self, changed=None):
+        """Updates the flags read by the worker processes of the running
+        runs, and of the run ``changed`` whose status or termination request
+        has changed, to answer ``check_pause`` and ``check_termination``
+        locally, as :class:`Scheduler` does."""
+        prepared = self.index.get_best(RunStatus.prepare_done)
+        runs = self.index.running
+        if changed is not None and changed not in runs:
+            runs = list(runs) + [changed]
+        for run in runs:
+            check_pause = run.status == RunStatus.running and (
+                run.termination_requested or (
+                    prepared is not None
+                    and prepared.priority_key() > run.priority_key()))
+            run.worker.set_run_flags(check_pause, run.termination_requested)
 
     def log_submission(self, rid, expid):
         start_time = time()
@@ -156,6 +305,7 @@ class RunPool:
 
         run = Run(rid, pipeline_name, wd, expid, priority, due_date, flush,
                   self, repo_msg=repo_msg)
+        self.index.update(run)
         if self.log_submissions is not None:
             self.log_submission(rid, expid)
         self.runs[rid] = run
@@ -183,33 +333,23 @@ class PrepareStage(TaskObject):
         float giving the time until the next check, or None if no time-based
         check is required.
 
-        The latter can be the case if there are no due-date runs, or none
-        of them are going to become next-in-line before further pool state
-        changes (which will also cause a re-evaluation).
+        The latter is the case if there are no due-date runs. Other pool
+        state changes also cause a re-evaluation.
         """
-        pending_runs = list(
-            filter(lambda r: r.status == RunStatus.pending,
-                   self.pool.runs.values()))
-
-        now = time()
-        def is_runnable(r):
-            return (r.due_date or 0) < now
-
-        prepared_max = max((r.priority_key() for r in self.pool.runs.values()
-                            if r.status == RunStatus.prepare_done),
-                           default=None)
-        def takes_precedence(r):
-            return prepared_max is None or r.priority_key() > prepared_max
-
-        candidate = max(filter(is_runnable, pending_runs),
-                        key=lambda r: r.priority_key(),
-                        default=None)
-        if candidate is not None and takes_precedence(candidate):
+        index = self.pool.index
+        prepared = index.get_best(RunStatus.prepare_done)
+        candidate = index.get_best(RunStatus.pending)
+        if candidate is not None and (
+                prepared is None
+                or candidate.priority_key() > prepared.priority_key()):
             return candidate
 
-        return min((r.due_date - now for r in pending_runs
-                    if (not is_runnable(r) and takes_precedence(r))),
-                   default=None)
+        # This may be earlier than necessary, if the next due run does not
+        # take precedence over the prepared run. It is then re-evaluated.
+        due_date = index.get_next_due_date()
+        if due_date is None:
+            return None
+        return max(due_date - time(), 0.0)
 
     async def _do(self):
         while True:
@@ -254,14 +394,7 @@ class RunStage(TaskObject):
         self.delete_cb = delete_cb
 
     def _get_run(self):
-        prepared_runs = filter(lambda r: r.status == RunStatus.prepare_done,
-                               self.pool.runs.values())
-        try:
-            r = max(prepared_runs, key=lambda r: r.priority_key())
-        except ValueError:
-            # prepared_runs is an empty sequence
-            r = None
-        return r
+        return self.pool.index.get_best(RunStatus.prepare_done)
 
     async def _do(self):
         stack = []
@@ -308,14 +441,7 @@ class AnalyzeStage(TaskObject):
         self.delete_cb = delete_cb
 
     def _get_run(self):
-        run_runs = filter(lambda r: r.status == RunStatus.run_done,
-                          self.pool.runs.values())
-        try:
-            r = max(run_runs, key=lambda r: r.priority_key())
-        except ValueError:
-            # run_runs is an empty sequence
-            r = None
-        return r
+        return self.pool.index.get_best(RunStatus.run_done)
 
     async def _do(self):
         while True:
@@ -334,8 +460,10 @@ class AnalyzeStage(TaskObject):
 
 
 class Pipeline:
-    def __init__(self, ridc, deleter, worker_handlers, notifier, experiment_db, log_submissions):
-        self.pool = RunPool(ridc, worker_handlers, notifier, experiment_db, log_submissions)
+    def __init__(self, ridc, deleter, worker_handlers, notifier, experiment_db, log_submissions,
+                 worker_pool=None):
+        self.pool = RunPool(ridc, worker_handlers, notifier, experiment_db, log_submissions,
+                            worker_pool)
         self._prepare = PrepareStage(self.pool, deleter.delete)
         self._run = RunStage(self.pool, deleter.delete)
         self._analyze = AnalyzeStage(self.pool, deleter.delete)
@@ -406,7 +534,8 @@ class Deleter(TaskObject):
 
 
 class Scheduler:
-    def __init__(self, ridc, worker_handlers, experiment_db, log_submissions):
+    def __init__(self, ridc, worker_handlers, experiment_db, log_submissions,
+                 worker_pool=None):
         self.notifier = Notifier(dict())
 
         self._pipelines = dict()
@@ -417,6 +546,7 @@ class Scheduler:
         self._ridc = ridc
         self._deleter = Deleter(self._pipelines)
         self._log_submissions = log_submissions
+        self._worker_pool = worker_pool
 
     def start(self, *, loop=None):
         self._loop = loop
@@ -449,7 +579,8 @@ class Scheduler:
             logger.debug("creating pipeline '%s'", pipeline_name)
             pipeline = Pipeline(self._ridc, self._deleter,
                                 self._worker_handlers, self.notifier,
-                                self._experiment_db, self._log_submissions)
+                                self._experiment_db, self._log_submissions,
+                                self._worker_pool)
             self._pipelines[pipeline_name] = pipeline
             pipeline.start(loop=self._loop)
         return pipeline.pool.submit(expid, priority, due_date, flush, pipeline_name)
@@ -487,6 +618,10 @@ class Scheduler:
 
         This function does not have side effects, and does not have to be
         followed by a call to :meth:`pause`.
+
+        The worker of a run answers this function for its own RID from
+        flags in shared memory, which the master keeps up to date, without
+        sending a request to the master.
         """
         for pipeline in self._pipelines.values():
             if rid in pipeline.pool.runs:
@@ -496,12 +631,8 @@ class Scheduler:
                 if run.termination_requested:
                     return True
 
-                prepared_runs = filter(lambda r: r.status == RunStatus.prepare_done,
-                                       pipeline.pool.runs.values())
-                try:
-                    r = max(prepared_runs, key=lambda r: r.priority_key())
-                except ValueError:
-                    # prepared_runs is an empty sequence
+                r = pipeline.pool.index.get_best(RunStatus.prepare_done)
+                if r is None:
                     return False
                 return r.priority_key() > run.priority_key()
         raise KeyError("RID not found")
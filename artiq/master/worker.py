@@ -4,12 +4,15 @@ import asyncio
 import logging
 import subprocess
 import time
+from collections import deque
 
 from sipyco import pipe_ipc, pyon
 from sipyco.logs import LogParser
 from sipyco.packed_exceptions import current_exc_packed
+from sipyco.tools import TaskObject
 
 from artiq.tools import asyncio_wait_or_cancel
+from artiq.master import worker_ipc
 
 
 logger = logging.getLogger(__name__)
@@ -41,15 +44,80 @@ def log_worker_exception():
         logger.error("worker exception details", exc_info=True)
 
 
+class _WorkerProcess:
+    def __init__(self):
+        self.ipc = None
+        self.runs = 0
+        # Callable returning the log source; set by the Worker that is
+        # currently using the process.
+        self.log_source = None
+        # Set when the process has accepted the binary framing of messages
+        self.binary_ipc = False
+
+    def _get_log_source(self):
+        if self.log_source is None:
+            return "worker(pool)"
+        return self.log_source()
+
+    async def create(self, log_level):
+        self.ipc = pipe_ipc.AsyncioParentComm()
+        env = os.environ.copy()
+        env["PYTHONUNBUFFERED"] = "1"
+        await self.ipc.create_subprocess(
+            sys.executable, "-m", "artiq.master.worker_impl",
+            self.ipc.get_address(), str(log_level), "binary-ipc",
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            env=env, start_new_session=True)
+        asyncio.ensure_future(
+            LogParser(self._get_log_source).stream_task(
+                self.ipc.process.stdout))
+        asyncio.ensure_future(
+            LogParser(self._get_log_source).stream_task(
+                self.ipc.process.stderr))
+
+    def write(self, obj):
+        for chunk in worker_ipc.encode(obj, self.binary_ipc):
+            self.ipc.write(chunk)
+
+    async def _read_exactly(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            data = await self.ipc.read(n - len(buf))
+            if not data:
+                raise EOFError("worker closed the connection")
+            buf += data
+        return buf
+
+    async def read(self):
+        """Returns the next message from the worker process, or ``None`` if
+        it has closed the connection."""
+        while True:
+            line = await self.ipc.readline()
+            if not line:
+                return None
+            obj = await worker_ipc.decode_async(line, self._read_exactly)
+            if obj["action"] == "hello":
+                self.binary_ipc = obj["binary_ipc"]
+                continue
+            return obj
+
+
 class Worker:
-    def __init__(self, handlers=dict(), send_timeout=10.0):
+    def __init__(self, handlers=dict(), send_timeout=10.0, process_pool=None):
         self.handlers = handlers
         self.send_timeout = send_timeout
+        self.process_pool = process_pool
 
         self.rid = None
         self.filename = None
         self.ipc = None
+        self._process = None
+        # True while the worker process waits for the next action, i.e.
+        # when it could be handed back to the process pool.
+        self._process_idle = False
         self.watchdogs = dict()  # wid -> expiration (using time.monotonic)
+        # Shared with the worker process from the build stage on
+        self.run_flags = None
 
         self.io_lock = asyncio.Lock()
         self.closed = asyncio.Event()
@@ -67,6 +135,13 @@ class Worker:
     def delete_watchdog(self, wid):
         del self.watchdogs[wid]
 
+    def update_datasets(self, mods):
+        # Batches of modifications sent by the worker are applied in a
+        # single request, through the usual per-modification handler.
+        update = self.handlers["update_dataset"]
+        for mod in mods:
+            update(mod)
+
     def watchdog_time(self):
         if self.watchdogs:
             return min(self.watchdogs.values()) - time.monotonic()
@@ -83,20 +158,14 @@ class Worker:
         try:
             if self.closed.is_set():
                 raise WorkerError("Attempting to create process after close")
-            self.ipc = pipe_ipc.AsyncioParentComm()
-            env = os.environ.copy()
-            env["PYTHONUNBUFFERED"] = "1"
-            await self.ipc.create_subprocess(
-                sys.executable, "-m", "artiq.master.worker_impl",
-                self.ipc.get_address(), str(log_level),
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                env=env, start_new_session=True)
-            asyncio.ensure_future(
-                LogParser(self._get_log_source).stream_task(
-                    self.ipc.process.stdout))
-            asyncio.ensure_future(
-                LogParser(self._get_log_source).stream_task(
-                    self.ipc.process.stderr))
+            if self.process_pool is not None:
+                self._process = await self.process_pool.lease(
+                    self._get_log_source)
+            else:
+                self._process = _WorkerProcess()
+                self._process.log_source = self._get_log_source
+                await self._process.create(log_level)
+            self.ipc = self._process.ipc
         finally:
             self.io_lock.release()
 
@@ -120,6 +189,11 @@ class Worker:
                                    " (RID %s)", self.ipc.process.returncode,
                                    self.rid)
                 return
+            if self.process_pool is not None and self._process_idle:
+                logger.debug("returning worker process to pool (RID %s)",
+                             self.rid)
+                self.process_pool.release(self._process)
+                return
             try:
                 await self._send({"action": "terminate"}, cancellable=False)
                 await asyncio.wait_for(self.ipc.process.wait(), term_timeout)
@@ -154,11 +228,24 @@ class Worker:
                 logger.warning("worker refuses to die (RID %s)", self.rid)
         finally:
             self.io_lock.release()
+            if self.run_flags is not None:
+                self.run_flags.close()
+                self.run_flags = None
+
+    def set_run_flags(self, check_pause, termination_requested):
+        """Updates the state of the run that the worker process reads
+        locally, to answer ``check_pause`` and ``check_termination``."""
+        if self.run_flags is not None:
+            self.run_flags.check_pause = check_pause
+            self.run_flags.termination_requested = termination_requested
 
     async def _send(self, obj, cancellable=True):
         assert self.io_lock.locked()
-        line = pyon.encode(obj)
-        self.ipc.write((line + "\n").encode())
+        if self._process is not None:
+            self._process.write(obj)
+        else:
+            line = pyon.encode(obj)
+            self.ipc.write((line + "\n").encode())
         ifs = [self.ipc.drain()]
         if cancellable:
             ifs.append(self.closed.wait())
@@ -179,7 +266,7 @@ class Worker:
     async def _recv(self, timeout):
         assert self.io_lock.locked()
         fs = await asyncio_wait_or_cancel(
-            [self.ipc.readline(), self.closed.wait()],
+            [self._process.read(), self.closed.wait()],
             timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
         if all(f.cancelled() for f in fs):
             raise WorkerTimeout(
@@ -188,16 +275,17 @@ class Worker:
             raise WorkerError(
                 "Receiving data from worker cancelled (RID {})".format(
                     self.rid))
-        line = fs[0].result()
-        if not line:
-            raise WorkerError(
-                "Worker ended while attempting to receive data (RID {})".
-                format(self.rid))
         try:
-            obj = pyon.decode(line.decode())
+            obj = fs[0].result()
+        except EOFError:
+            obj = None
         except:
-            raise WorkerError("Worker sent invalid PYON data (RID {})".format(
+            raise WorkerError("Worker sent invalid data (RID {})".format(
                 self.rid))
+        if obj is None:
+            raise WorkerError(
+                "Worker ended while attempting to receive data (RID {})".
+                format(self.rid))
         return obj
 
     async def _handle_worker_requests(self):
@@ -212,6 +300,7 @@ class Worker:
                 raise WorkerWatchdogTimeout
             action = obj["action"]
             if action == "completed":
+                self._process_idle = True
                 return True
             elif action == "pause":
                 return False
@@ -223,6 +312,13 @@ class Worker:
                 func = self.delete_watchdog
             elif action == "register_experiment":
                 func = self.register_experiment
+            elif action == "register_dependencies":
+                func = self.register_dependencies
+            elif action == "update_datasets":
+                func = self.update_datasets
+            elif action == "get_hdf5_options":
+                # optional handler, without default storage options
+                func = self.handlers.get(action, dict)
             else:
                 func = self.handlers[action]
             try:
@@ -251,6 +347,7 @@ class Worker:
         try:
             await self.io_lock.acquire()
             try:
+                self._process_idle = False
                 await self._send(obj)
             finally:
                 self.io_lock.release()
@@ -269,13 +366,15 @@ class Worker:
         if "file" in expid:
             self.filename = os.path.basename(expid["file"])
         await self._create_process(expid["log_level"])
+        self.run_flags = worker_ipc.RunFlags()
         await self._worker_action(
             {"action": "build",
              "rid": rid,
              "pipeline_name": pipeline_name,
              "wd": wd,
              "expid": expid,
-             "priority": priority},
+             "priority": priority,
+             "run_flags": self.run_flags.name},
             timeout)
 
     async def prepare(self):
@@ -300,7 +399,14 @@ class Worker:
     async def analyze(self):
         await self._worker_action({"action": "analyze"})
 
-    async def examine(self, rid, file, timeout=20.0):
+    async def examine(self, rid, file, timeout=20.0,
+                      return_dependencies=False):
+        """Examines the experiment file and returns a dictionary describing
+        the experiments it contains.
+
+        If ``return_dependencies`` is set, a ``(description, dependencies)``
+        pair is returned instead, where ``dependencies`` is the list of the
+        files of the modules imported by the experiment file."""
         self.rid = rid
         self.filename = os.path.basename(file)
 
@@ -315,8 +421,163 @@ class Worker:
                 "argument_ui": argument_ui,
                 "scheduler_defaults": scheduler_defaults
             }
+        dependencies = []
         self.register_experiment = register
+        self.register_dependencies = dependencies.extend
         await self._worker_action({"action": "examine", "file": file},
                                   timeout)
         del self.register_experiment
+        del self.register_dependencies
+        if return_dependencies:
+            return r, dependencies
         return r
+
+
+class WorkerPool(TaskObject):
+    """Keeps a number of idle worker processes ready, so that runs do not
+    have to wait for a new interpreter to start and import NumPy, h5py and
+    the ARTIQ compiler before the build stage.
+
+    Processes are leased by :class:`Worker` instances created with the
+    ``process_pool`` argument. When such a worker is closed after its
+    experiment has completed normally, the process is handed back to the
+    pool, which resets it and keeps it for another run unless it has already
+    executed ``max_runs`` runs or reports that the experiment left modules
+    behind that cannot safely be unloaded. All other processes are retired.
+
+    :param size: Number of idle processes to keep ready.
+    :param max_runs: Number of runs after which a process is retired. With
+        the default of 1, every run still gets a fresh process and the pool
+        only hides the start-up latency.
+    :param log_level: Log level of idle processes. It is overridden by the
+        log level of the experiment when the process is leased.
+    """
+    def __init__(self, size, max_runs=1, log_level=logging.WARNING,
+                 reset_timeout=10.0):
+        self.size = size
+        self.max_runs = max_runs
+        self.log_level = log_level
+        self.reset_timeout = reset_timeout
+
+        self._idle = deque()
+        self._returned = deque()
+        self._wakeup = asyncio.Event()
+        self._stopped = False
+
+        self._leases = 0
+        self._hits = 0
+        self._recycled = 0
+        self._retired = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    async def lease(self, log_source):
+        """Returns an idle worker process, creating a new one if the pool is
+        empty."""
+        t0 = time.monotonic()
+        process = None
+        while self._idle:
+            candidate = self._idle.popleft()
+            if candidate.ipc.process.returncode is None:
+                process = candidate
+                break
+            logger.warning("idle pooled worker died with status code %s",
+                           candidate.ipc.process.returncode)
+        pooled = process is not None
+        if pooled:
+            self._hits += 1
+        else:
+            process = _WorkerProcess()
+            await process.create(self.log_level)
+        process.log_source = log_source
+        process.runs += 1
+        self._wakeup.set()
+
+        latency = time.monotonic() - t0
+        self._leases += 1
+        self._latency_total += latency
+        self._latency_max = max(self._latency_max, latency)
+        logger.debug("leased %s worker process in %.3f s",
+                     "pooled" if pooled else "new", latency)
+        return process
+
+    def release(self, process):
+        """Hands a worker process back to the pool. The process must be idle,
+        i.e. waiting for the next action from the master."""
+        process.log_source = None
+        if self._stopped:
+            asyncio.ensure_future(self._retire(process))
+        else:
+            self._returned.append(process)
+            self._wakeup.set()
+
+    def get_stats(self):
+        """Returns lease statistics, which help choosing the pool size.
+
+        ``hits`` counts the leases served by an already running process,
+        the remaining leases had to wait for a new process to be created."""
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "leases": self._leases,
+            "hits": self._hits,
+            "recycled": self._recycled,
+            "retired": self._retired,
+            "lease_latency_mean": (self._latency_total / self._leases
+                                   if self._leases else None),
+            "lease_latency_max": self._latency_max
+        }
+
+    async def _reset(self, process):
+        process.write({"action": "reset"})
+        await asyncio.wait_for(process.ipc.drain(), self.reset_timeout)
+        reply = await asyncio.wait_for(process.read(), self.reset_timeout)
+        if reply is None:
+            return False
+        return reply["action"] == "completed" and reply["clean"]
+
+    async def _retire(self, process):
+        self._retired += 1
+        worker = Worker()
+        worker.rid = "pool"
+        worker.ipc = process.ipc
+        await worker.close()
+
+    async def _recycle(self, process):
+        if process.runs < self.max_runs and len(self._idle) < self.size:
+            try:
+                clean = await self._reset(process)
+            except Exception:
+                logger.debug("failed to reset pooled worker", exc_info=True)
+                clean = False
+            if clean:
+                self._recycled += 1
+                self._idle.append(process)
+                return
+            logger.debug("pooled worker not reusable, retiring")
+        await self._retire(process)
+
+    async def _do(self):
+        while True:
+            self._wakeup.clear()
+            while self._returned:
+                await self._recycle(self._returned.popleft())
+            while len(self._idle) < self.size:
+                process = _WorkerProcess()
+                try:
+                    await process.create(self.log_level)
+                except Exception:
+                    logger.error("failed to create pooled worker",
+                                 exc_info=True)
+                    break
+                self._idle.append(process)
+            await self._wakeup.wait()
+
+    async def stop(self):
+        await TaskObject.stop(self)
+        self._stopped = True
+        processes = list(self._idle) + list(self._returned)
+        self._idle.clear()
+        self._returned.clear()
+        for process in processes:
+            await self._retire(process)
@@ -4,10 +4,12 @@ These artefacts are intended for out-of-process use (i.e. from workers or the
 standalone command line tools).
 """
 
-from operator import setitem
+from operator import setitem, index as operator_index
 import importlib
 import logging
+import time
 
+import numpy
 from sipyco.sync_struct import Notifier
 from sipyco.pc_rpc import AutoTarget, Client, BestEffortClient
 
@@ -15,6 +17,11 @@ from sipyco.pc_rpc import AutoTarget, Client, BestEffortClient
 logger = logging.getLogger(__name__)
 
 
+# Smaller arrays are written without the default HDF5 storage options, as
+# chunking and filters would only make them larger.
+MIN_FILTERED_SIZE = 4096
+
+
 class DummyDevice:
     pass
 
@@ -122,11 +129,24 @@ class DatasetManager:
         self.local = dict()
         self.archive = dict()
         self.metadata = dict()
+        # key -> storage options of the archived dataset in the HDF5 file
+        self.hdf5_options = dict()
+        # Options of the archived NumPy arrays without specific options
+        self.default_hdf5_options = dict()
 
         self.ddb = ddb
         self._broadcaster.publish = ddb.update
 
-    def set(self, key, value, metadata, broadcast, persist, archive):
+        # HDF5 file the archived datasets are streamed to, if any
+        self.hdf5_stream = None
+        # key -> indices of the elements to write, or None to rewrite the
+        # whole dataset
+        self._stream_pending = dict()
+        self._stream_flush_period = None
+        self._stream_last_flush = None
+
+    def set(self, key, value, metadata, broadcast, persist, archive,
+            hdf5_options=None):
         if persist:
             broadcast = True
 
@@ -144,6 +164,11 @@ class DatasetManager:
             del self.local[key]
         
         self.metadata[key] = metadata
+        if hdf5_options is None:
+            self.hdf5_options.pop(key, None)
+        else:
+            self.hdf5_options[key] = hdf5_options
+        self._stream_modified(key, rewrite=True)
 
     def _get_mutation_target(self, key):
         target = self.local.get(key, None)
@@ -162,10 +187,22 @@ class DatasetManager:
                 index = tuple(slice(*e) for e in index)
             else:
                 index = slice(*index)
+        if isinstance(target, (list, numpy.ndarray)):
+            length = len(target)
+        else:
+            length = None
         setitem(target, index, value)
+        # The modification is written to the HDF5 stream after any later
+        # appends, so indices relative to the end are made absolute.
+        if length is not None and len(target) == length:
+            index = _absolute_index(index, length)
+        else:
+            index = None
+        self._stream_modified(key, rewrite=index is None, index=index)
 
     def append_to(self, key, value):
         self._get_mutation_target(key).append(value)
+        self._stream_modified(key)
 
     def get(self, key, archive=False):
         if key in self.local:
@@ -188,21 +225,182 @@ class DatasetManager:
         datasets_group = f.create_group("datasets")
         for k, v in self.local.items():
             m = self.metadata.get(k, {})
-            _write(datasets_group, k, v, m)
+            _write(datasets_group, k, v, m, self._get_hdf5_options(k, v))
 
         archive_group = f.create_group("archive")
         for k, v in self.archive.items():
             m = self.metadata.get(k, {})
-            _write(archive_group, k, v, m)
+            _write(archive_group, k, v, m, self._get_hdf5_options(k, v))
+
+    def _get_hdf5_options(self, key, value):
+        if key in self.hdf5_options:
+            return self.hdf5_options[key]
+        # Filters and chunking only make sense for arrays
+        if (self.default_hdf5_options
+                and isinstance(value, (list, numpy.ndarray))):
+            try:
+                a = numpy.asarray(value)
+            except ValueError:
+                return {}
+            if (a.dtype.kind in "biufc" and a.ndim
+                    and a.nbytes >= MIN_FILTERED_SIZE):
+                return self.default_hdf5_options
+        return {}
+
+    def start_hdf5_stream(self, f, flush_period=5.0):
+        """Writes the archived datasets to the HDF5 file ``f`` while the
+        experiment runs, instead of all at once with :meth:`write_hdf5`.
+
+        Datasets are created in resizable storage, to which the elements
+        added by :meth:`append_to` are appended. The modifications are
+        written and the file is flushed at most every ``flush_period``
+        seconds, when datasets are modified, and by
+        :meth:`flush_hdf5_stream`. :meth:`finish_hdf5_stream` completes the
+        file, so that it holds the same data as with :meth:`write_hdf5`."""
+        f.create_group("datasets")
+        f.create_group("archive")
+        self.hdf5_stream = f
+        self._stream_pending = {key: None for key in self.local}
+        self._stream_flush_period = flush_period
+        self.flush_hdf5_stream()
+
+    def _stream_modified(self, key, rewrite=False, index=None):
+        if self.hdf5_stream is None:
+            return
+        if rewrite:
+            self._stream_pending[key] = None
+        else:
+            indices = self._stream_pending.setdefault(key, [])
+            if indices is not None and index is not None:
+                indices.append(index)
+        if (time.monotonic() - self._stream_last_flush
+                >= self._stream_flush_period):
+            self.flush_hdf5_stream()
+
+    def flush_hdf5_stream(self, final=False):
+        """Writes the pending modifications of the archived datasets to the
+        HDF5 stream and flushes the file.
+
+        Datasets that cannot be written are kept pending until the next
+        flush, unless ``final`` is true, in which case the error is
+        raised."""
+        group = self.hdf5_stream["datasets"]
+        pending = self._stream_pending
+        self._stream_pending = dict()
+        for key, indices in pending.items():
+            if key not in self.local:
+                if key in group:
+                    del group[key]
+                continue
+            value = self.local[key]
+            if (indices is not None
+                    and _write_increment(group, key, value, indices)):
+                continue
+            if key in group:
+                del group[key]
+            try:
+                _write(group, key, value, self.metadata.get(key, {}),
+                       self._get_hdf5_options(key, value), resizable=True)
+            except TypeError:
+                if final:
+                    raise
+                # e.g. a list whose elements do not have the same shape
+                # yet
+                self._stream_pending[key] = None
+        self.hdf5_stream.flush()
+        self._stream_last_flush = time.monotonic()
+
+    def finish_hdf5_stream(self):
+        """Writes the remaining modifications and the archive to the HDF5
+        stream, stops streaming, and returns the file."""
+        self.flush_hdf5_stream(final=True)
+        f = self.hdf5_stream
+        archive_group = f["archive"]
+        for k, v in self.archive.items():
+            m = self.metadata.get(k, {})
+            _write(archive_group, k, v, m, self._get_hdf5_options(k, v))
+        self.hdf5_stream = None
+        return f
 
 
-def _write(group, k, v, m):
+def _write(group, k, v, m, options={}, resizable=False):
     # Add context to exception message when the user writes a dataset that is
     # not representable in HDF5.
     try:
-        group[k] = v
+        if options or (resizable and isinstance(v, (list, numpy.ndarray))):
+            try:
+                a = numpy.asarray(v)
+            except ValueError as e:
+                raise TypeError(str(e)) from e
+            options = dict(options)
+            if (resizable and a.ndim and len(a)
+                    and a.dtype.kind in "biufc"):
+                options.setdefault("chunks", True)
+                options["maxshape"] = (None, ) + a.shape[1:]
+            if options:
+                group.create_dataset(k, data=a, **options)
+            else:
+                group[k] = v
+        else:
+            group[k] = v
         for key, val in m.items():
             group[k].attrs[key] = val
     except TypeError as e:
         raise TypeError("Error writing dataset '{}' of type '{}': {}".format(
             k, type(v), e))
+
+
+def _absolute_index(index, length):
+    # Returns the index of a sequence of the given length as one that does
+    # not depend on its length, or None if there is no such index.
+    if isinstance(index, tuple):
+        if not index:
+            return None
+        first = _absolute_index(index[0], length)
+        if first is None:
+            return None
+        return (first, ) + index[1:]
+    if isinstance(index, slice):
+        start, stop, step = index.indices(length)
+        if stop < 0:
+            # reversed slice down to and including the first element
+            stop = None
+        return slice(start, stop, step)
+    try:
+        index = operator_index(index)
+    except TypeError:
+        return None
+    if index < 0:
+        index += length
+    return index
+
+
+def _write_increment(group, k, v, indices):
+    # Writes the elements appended to the list or array v since the dataset
+    # was last written, and the elements at the given indices. Returns False
+    # if the dataset has to be rewritten, i.e. if its storage is not
+    # resizable or the new elements would change its type or shape.
+    dataset = group.get(k)
+    if (not isinstance(v, (list, numpy.ndarray))
+            or dataset is None or dataset.maxshape[:1] != (None, )
+            or not dataset.shape[0] or len(v) < dataset.shape[0]):
+        return False
+    n = dataset.shape[0]
+    try:
+        if len(v) > n:
+            tail = numpy.asarray(v[n:])
+            if (tail.shape[1:] != dataset.shape[1:]
+                    or numpy.result_type(dataset.dtype, tail.dtype)
+                    != dataset.dtype):
+                return False
+            dataset.resize(len(v), axis=0)
+            dataset[n:] = tail
+        for index in indices:
+            element = numpy.asarray(v[index])
+            if (numpy.result_type(dataset.dtype, element.dtype)
+                    != dataset.dtype):
+                return False
+            dataset[index] = element
+    except (TypeError, ValueError, IndexError):
+        return False
+    return True
@@ -26,6 +26,7 @@ from sipyco.logs import multiline_log_config
 import artiq
 from artiq import tools
 from artiq.master.worker_db import DeviceManager, DatasetManager, DummyDevice
+from artiq.master import worker_ipc
 from artiq.language.environment import (
     is_public_experiment, TraceArgumentManager, ProcessArgumentManager
 )
@@ -38,53 +39,91 @@ from artiq import __version__ as artiq_version
 
 ipc = None
 ipc_lock = threading.Lock()
+# Set when the master has offered the binary framing of messages
+binary_ipc = False
+
+
+def _read_exactly(n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    position = 0
+    while position < n:
+        data = ipc.read(n - position)
+        if not data:
+            raise EOFError("master closed the connection")
+        view[position:position + len(data)] = data
+        position += len(data)
+    return buf
+
+
+def _write(chunks):
+    for chunk in chunks:
+        view = memoryview(chunk)
+        while view:
+            written = ipc.write(view)
+            if written is None:
+                break
+            view = view[written:]
+
+
+def _read_object():
+    return worker_ipc.decode(ipc.readline(), _read_exactly)
 
 
 def get_object():
     ipc_lock.acquire()
     try:
-        line = ipc.readline()
+        return _read_object()
     finally:
         ipc_lock.release()
-    return pyon.decode(line.decode())
 
 
 def put_object(obj):
-    ds = (pyon.encode(obj) + "\n").encode()
+    chunks = worker_ipc.encode(obj, binary_ipc)
     ipc_lock.acquire()
     try:
-        ipc.write(ds)
+        _write(chunks)
     finally:
         ipc_lock.release()
 
 
 def put_and_get_object(obj):
-    ds = (pyon.encode(obj) + "\n").encode()
+    chunks = worker_ipc.encode(obj, binary_ipc)
     ipc_lock.acquire()
     try:
-        ipc.write(ds)
-        line = ipc.readline()
+        _write(chunks)
+        return _read_object()
     finally:
         ipc_lock.release()
-    return pyon.decode(line.decode())
+
+
+def request_parent(action, args, kwargs):
+    request = {"action": action, "args": args, "kwargs": kwargs}
+    reply = put_and_get_object(request)
+    if "action" in reply:
+        if reply["action"] == "terminate":
+            sys.exit()
+        else:
+            raise ValueError
+    if reply["status"] == "ok":
+        return reply["data"]
+    else:
+        raise_packed_exc(reply["exception"])
 
 
 def make_parent_action(action):
     def parent_action(*args, **kwargs):
-        request = {"action": action, "args": args, "kwargs": kwargs}
-        reply = put_and_get_object(request)
-        if "action" in reply:
-            if reply["action"] == "terminate":
-                sys.exit()
-            else:
-                raise ValueError
-        if reply["status"] == "ok":
-            return reply["data"]
-        else:
-            raise_packed_exc(reply["exception"])
+        # Keep the requests ordered after the pending dataset modifications,
+        # e.g. so that datasets read back from the master are up to date.
+        dataset_mods.flush()
+        return request_parent(action, args, kwargs)
     return parent_action
 
 
+dataset_mods = worker_ipc.DatasetModBatcher(
+    lambda mods: request_parent("update_datasets", (mods, ), {}))
+
+
 class ParentDeviceDB:
     get_device_db = make_parent_action("get_device_db")
     get = make_parent_action("get_device")
@@ -92,8 +131,9 @@ class ParentDeviceDB:
 
 class ParentDatasetDB:
     get = make_parent_action("get_dataset")
-    update = make_parent_action("update_dataset")
+    update = dataset_mods.update
     get_metadata = make_parent_action("get_dataset_metadata")
+    get_hdf5_options = make_parent_action("get_hdf5_options")
 
 
 class Watchdog:
@@ -114,11 +154,16 @@ set_watchdog_factory(Watchdog)
 
 
 class Scheduler:
-    def set_run_info(self, rid, pipeline_name, expid, priority):
+    # worker_ipc.RunFlags of the current run, written by the master
+    run_flags = None
+
+    def set_run_info(self, rid, pipeline_name, expid, priority,
+                     run_flags=None):
         self.rid = rid
         self.pipeline_name = pipeline_name
         self.expid = expid
         self.priority = priority
+        self.run_flags = run_flags
 
     pause_noexc = staticmethod(make_parent_action("pause"))
     @host_only
@@ -128,13 +173,17 @@ class Scheduler:
 
     _check_pause = staticmethod(make_parent_action("scheduler_check_pause"))
     def check_pause(self, rid=None) -> TBool:
-        if rid is None:
+        if rid is None or rid == self.rid:
+            if self.run_flags is not None:
+                return self.run_flags.check_pause
             rid = self.rid
         return self._check_pause(rid)
 
     _check_termination = staticmethod(make_parent_action("scheduler_check_termination"))
     def check_termination(self, rid=None) -> TBool:
-        if rid is None:
+        if rid is None or rid == self.rid:
+            if self.run_flags is not None:
+                return self.run_flags.termination_requested
             rid = self.rid
         return self._check_termination(rid)
 
@@ -192,6 +241,7 @@ def get_experiment_from_content(content, class_name):
 
 
 register_experiment = make_parent_action("register_experiment")
+register_dependencies = make_parent_action("register_dependencies")
 
 
 class ExamineDeviceMgr:
@@ -212,6 +262,26 @@ class ExamineDatasetMgr:
         return ParentDatasetDB.get_metadata(key)
 
 
+def purge_experiment_modules(baseline_modules, experiment_dirs):
+    """Removes the modules imported from the experiment directories from
+    ``sys.modules``.
+
+    Returns ``True`` if the remaining modules are the ones present at worker
+    startup, plus any newly imported modules from ARTIQ or the standard
+    library; i.e. if the worker can be reused for another experiment.
+    """
+    clean = all(key in sys.modules for key in baseline_modules)
+    for key in set(sys.modules.keys()) - baseline_modules:
+        filename = getattr(sys.modules[key], "__file__", None)
+        if filename is not None and any(
+                os.path.abspath(filename).startswith(d + os.sep)
+                for d in experiment_dirs):
+            del sys.modules[key]
+        elif key.partition(".")[0] not in sys.stdlib_module_names | {"artiq"}:
+            clean = False
+    return clean
+
+
 def examine(device_mgr, dataset_mgr, file):
     previous_keys = set(sys.modules.keys())
     try:
@@ -234,6 +304,12 @@ def examine(device_mgr, dataset_mgr, file):
             if hasattr(exp_class, "argument_ui"):
                 argument_ui = exp_class.argument_ui
             register_experiment(class_name, name, arginfo, argument_ui, scheduler_defaults)
+        dependencies = []
+        for key in set(sys.modules.keys()) - previous_keys:
+            filename = getattr(sys.modules[key], "__file__", None)
+            if filename is not None:
+                dependencies.append(os.path.realpath(filename))
+        register_dependencies(dependencies)
     finally:
         new_keys = set(sys.modules.keys())
         for key in new_keys - previous_keys:
@@ -280,6 +356,7 @@ def setup_diagnostics(experiment_file, repository_path):
 
 
 def put_completed():
+    dataset_mods.flush()
     put_object({"action": "completed"})
 
 
@@ -300,14 +377,24 @@ def put_exception_report():
             lines += traceback.format_exception_only(type(exc), exc)
         logging.error("".join(lines).rstrip(),
                       exc_info=not hasattr(exc, "parent_traceback"))
+    try:
+        dataset_mods.flush()
+    except SystemExit:
+        pass
+    except:
+        logging.warning("Failed to send pending dataset modifications",
+                        exc_info=True)
     put_object({"action": "exception"})
 
 
 def main():
-    global ipc
+    global ipc, binary_ipc
 
     multiline_log_config(level=int(sys.argv[2]))
     ipc = pipe_ipc.ChildComm(sys.argv[1])
+    if "binary-ipc" in sys.argv[3:]:
+        binary_ipc = True
+        put_object({"action": "hello", "binary_ipc": True})
 
     start_time = None
     run_time = None
@@ -316,10 +403,32 @@ def main():
     exp = None
     exp_inst = None
     repository_path = None
+    run_flags = None
+
+    def results_filename():
+        return "{:09}-{}.h5".format(rid, exp.__name__)
+
+    def start_results_stream():
+        dataset_mgr.default_hdf5_options = ParentDatasetDB.get_hdf5_options()
+        f = h5py.File(results_filename(), "w")
+        dataset_mgr.start_hdf5_stream(f)
+        f["artiq_version"] = artiq_version
+        f["rid"] = rid
+        f["start_time"] = start_time
+        f["expid"] = pyon.encode(expid)
+        f.flush()
+
+    def flush_results_stream():
+        if dataset_mgr.hdf5_stream is not None:
+            dataset_mgr.flush_hdf5_stream()
 
     def write_results():
-        filename = "{:09}-{}.h5".format(rid, exp.__name__)
-        with h5py.File(filename, "w") as f:
+        if dataset_mgr.hdf5_stream is not None:
+            with dataset_mgr.finish_hdf5_stream() as f:
+                f["run_time"] = run_time
+            return
+        dataset_mgr.default_hdf5_options = ParentDatasetDB.get_hdf5_options()
+        with h5py.File(results_filename(), "w") as f:
             dataset_mgr.write_hdf5(f)
             f["artiq_version"] = artiq_version
             f["rid"] = rid
@@ -327,13 +436,22 @@ def main():
             f["run_time"] = run_time
             f["expid"] = pyon.encode(expid)
 
-    device_mgr = DeviceManager(ParentDeviceDB,
-                               virtual_devices={"scheduler": Scheduler(),
-                                                "ccb": CCB()})
-    dataset_mgr = DatasetManager(ParentDatasetDB)
+    def create_managers():
+        device_mgr = DeviceManager(ParentDeviceDB,
+                                   virtual_devices={"scheduler": Scheduler(),
+                                                    "ccb": CCB()})
+        dataset_mgr = DatasetManager(ParentDatasetDB)
+        return device_mgr, dataset_mgr
+
+    device_mgr, dataset_mgr = create_managers()
 
     import_cache.install_hook()
 
+    # State used to reset the worker for reuse by a worker pool
+    baseline_modules = set(sys.modules.keys())
+    initial_cwd = os.getcwd()
+    experiment_dirs = set()
+
     try:
         while True:
             obj = get_object()
@@ -342,6 +460,8 @@ def main():
                 start_time = time.time()
                 rid = obj["rid"]
                 expid = obj["expid"]
+                # Pooled workers are created before the log level is known
+                logging.getLogger().setLevel(expid["log_level"])
                 if "devarg_override" in expid:
                     device_mgr.devarg_override = expid["devarg_override"]
                 if "file" in expid:
@@ -353,24 +473,35 @@ def main():
                         experiment_file = expid["file"]
                         repository_path = None
                     setup_diagnostics(experiment_file, repository_path)
+                    experiment_dirs.add(
+                        os.path.dirname(os.path.abspath(experiment_file)))
+                    if repository_path is not None:
+                        experiment_dirs.add(os.path.abspath(repository_path))
                     exp = get_experiment_from_file(experiment_file, expid["class_name"])
                 else:
                     setup_diagnostics("<none>", None)
                     exp = get_experiment_from_content(expid["content"], expid["class_name"])
+                if obj.get("run_flags") is not None:
+                    run_flags = worker_ipc.RunFlags(obj["run_flags"])
                 device_mgr.virtual_devices["scheduler"].set_run_info(
-                    rid, obj["pipeline_name"], expid, obj["priority"])
+                    rid, obj["pipeline_name"], expid, obj["priority"],
+                    run_flags)
                 start_local_time = time.localtime(start_time)
                 dirname = os.path.join("results",
                                        time.strftime("%Y-%m-%d", start_local_time),
                                        time.strftime("%H", start_local_time))
                 os.makedirs(dirname, exist_ok=True)
                 os.chdir(dirname)
+                if expid.get("stream_results", False):
+                    start_results_stream()
                 argument_mgr = ArgumentManager(expid["arguments"])
                 exp_inst = exp((device_mgr, dataset_mgr, argument_mgr, {}))
                 argument_mgr.check_unprocessed_arguments()
+                flush_results_stream()
                 put_completed()
             elif action == "prepare":
                 exp_inst.prepare()
+                flush_results_stream()
                 put_completed()
             elif action == "run":
                 run_time = time.time()
@@ -389,6 +520,7 @@ def main():
                         # callbacks produce an exception
                         write_results()
                         raise
+                flush_results_stream()
                 put_completed()
             elif action == "analyze":
                 try:
@@ -403,6 +535,21 @@ def main():
             elif action == "examine":
                 examine(ExamineDeviceMgr, ExamineDatasetMgr, obj["file"])
                 put_completed()
+            elif action == "reset":
+                if dataset_mgr.hdf5_stream is not None:
+                    dataset_mgr.hdf5_stream.close()
+                if run_flags is not None:
+                    run_flags.close()
+                    run_flags = None
+                device_mgr.close_devices()
+                device_mgr, dataset_mgr = create_managers()
+                os.chdir(initial_cwd)
+                start_time = run_time = None
+                rid = expid = exp = exp_inst = repository_path = None
+                clean = purge_experiment_modules(baseline_modules,
+                                                 experiment_dirs)
+                experiment_dirs.clear()
+                put_object({"action": "completed", "clean": clean})
             elif action == "terminate":
                 break
     except:
@@ -0,0 +1,327 @@
+"""Encoding of the messages exchanged between the master and the worker
+processes.
+
+Messages are dictionaries. By default, each message is sent as a single line
+of PYON text. When both sides support it, messages containing large NumPy
+arrays are sent as binary frames instead, which avoid the text encoding of the
+array contents:
+
+* a header line, made of :data:`FRAME_MARKER` followed by the lengths in bytes
+  of the metadata and of each array buffer, separated by spaces;
+* the metadata, i.e. the PYON encoding of the message with each array
+  replaced by a placeholder;
+* the raw array buffers.
+
+The master offers the binary framing on the command line of the worker
+process, and the worker accepts it with a ``hello`` message when it starts.
+
+The state of a run that experiments poll frequently is also shared through
+:class:`RunFlags`, which the worker reads without sending messages, and the
+modifications of broadcast datasets are sent in batches by
+:class:`DatasetModBatcher`.
+"""
+
+import copy
+import itertools
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+import numpy
+
+from sipyco import pyon
+from sipyco.sync_struct import ModAction, process_mod
+
+
+__all__ = ["FRAME_MARKER", "MIN_ARRAY_SIZE", "extract_arrays", "insert_arrays",
+           "encode", "decode", "decode_async", "RunFlags",
+           "DatasetModBatcher"]
+
+
+FRAME_MARKER = b"\x01"
+# Smaller arrays are cheaper to send inline.
+MIN_ARRAY_SIZE = 1024
+
+_ARRAY_KEY = "__artiq_ndarray__"
+
+
+def extract_arrays(obj, buffers):
+    """Returns ``obj`` with the NumPy arrays of at least
+    :data:`MIN_ARRAY_SIZE` bytes it contains replaced by placeholders, and
+    appends the contiguous arrays to ``buffers``. Returns ``obj`` itself if
+    there is no such array."""
+    if isinstance(obj, numpy.ndarray):
+        if obj.dtype.kind in "biufc" and obj.nbytes >= MIN_ARRAY_SIZE:
+            buffers.append(numpy.ascontiguousarray(obj))
+            return {_ARRAY_KEY: (len(buffers) - 1, obj.dtype.str, obj.shape)}
+        return obj
+    t = type(obj)
+    if t is dict:
+        r = {k: extract_arrays(v, buffers) for k, v in obj.items()}
+        if any(r[k] is not obj[k] for k in obj):
+            return r
+    elif t is list or t is tuple:
+        r = [extract_arrays(v, buffers) for v in obj]
+        if any(a is not b for a, b in zip(r, obj)):
+            return r if t is list else tuple(r)
+    return obj
+
+
+def _insert_arrays(obj, arrays):
+    t = type(obj)
+    if t is dict:
+        if len(obj) == 1 and _ARRAY_KEY in obj:
+            return arrays[obj[_ARRAY_KEY][0]]
+        return {k: _insert_arrays(v, arrays) for k, v in obj.items()}
+    elif t is list:
+        return [_insert_arrays(v, arrays) for v in obj]
+    elif t is tuple:
+        return tuple(_insert_arrays(v, arrays) for v in obj)
+    return obj
+
+
+def encode(obj, binary=False):
+    """Encodes a message and returns it as a list of bytes-like objects, to
+    be written in order.
+
+    Binary frames are only used if ``binary`` is true and the message
+    contains arrays of at least :data:`MIN_ARRAY_SIZE` bytes."""
+    if binary:
+        buffers = []
+        meta_obj = extract_arrays(obj, buffers)
+        if buffers:
+            meta = pyon.encode(meta_obj).encode()
+            views = [memoryview(buffer).cast("B") for buffer in buffers]
+            lengths = [len(meta)] + [len(view) for view in views]
+            header = (FRAME_MARKER
+                      + " ".join(str(n) for n in lengths).encode() + b"\n")
+            return [header, meta] + views
+    return [(pyon.encode(obj) + "\n").encode()]
+
+
+def _parse_header(line):
+    lengths = [int(n) for n in line[len(FRAME_MARKER):].split()]
+    return lengths[0], lengths[1:]
+
+
+def insert_arrays(obj, payload, offset=0):
+    """Replaces the placeholders of ``obj`` produced by
+    :func:`extract_arrays` with arrays backed by ``payload``, which holds the
+    buffers back to back from ``offset``."""
+    placeholders = []
+    _find_placeholders(obj, placeholders)
+    if not placeholders:
+        return obj
+    arrays = dict()
+    for index, dtype, shape in sorted(placeholders):
+        dtype = numpy.dtype(dtype)
+        count = 1
+        for n in shape:
+            count *= n
+        arrays[index] = numpy.frombuffer(
+            payload, dtype, count, offset).reshape(shape)
+        offset += count*dtype.itemsize
+    return _insert_arrays(obj, arrays)
+
+
+def _decode_frame(meta, payload):
+    return insert_arrays(pyon.decode(meta.decode()), payload)
+
+
+def _find_placeholders(obj, placeholders):
+    t = type(obj)
+    if t is dict:
+        if len(obj) == 1 and _ARRAY_KEY in obj:
+            placeholders.append(tuple(obj[_ARRAY_KEY]))
+        else:
+            for v in obj.values():
+                _find_placeholders(v, placeholders)
+    elif t is list or t is tuple:
+        for v in obj:
+            _find_placeholders(v, placeholders)
+
+
+def decode(line, read_exactly):
+    """Decodes a message whose first line is ``line``, calling
+    ``read_exactly(n)`` to obtain the rest of binary frames.
+
+    The arrays of binary frames share the buffer returned by
+    ``read_exactly``, which should be a ``bytearray`` so that they are
+    writable."""
+    if not line.startswith(FRAME_MARKER):
+        return pyon.decode(line.decode())
+    meta_length, buffer_lengths = _parse_header(line)
+    meta = read_exactly(meta_length)
+    payload = read_exactly(sum(buffer_lengths))
+    return _decode_frame(meta, payload)
+
+
+async def decode_async(line, read_exactly):
+    """Same as :func:`decode`, with a coroutine ``read_exactly``."""
+    if not line.startswith(FRAME_MARKER):
+        return pyon.decode(line.decode())
+    meta_length, buffer_lengths = _parse_header(line)
+    meta = await read_exactly(meta_length)
+    payload = await read_exactly(sum(buffer_lengths))
+    return _decode_frame(meta, payload)
+
+
+_flags_counter = itertools.count()
+# Keep the flags in memory rather than on disk, where available
+_flags_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+class RunFlags:
+    """Flags of a run in memory shared between the master, which writes
+    them, and the worker process, which reads them.
+
+    The master creates the flags with ``name=None`` and passes their
+    :attr:`name` to the worker, which opens them with it. The memory is
+    backed by a temporary file, or a named mapping on Windows, which the
+    master releases with :meth:`close`."""
+    _CHECK_PAUSE = 0
+    _TERMINATION_REQUESTED = 1
+    _SIZE = 2
+
+    def __init__(self, name=None):
+        self._owner = name is None
+        if os.name == "nt":
+            if name is None:
+                name = "artiq_run_flags_{}_{}".format(os.getpid(),
+                                                      next(_flags_counter))
+            self._mmap = mmap.mmap(-1, self._SIZE, tagname=name)
+        else:
+            if name is None:
+                fd, name = tempfile.mkstemp(prefix="artiq_run_flags_",
+                                            dir=_flags_dir)
+                os.ftruncate(fd, self._SIZE)
+            else:
+                fd = os.open(name, os.O_RDWR)
+            try:
+                self._mmap = mmap.mmap(fd, self._SIZE)
+            finally:
+                os.close(fd)
+        self.name = name
+
+    def close(self):
+        self._mmap.close()
+        if self._owner and os.name != "nt":
+            os.unlink(self.name)
+
+    @property
+    def check_pause(self):
+        """Value to be returned by the ``check_pause`` method of the
+        scheduler device of the run."""
+        return bool(self._mmap[self._CHECK_PAUSE])
+
+    @check_pause.setter
+    def check_pause(self, value):
+        self._mmap[self._CHECK_PAUSE] = int(bool(value))
+
+    @property
+    def termination_requested(self):
+        return bool(self._mmap[self._TERMINATION_REQUESTED])
+
+    @termination_requested.setter
+    def termination_requested(self, value):
+        self._mmap[self._TERMINATION_REQUESTED] = int(bool(value))
+
+
+
+def _mod_key(mod):
+    if mod["path"]:
+        return mod["path"][0]
+    else:
+        return mod["key"]
+
+
+class DatasetModBatcher:
+    """Coalesces the modifications of broadcast datasets into batches, which
+    are passed to ``send`` as a list.
+
+    A batch is sent when ``max_mods`` modifications are pending,
+    ``max_delay`` seconds after its first modification (from a background
+    thread), and when :meth:`flush` is called, e.g. before any other request
+    to the master and at the end of each stage.
+
+    Modifications are copied when they are queued, since the host may change
+    the objects they refer to before the batch is sent. Modifications of a
+    dataset that is set in the same batch are applied to the copy of its value
+    instead of being queued. Errors raised by ``send`` in the background
+    thread are re-raised at the next call.
+    """
+    def __init__(self, send, max_mods=1000, max_delay=0.1):
+        self.send = send
+        self.max_mods = max_mods
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._pending = []
+        # key -> pending mod setting the dataset
+        self._set_mods = dict()
+        self._deadline = None
+        self._error = None
+        self._thread = None
+
+    def update(self, mod):
+        with self._cond:
+            self._raise_error()
+            mod = copy.deepcopy(mod)
+            key = _mod_key(mod)
+            if mod["path"]:
+                set_mod = self._set_mods.get(key)
+                if set_mod is not None:
+                    process_mod({key: set_mod["value"]}, mod)
+                    return
+            else:
+                self._pending = [m for m in self._pending
+                                 if _mod_key(m) != key]
+                if mod["action"] == ModAction.setitem.value:
+                    self._set_mods[key] = mod
+                else:
+                    self._set_mods.pop(key, None)
+            self._pending.append(mod)
+            if len(self._pending) >= self.max_mods:
+                self._flush()
+            elif self._deadline is None:
+                self._deadline = time.monotonic() + self.max_delay
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="dataset_mods", daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+
+    def flush(self):
+        with self._cond:
+            self._raise_error()
+            self._flush()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _flush(self):
+        if not self._pending:
+            return
+        mods, self._pending = self._pending, []
+        self._set_mods.clear()
+        self._deadline = None
+        self.send(mods)
+
+    def _run(self):
+        with self._cond:
+            while True:
+                if self._deadline is None:
+                    self._cond.wait()
+                    continue
+                timeout = self._deadline - time.monotonic()
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                    continue
+                try:
+                    self._flush()
+                except BaseException as exn:
+                    # Including SystemExit when the master terminates us.
+                    self._error = exn
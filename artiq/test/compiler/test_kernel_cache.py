@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+
+from artiq.compiler.kernel_cache import KernelCache
+
+
+class KernelCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_roundtrip(self):
+        cache = KernelCache(self.tmpdir.name)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", b"library", b"stripped")
+        self.assertEqual(cache.get("a"), (b"library", b"stripped"))
+        # Entries are visible to other instances sharing the directory.
+        self.assertEqual(KernelCache(self.tmpdir.name).get("a"),
+                         (b"library", b"stripped"))
+
+    def test_lru_eviction(self):
+        cache = KernelCache(self.tmpdir.name, max_size=3100)
+        for i, key in enumerate("abc"):
+            cache.put(key, bytes(1000), b"")
+            os.utime(cache._filename(key), (i, i))
+        # "a" is used again and becomes the most recently used entry
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("d", bytes(1000), b"")
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertIsNotNone(cache.get("d"))
+
+
+if __name__ == "__main__":
+    unittest.main()
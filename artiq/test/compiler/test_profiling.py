@@ -0,0 +1,44 @@
+import unittest
+
+from artiq.compiler.profiling import Profiler
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_nesting(self):
+        profiler = Profiler()
+        with profiler.stage("outer"):
+            with profiler.stage("first"):
+                pass
+            with profiler.stage("second"):
+                pass
+        with profiler.stage("next"):
+            pass
+        self.assertEqual([(stage.name, stage.depth) for stage in profiler.stages],
+                         [("outer", 0), ("first", 1), ("second", 1), ("next", 0)])
+        outer = profiler.stages[0]
+        self.assertGreaterEqual(outer.time,
+                                profiler.stages[1].time + profiler.stages[2].time)
+        self.assertIsNone(outer.allocated)
+        self.assertEqual(list(profiler.datasets("p")), ["p.stage", "p.depth", "p.time"])
+
+    def test_memory(self):
+        profiler = Profiler(memory=True)
+        with profiler.stage("outer"):
+            with profiler.stage("temporary"):
+                data = bytes(1000000)
+                del data
+            with profiler.stage("kept"):
+                kept = bytes(100000)
+        outer, temporary, kept_stage = profiler.stages
+        self.assertLess(temporary.allocated, 10000)
+        self.assertGreaterEqual(temporary.peak, 1000000)
+        self.assertGreaterEqual(kept_stage.allocated, 100000)
+        # The peak of the outer stage includes the peaks of nested stages.
+        self.assertGreaterEqual(outer.peak, 1000000)
+        self.assertGreaterEqual(outer.allocated, 100000)
+        self.assertEqual(profiler.datasets("p")["p.peak"],
+                         [stage.peak for stage in profiler.stages])
+
+
+if __name__ == "__main__":
+    unittest.main()
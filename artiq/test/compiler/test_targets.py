@@ -0,0 +1,92 @@
+import gc
+import os
+import shutil
+import unittest
+
+from llvmlite import ir as ll
+
+from artiq.language.core import kernel
+from artiq.master.databases import DeviceDB
+from artiq.master.worker_db import DeviceManager
+from artiq.compiler.module import Module
+from artiq.compiler.embedding import Stitcher
+from artiq.compiler.targets import RV32GTarget
+from artiq.compiler.elf import strip_debug
+
+
+device_db_path = os.path.join(os.path.dirname(__file__), "..", "lit",
+                              "embedding", "device_db.py")
+
+
+@kernel
+def entrypoint(x):
+    if x > 3:
+        raise ValueError("x")
+
+
+def make_module():
+    dmgr = DeviceManager(DeviceDB(device_db_path))
+    stitcher = Stitcher(core=dmgr.get("core"), dmgr=dmgr)
+    stitcher.stitch_call(entrypoint, (4,), {})
+    stitcher.finalize()
+    return Module(stitcher)
+
+
+class LLVMIRTest(unittest.TestCase):
+    def llvmlite_modules(self):
+        return sum(isinstance(obj, ll.Module) for obj in gc.get_objects())
+
+    def test_release(self):
+        module = make_module()
+        target = RV32GTarget()
+        gc.collect()
+        count = self.llvmlite_modules()
+        llvm_ir = target.generate_llvm_ir(module)
+        self.assertEqual(self.llvmlite_modules(), count)
+
+        target.release_llvm_ir = False
+        self.assertEqual(target.generate_llvm_ir(module), llvm_ir)
+        self.assertGreater(self.llvmlite_modules(), count)
+
+
+@unittest.skipUnless(shutil.which(RV32GTarget.tool_ld), "linker not available")
+class ToolsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        target = RV32GTarget()
+        cls.object = target.assemble(target.compile(make_module()))
+
+    def setUp(self):
+        self.target = RV32GTarget()
+        self.tool_target = RV32GTarget()
+        self.tool_target.use_pipes = False
+        self.tool_target.strip_in_process = False
+
+    def test_link(self):
+        library = self.target.link([self.object])
+        self.assertEqual(library, self.tool_target.link([self.object]))
+
+    def test_strip(self):
+        library = self.target.link([self.object])
+        stripped = self.target.strip(library)
+        self.assertLess(len(stripped), len(library))
+        # Nothing left to strip
+        self.assertIs(strip_debug(stripped), stripped)
+        if shutil.which(self.target.tool_strip):
+            # Only the sections that are not loaded are laid out differently.
+            self.assertLessEqual(len(self.tool_target.strip(library)),
+                                 len(stripped))
+
+    @unittest.skipUnless(shutil.which(RV32GTarget.tool_symbolizer),
+                         "symbolizer not available")
+    def test_symbolize(self):
+        library = self.target.link([self.object])
+        addresses = [0x100, 0x104]
+        backtrace = self.target.symbolize(library, addresses)
+        self.assertEqual(backtrace,
+                         self.tool_target.symbolize(library, addresses))
+        self.assertTrue(self.target.use_pipes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Host-only tests of the analyzer dump decoder, using synthetic dumps."""
+
+import io
+import struct
+import unittest
+
+from artiq.coredevice.comm_analyzer import (
+    decode_dump, decode_message, decoded_dump_to_vcd, DecodedDump,
+    dump_to_target, VCDManager,
+    OutputMessage, InputMessage, ExceptionMessage, StoppedMessage,
+    ExceptionType)
+
+
+def _record(message_type, channel, data=0, address=0,
+            rtio_counter=0, timestamp=0):
+    return struct.pack(">QIQQI", data, address, rtio_counter, timestamp,
+                       (channel << 2) | message_type)
+
+
+def _dump(records, log_channel=7):
+    body = b"".join(records)
+    return (b"E" + struct.pack(">IQbbb", len(body), len(body),
+                               0, log_channel, 0)
+            + body)
+
+
+_devices = {
+    "core": {
+        "type": "local",
+        "module": "artiq.coredevice.core",
+        "class": "Core",
+        "arguments": {"ref_period": 1e-9}
+    },
+    "ttl0": {
+        "type": "local",
+        "module": "artiq.coredevice.ttl",
+        "class": "TTLInOut",
+        "arguments": {"channel": 0}
+    },
+}
+
+
+class DecodeCase(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            _record(0, 0, data=1, address=0, rtio_counter=90, timestamp=100),
+            _record(1, 0, data=1, rtio_counter=160, timestamp=150),
+            _record(0, 0, data=0, address=0, rtio_counter=95, timestamp=120),
+            _record(2, 3, address=ExceptionType.o_underflow.value,
+                    rtio_counter=130),
+            _record(0, 5, data=2**63, address=3, rtio_counter=200,
+                    timestamp=210),
+            _record(3, 0, rtio_counter=300),
+        ]
+
+    def test_decode(self):
+        dump = decode_dump(_dump(self.records))
+        self.assertEqual(dump.log_channel, 7)
+        self.assertEqual(len(dump.messages), len(self.records))
+        self.assertEqual(list(dump.messages),
+                         [decode_message(r) for r in self.records])
+        self.assertEqual(dump.messages[0],
+                         OutputMessage(0, 100, 90, 0, 1))
+        self.assertEqual(dump.messages[1], InputMessage(0, 150, 160, 1))
+        self.assertEqual(dump.messages[3],
+                         ExceptionMessage(3, 130, ExceptionType.o_underflow))
+        self.assertIsInstance(dump.messages[-1], StoppedMessage)
+        self.assertIs(type(dump.messages[4].data), int)
+        with self.assertRaises(IndexError):
+            dump.messages[len(self.records)]
+
+    def test_sorted(self):
+        messages = decode_dump(_dump(self.records)).messages.sorted()
+        self.assertEqual(messages.time.tolist(),
+                         [100, 120, 130, 150, 210, 300])
+
+    def test_invalid_exception_type(self):
+        with self.assertRaises(ValueError):
+            decode_dump(_dump([_record(2, 0, address=0xff)]))
+
+    def test_vcd_from_tuples(self):
+        # Dumps holding a list of message tuples are still accepted.
+        dump = decode_dump(_dump(self.records))
+        vcds = []
+        for messages in dump.messages, list(dump.messages):
+            f = io.StringIO()
+            decoded_dump_to_vcd(f, _devices,
+                                DecodedDump(dump.log_channel,
+                                            dump.dds_onehot_sel, messages))
+            vcds.append(f.getvalue())
+        self.assertEqual(vcds[0], vcds[1])
+        self.assertIn("#20\n0!\n", vcds[0])
+        self.assertIn("#50\n1!\n", vcds[0])
+
+    def test_streaming(self):
+        dump = _dump(self.records * 10)
+        for uniform_interval in False, True:
+            f = io.StringIO()
+            decoded_dump_to_vcd(f, _devices, decode_dump(dump),
+                                uniform_interval)
+            expected = f.getvalue()
+            for chunk_size in 1, 4, 100:
+                f = io.StringIO()
+                dump_to_target(VCDManager(f), _devices, dump,
+                               uniform_interval, chunk_size=chunk_size)
+                self.assertEqual(f.getvalue(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+"""Host-only tests of the core device RPC decoder, replaying recorded
+byte streams instead of talking to a core device."""
+
+import struct
+import time
+import unittest
+
+import numpy
+
+from artiq.coredevice.comm_kernel import CommKernel, AsyncRPCDispatcher, Reply
+from artiq.coredevice.exceptions import ClockFailure
+
+
+class _ReplaySocket:
+    """Replays a byte stream in chunks of at most ``chunk_size`` bytes, as
+    a TCP socket would deliver it."""
+    def __init__(self, data, chunk_size=1460):
+        self.data = memoryview(data)
+        self.position = 0
+        self.chunk_size = chunk_size
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        if not nbytes:
+            nbytes = len(buffer)
+        chunk = self.data[self.position:
+                          self.position + min(nbytes, self.chunk_size)]
+        buffer[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+
+def _comm_replaying(payload, chunk_size=1460):
+    comm = CommKernel(None)
+    comm.socket = _ReplaySocket(b"e" + payload, chunk_size)
+    comm._read_endian()
+    return comm
+
+
+def _int32(value):
+    return struct.pack("<l", value)
+
+
+def _rpc_args(*encoded_args):
+    return b"".join(encoded_args) + b"\x00"
+
+
+def _encode_list(tag, fmt, values):
+    return (b"l" + _int32(len(values)) + tag
+            + struct.pack("<{}{}".format(len(values), fmt), *values))
+
+
+def _encode_array(tag, fmt, array):
+    return (b"a" + bytes([array.ndim])
+            + b"".join(_int32(n) for n in array.shape) + tag
+            + array.astype(fmt).tobytes())
+
+
+def _encode_bytes(value):
+    return b"B" + _int32(len(value)) + value
+
+
+class ReceiveCase(unittest.TestCase):
+    def _receive(self, payload, **kwargs):
+        comm = _comm_replaying(payload, **kwargs)
+        args, kwargs = comm._receive_rpc_args(None)
+        self.assertEqual(kwargs, {})
+        # the whole stream must have been consumed
+        self.assertEqual(comm.read_start, comm.read_end)
+        self.assertEqual(comm.socket.position, len(comm.socket.data))
+        return args
+
+    def test_scalars(self):
+        args = self._receive(_rpc_args(
+            b"i" + _int32(-5),
+            b"I" + struct.pack("<q", 2**40),
+            b"f" + struct.pack("<d", 1.5),
+            b"b\x01",
+            b"s" + _int32(5) + b"hello",
+            _encode_bytes(b"\x00\x01")))
+        self.assertEqual(args, [-5, 2**40, 1.5, True, "hello", b"\x00\x01"])
+        self.assertIsInstance(args[0], numpy.int32)
+        self.assertIsInstance(args[1], numpy.int64)
+
+    def test_lists(self):
+        ints = list(range(-500, 500))
+        floats = [0.5*i for i in range(1000)]
+        bools = [bool(i % 3) for i in range(1000)]
+        args = self._receive(_rpc_args(
+            _encode_list(b"i", "l", ints),
+            _encode_list(b"I", "q", ints),
+            _encode_list(b"f", "d", floats),
+            _encode_list(b"b", "?", bools)))
+        self.assertEqual(args, [ints, ints, floats, bools])
+        self.assertIs(type(args[0][0]), int)
+        self.assertIsInstance(args[1][0], numpy.int64)
+
+    def test_arrays(self):
+        array = numpy.arange(24, dtype=numpy.float64).reshape((2, 3, 4))
+        args = self._receive(_rpc_args(
+            _encode_array(b"f", "<f8", array),
+            _encode_array(b"i", "<i4", array)))
+        numpy.testing.assert_array_equal(args[0], array)
+        numpy.testing.assert_array_equal(args[1], array)
+        self.assertEqual(args[1].dtype, numpy.int32)
+
+    def test_large_payloads(self):
+        data = bytes(range(256)) * 4096
+        ints = list(range(1 << 18))
+        for chunk_size in (1, 1460, 1 << 20):
+            args = self._receive(_rpc_args(
+                _encode_bytes(data),
+                _encode_list(b"i", "l", ints),
+                b"i" + _int32(7)), chunk_size=chunk_size)
+            self.assertEqual(args, [data, ints, 7])
+
+    def test_benchmark(self):
+        payloads = {
+            "bytes": _encode_bytes(b"\x00" * (1 << 20)),
+            "list": _encode_list(b"i", "l", [123] * (1 << 18)),
+            "array": _encode_array(b"i", "<i4",
+                                   numpy.full(1 << 18, 123, numpy.int32)),
+            "small list": _encode_list(b"i", "l", [123] * (1 << 8)) * 1024,
+        }
+        print()
+        for name, payload in payloads.items():
+            stream = _rpc_args(payload)
+            t0 = time.monotonic()
+            for _ in range(10):
+                _comm_replaying(stream)._receive_rpc_args(None)
+            dt = (time.monotonic() - t0) / 10
+            print("{:>10}: {:8.1f} MiB/s".format(name, len(stream) / dt / 2**20))
+
+
+class AsyncRPCDispatcherCase(unittest.TestCase):
+    def test_ordering(self):
+        dispatcher = AsyncRPCDispatcher(threads=2, queue_size=4)
+        results = {0: [], 1: []}
+        def append(service_id, value):
+            time.sleep(0.001)
+            results[service_id].append(value)
+        try:
+            for i in range(20):
+                dispatcher.submit(i % 2, append, (i % 2, i), {})
+            dispatcher.flush()
+            self.assertEqual(results[0], list(range(0, 20, 2)))
+            self.assertEqual(results[1], list(range(1, 20, 2)))
+            stats = dispatcher.get_stats()
+            self.assertEqual(stats["queue_depth"], 0)
+            self.assertEqual(stats["services"][append.__qualname__]["count"], 20)
+        finally:
+            dispatcher.close()
+
+    def test_error(self):
+        dispatcher = AsyncRPCDispatcher()
+        calls = []
+        def fail():
+            raise ValueError
+        try:
+            dispatcher.submit(0, fail, (), {})
+            dispatcher.submit(0, calls.append, (1, ), {})
+            with self.assertRaises(ValueError):
+                dispatcher.flush()
+            # RPCs queued after the failing one are dropped
+            self.assertEqual(calls, [])
+            dispatcher.submit(0, calls.append, (2, ), {})
+            dispatcher.flush()
+            self.assertEqual(calls, [2])
+        finally:
+            dispatcher.close()
+
+    def _comm_serving(self, reply, **kwargs):
+        comm = CommKernel(None, async_rpc_threads=1, **kwargs)
+        comm.socket = _ReplaySocket(
+            b"e" + b"\x5a"*4 + bytes([reply.value]) + b"\x00", 1460)
+        comm._read_endian()
+        return comm
+
+    def test_stats_hook(self):
+        calls = []
+        comm = self._comm_serving(
+            Reply.KernelFinished,
+            async_rpc_stats_hook=lambda *args: calls.append(args))
+        try:
+            comm.async_rpc_dispatcher.submit(0, len, ((), ), {})
+            comm.serve(None, None, None)
+            self.assertEqual(len(calls), 1)
+            self.assertIs(calls[0][0], len)
+            self.assertEqual(comm.get_async_rpc_stats()["services"]["len"]["count"], 1)
+        finally:
+            comm.async_rpc_dispatcher.close()
+
+    def test_error_at_kernel_end(self):
+        comm = self._comm_serving(Reply.KernelFinished)
+        def fail():
+            raise ValueError
+        try:
+            comm.async_rpc_dispatcher.submit(0, fail, (), {})
+            with self.assertRaises(ValueError):
+                comm.serve(None, None, None)
+        finally:
+            comm.async_rpc_dispatcher.close()
+
+    def test_error_does_not_mask_kernel_exception(self):
+        comm = self._comm_serving(Reply.ClockFailure)
+        def fail():
+            raise ValueError
+        try:
+            comm.async_rpc_dispatcher.submit(0, fail, (), {})
+            with self.assertLogs("artiq.coredevice.comm_kernel", "ERROR"):
+                with self.assertRaises(ClockFailure):
+                    comm.serve(None, None, None)
+        finally:
+            comm.async_rpc_dispatcher.close()
@@ -475,6 +475,38 @@ class ArrayQuotingTest(ExperimentCase):
         self.create(_ArrayQuoting).run()
 
 
+_large_ints = list(range(100))
+_special_floats = [float(i) for i in range(100)] + [float("nan"), float("inf")]
+_matrix = numpy.arange(6.).reshape((2, 3))
+
+
+class _LargeQuoting(EnvExperiment):
+    def build(self):
+        self.setattr_device("core")
+
+    @kernel
+    def run(self):
+        # Each evaluation yields a new copy of the quoted values.
+        for _ in range(2):
+            ints = _large_ints
+            assert ints[1] == 1
+            ints[1] = -1
+
+            floats = _special_floats
+            assert floats[100] != floats[100]
+            assert floats[101] > 1e308
+
+            matrix = _matrix
+            assert matrix.shape == (2, 3)
+            assert matrix[1, 2] == 5.0
+            matrix[1, 2] = 0.0
+
+
+class LargeQuotingTest(ExperimentCase):
+    def test_quoting(self):
+        self.create(_LargeQuoting).run()
+
+
 class _Assert(EnvExperiment):
     def build(self):
         self.setattr_device("core")
@@ -0,0 +1,48 @@
+# RUN: env ARTIQ_DUMP_UNOPT_LLVM=%t %python -m artiq.compiler.testbench.embedding +compile %s
+# RUN: OutputCheck %s --file-to-check=%t_unopt.ll
+
+from artiq.language.core import *
+from artiq.language.types import *
+import numpy
+
+# Large lists of numbers and NumPy arrays are embedded as the bytes of their
+# contents, and copied into a new list or array every time they are evaluated.
+
+# CHECK: @quoted.list = private global \[256 x i8\] c"\\00\\00\\00\\00\\01\\00\\00\\00.*", align 4
+# CHECK: { i32\*, i32 } { i32\* bitcast \(\[256 x i8\]\* @quoted.list to i32\*\), i32 64 }
+int32_list = list(range(64))
+
+# Integers that do not fit in 32 bits are embedded as int64.
+# CHECK: @quoted.list.(\d+) = private global \[520 x i8\] c"\\00\\00\\00\\00\\00\\01\\00\\00.*", align 8
+# CHECK: { i64\*, i32 } { i64\* bitcast \(\[520 x i8\]\* @quoted.list.\d+ to i64\*\), i32 65 }
+int64_list = [2**40] + list(range(64))
+
+# CHECK: @quoted.list.(\d+) = private global \[544 x i8\] c".*\\00\\00\\00\\00\\00\\00\\F8\\7F\\00\\00\\00\\00\\00\\00\\F0\\7F\\00\\00\\00\\00\\00\\00\\F0\\FF", align 8
+# CHECK: { double\*, i32 } { double\* bitcast \(\[544 x i8\]\* @quoted.list.\d+ to double\*\), i32 68 }
+float_list = [float(i) for i in range(65)] + [float("nan"), float("inf"), float("-inf")]
+
+# Arrays are embedded whatever their size, and flattened.
+# CHECK: @quoted.list.(\d+) = private global \[24 x i8\] c"\\00\\00\\00\\00\\01\\00\\00\\00\\02\\00\\00\\00\\03\\00\\00\\00\\04\\00\\00\\00\\05\\00\\00\\00", align 4
+# CHECK: { i32\*, i32 } { i32\* bitcast \(\[24 x i8\]\* @quoted.list.\d+ to i32\*\), i32 6 }
+int32_matrix = numpy.arange(6, dtype=numpy.int32).reshape((2, 3))
+
+# CHECK: @quoted.list.(\d+) = private global \[32 x i8\] c"\\00\\00\\00\\00\\00\\00\\F0\?\\00\\00\\00\\00\\00\\00\\F8\\7F\\00\\00\\00\\00\\00\\00\\F0\\7F\\00\\00\\00\\00\\00\\00\\F0\\FF", align 8
+float_vector = numpy.array([1.0, numpy.nan, numpy.inf, -numpy.inf])
+
+# Small lists are still quoted element by element.
+# CHECK-NOT: private global [12 x i8]
+small_list = [1, 2, 3]
+
+@kernel
+def entrypoint():
+    # A copy is made at each evaluation, so that the host value is unchanged.
+    # CHECK-L: blob.head:
+    a = int32_list
+    a[0] = 10
+    assert int32_list[0] == 0
+    assert int64_list[0] == 2**40
+    assert float_list[64] == 64.0
+    assert int32_matrix.shape == (2, 3)
+    assert int32_matrix[1, 2] == 5
+    assert float_vector[2] > 0.0
+    assert small_list[2] == 3
@@ -0,0 +1,30 @@
+# RUN: env ARTIQ_DUMP_UNOPT_LLVM=%t %python -m artiq.compiler.testbench.embedding +compile %s
+# RUN: OutputCheck %s --file-to-check=%t_unopt.ll
+
+from artiq.language.core import *
+from artiq.language.types import *
+import numpy
+
+# The numbers in attributes of host objects are embedded as the bytes of
+# their contents.
+
+class c:
+    def __init__(self):
+        # CHECK: @quoted.array = private global \[16 x i8\] c"\\00\\00\\00\\00\\00\\00\\F0\?\\00\\00\\00\\00\\00\\00\\F8\\7F", align 8
+        self.float_array = numpy.array([1.0, numpy.nan])
+        # CHECK: @quoted.list(\.\d+)? = private global \[800 x i8\] c"(\\00\\00\\00\\00\\00\\00\\F0\\7F){100}", align 8
+        self.float_list = [float("inf")] * 100
+        # CHECK: @quoted.array.(\d+) = private global \[32 x i8\] c"\\00\\00\\00\\00\\00\\01\\00\\00.*", align 8
+        self.int64_array = numpy.array([[2**40, 1], [2, 3]])
+
+    @kernel
+    def run(self):
+        assert self.float_array[0] == 1.0
+        assert self.float_list[0] > 0.0
+        assert self.int64_array[0, 0] == 2**40
+
+i = c()
+
+@kernel
+def entrypoint():
+    i.run()
@@ -0,0 +1,49 @@
+# RUN: %python -m artiq.compiler.testbench.embedding +diag %s 2>%t
+# RUN: OutputCheck %s --file-to-check=%t
+
+from artiq.language.core import *
+from artiq.language.types import *
+
+class dev:
+    def __init__(self, x):
+        self.x = x
+
+    @kernel
+    def read(self):
+        return self.x
+
+class inner:
+    def __init__(self, d):
+        self.d = d
+
+    @kernel
+    def get(self):
+        return self.d
+
+class middle:
+    def __init__(self, i):
+        self.i = i
+
+    @kernel
+    def get(self):
+        return self.i.get()
+
+class outer:
+    def __init__(self, d):
+        self.m = middle(inner(d))
+
+    @kernel
+    def run(self):
+        # The second object of the type is only discovered after the function
+        # reading its attribute has been inferred.
+        self.m.get().read()
+
+d1 = dev(1)
+o = outer(dev(1.0))
+
+@kernel
+def entrypoint():
+    # CHECK-L: <synthesized>:1: error: host object has an attribute 'x' of type float, which is different from previously inferred type numpy.int32 for the same attribute
+    d1.read()
+    # CHECK-L: ${LINE:+1}: note: expanded from here
+    o.run()
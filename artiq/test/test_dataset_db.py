@@ -0,0 +1,208 @@
+import os
+import tempfile
+import time
+import unittest
+
+import lmdb
+import numpy
+from sipyco import pyon
+
+from artiq.master.databases import (DatasetDB, decode_dataset_record,
+                                    is_binary_dataset_record, is_chunk_key,
+                                    dataset_record_size)
+from artiq.frontend.artiq_dataset_db import migrate
+
+
+class DatasetDBCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.persist_file = os.path.join(self.tmpdir.name, "dataset_db.mdb")
+        ddb = DatasetDB(self.persist_file)
+        ddb.set("small", 42, persist=True, metadata={"unit": "Hz"})
+        ddb.set("large", numpy.arange(10000.), persist=True,
+                metadata={"unit": "V"})
+        ddb.set("large2", list(range(10000)), persist=True)
+        ddb.save()
+        ddb.close_db()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _open(self, **kwargs):
+        ddb = DatasetDB(self.persist_file, **kwargs)
+        # unlike close_db(), this may be called again after _reopen()
+        self.addCleanup(ddb.lmdb.close)
+        return ddb
+
+    def _reopen(self, ddb, **kwargs):
+        ddb.save()
+        ddb.close_db()
+        return self._open(**kwargs)
+
+    def test_lazy(self):
+        ddb = self._open(lazy_threshold=1000)
+        self.assertEqual(ddb.lazy_keys, {"large", "large2"})
+        # keys and metadata are still advertised
+        self.assertEqual(ddb.data.raw_view["large"], (True, None, {"unit": "V"}))
+        self.assertEqual(ddb.data.raw_view["small"], (True, 42, {"unit": "Hz"}))
+        numpy.testing.assert_array_equal(ddb.get("large"),
+                                         numpy.arange(10000.))
+        self.assertEqual(ddb.get_metadata("large"), {"unit": "V"})
+
+        mods = []
+        ddb.data.publish = mods.append
+        ddb.update({"action": "append", "path": ["large2", 1], "x": -1})
+        self.assertNotIn("large2", ddb.lazy_keys)
+        self.assertEqual([mod["action"] for mod in mods],
+                         ["setitem", "append"])
+        self.assertEqual(ddb.get("large2")[-1], -1)
+
+        ddb = self._reopen(ddb)
+        self.assertEqual(ddb.get("large2"), list(range(10000)) + [-1])
+        numpy.testing.assert_array_equal(ddb.get("large"),
+                                         numpy.arange(10000.))
+
+    def test_cache_eviction(self):
+        ddb = self._open(lazy_threshold=1000, cache_size=1)
+        ddb.get("large")
+        ddb.get("large2")
+        # only the most recently used value is kept
+        self.assertEqual(list(ddb._cache.keys()), ["large2"])
+
+    def _records(self):
+        env = lmdb.open(self.persist_file, subdir=False, map_size=2**30)
+        try:
+            with env.begin() as txn:
+                return {key.decode(): bytes(record)
+                        for key, record in txn.cursor()
+                        if not is_chunk_key(key)}
+        finally:
+            env.close()
+
+    def _migrate(self, binary):
+        env = lmdb.open(self.persist_file, subdir=False, map_size=2**30)
+        try:
+            migrate(env, binary)
+        finally:
+            env.close()
+
+    def test_binary_records(self):
+        records = self._records()
+        self.assertTrue(all(is_binary_dataset_record(record)
+                            for record in records.values()))
+        self.assertEqual(decode_dataset_record(records["small"]),
+                         (42, {"unit": "Hz"}))
+
+        for chunk_size in None, 1024:
+            ddb = self._reopen(self._open(), chunk_size=chunk_size)
+            ddb.set("large", ddb.get("large"))
+            ddb = self._reopen(ddb)
+            # arrays are not backed by the read-only LMDB buffers
+            ddb.get("large")[0] = -1
+            self.assertEqual(ddb.get("small"), 42)
+            self.assertEqual(ddb.get("large2"), list(range(10000)))
+            ddb.close_db()
+
+    def test_dirty_ranges(self):
+        ddb = self._open(chunk_size=1024)
+        ddb.set("large", ddb.get("large"))
+        ddb.save()
+        chunks = ddb.lmdb.stat()["entries"]
+
+        ddb.update({"action": "setitem", "path": ["large", 1],
+                    "key": 200, "value": -1})
+        ddb.update({"action": "setitem", "path": ["large", 1],
+                    "key": slice(1000, 1500, 2), "value": -2})
+        self.assertEqual(ddb.pending_keys, set())
+        self.assertEqual(ddb.dirty_ranges,
+                         {"large": [(1600, 1608), (8000, 11992)]})
+        ddb.update({"action": "setitem", "path": ["large2", 1],
+                    "key": 0, "value": -1})
+        self.assertEqual(ddb.pending_keys, {"large2"})
+        # only the chunks holding the modified elements are written
+        ddb.get("large")[0] = -3
+
+        expected = numpy.arange(10000.)
+        expected[200] = -1
+        expected[1000:1500:2] = -2
+        ddb = self._reopen(ddb, chunk_size=1024, fsync="close")
+        self.assertEqual(ddb.lmdb.stat()["entries"], chunks)
+        numpy.testing.assert_array_equal(ddb.get("large"), expected)
+        self.assertEqual(ddb.get("large2")[:2], [-1, 1])
+
+        # fancy indexing rewrites the whole array
+        ddb.update({"action": "setitem", "path": ["large", 1],
+                    "key": [5, 7], "value": -3})
+        self.assertEqual(ddb.pending_keys, {"large"})
+
+        # shrinking the array deletes the chunks past its end
+        ddb.set("large", numpy.arange(200.))
+        ddb = self._reopen(ddb, chunk_size=1024)
+        self.assertEqual(ddb.lmdb.stat()["entries"], chunks - 77)
+        numpy.testing.assert_array_equal(ddb.get("large"),
+                                         numpy.arange(200.))
+
+    def test_pyon_records(self):
+        # Files written by earlier versions are read transparently.
+        self._migrate(False)
+        records = self._records()
+        self.assertFalse(any(is_binary_dataset_record(record)
+                             for record in records.values()))
+        self.assertEqual(pyon.decode(records["small"].decode()),
+                         (42, {"unit": "Hz"}))
+        for lazy_threshold in None, 1000:
+            ddb = self._open(lazy_threshold=lazy_threshold)
+            self.assertEqual(ddb.get_metadata("large"), {"unit": "V"})
+            numpy.testing.assert_array_equal(ddb.get("large"),
+                                             numpy.arange(10000.))
+            ddb.close_db()
+
+        self._migrate(True)
+        self.assertTrue(all(is_binary_dataset_record(record)
+                            for record in self._records().values()))
+        ddb = self._open()
+        numpy.testing.assert_array_equal(ddb.get("large"),
+                                         numpy.arange(10000.))
+        self.assertEqual(ddb.get_metadata("small"), {"unit": "Hz"})
+
+    def test_benchmark(self):
+        print()
+        for binary in False, True:
+            ddb = self._open(binary_records=binary)
+            for i in range(10):
+                ddb.set("array{}".format(i), numpy.random.rand(1 << 17),
+                        persist=True)
+            t0 = time.monotonic()
+            ddb.save()
+            t1 = time.monotonic()
+            ddb.close_db()
+            size = sum(dataset_record_size(record)
+                       for record in self._records().values())
+            t2 = time.monotonic()
+            ddb = self._open()
+            t3 = time.monotonic()
+            print("{:>6}: save {:8.2f} ms, load {:8.2f} ms, {:6.1f} MiB"
+                  .format("binary" if binary else "PYON",
+                          (t1 - t0)*1e3, (t3 - t2)*1e3, size/2**20))
+            ddb.close_db()
+
+    def test_update_benchmark(self):
+        print()
+        for chunk_size, fsync in (None, "save"), (64*1024, "save"), \
+                                 (64*1024, "close"):
+            ddb = self._open(chunk_size=chunk_size, fsync=fsync)
+            ddb.set("array", numpy.zeros(1 << 23), persist=True)
+            ddb.save()
+            t0 = time.monotonic()
+            for i in range(10):
+                ddb.update({"action": "setitem", "path": ["array", 1],
+                            "key": i*1000, "value": 1.})
+                ddb.save()
+            print("chunk size {}, fsync at {}: {:8.2f} ms per save"
+                  .format(chunk_size, fsync,
+                          (time.monotonic() - t0)/10*1e3))
+            ddb.close_db()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,11 @@
 """Tests for the (Env)Experiment-facing dataset interface."""
 
 import copy
+import io
 import unittest
 
+import h5py
+import numpy
 from sipyco.sync_struct import process_mod
 
 from artiq.experiment import EnvExperiment
@@ -132,3 +135,136 @@ class ExperimentDatasetCase(unittest.TestCase):
         self.assertEqual(self.dataset_db.get_metadata(KEY), {})
 
 
+class HDF5StreamCase(unittest.TestCase):
+    def setUp(self):
+        self.dataset_db = MockDatasetDB()
+        self.dataset_db.data["archived"] = (True, 42, {})
+        self.dataset_mgr = DatasetManager(self.dataset_db)
+        self.exp = TestExperiment((None, self.dataset_mgr, None, None))
+        self.stream = h5py.File(io.BytesIO(), "w")
+        self.addCleanup(self.stream.close)
+
+    def _experiment(self):
+        self.exp.set("before", [1, 2, 3], unit="V")
+        self.dataset_mgr.start_hdf5_stream(self.stream, flush_period=0)
+        self.assertEqual(self.stream["datasets/before"][()].tolist(),
+                         [1, 2, 3])
+        self.exp.set("list", [])
+        for i in range(5):
+            self.exp.append("list", i)
+        self.exp.append("list", 0.5)
+        self.exp.set("rows", [[0, 1]])
+        self.exp.append("rows", [2, 3])
+        self.exp.set("array", numpy.zeros((4, 3)))
+        self.exp.mutate_dataset("array", ((1, 3), (0, 2)), 1)
+        self.exp.mutate_dataset("array", 3, [5, 6, 7])
+        self.exp.set("string", "abc")
+        self.exp.set("removed", 1)
+        self.exp.set("removed", 1, archive=False)
+        self.exp.get_dataset("archived")
+        self.exp.set("ragged", [[1]])
+        # cannot be represented until the list is complete
+        self.exp.append("ragged", [1, 2])
+        self.dataset_mgr.local["ragged"][0].append(2)
+
+        # appends are written to resizable datasets
+        rows = self.stream["datasets/rows"]
+        self.assertEqual(rows.maxshape, (None, 2))
+        self.assertEqual(rows[()].tolist(), [[0, 1], [2, 3]])
+        self.assertEqual(self.stream["datasets/list"][()].tolist(),
+                         [0, 1, 2, 3, 4, 0.5])
+        self.assertNotIn("removed", self.stream["datasets"])
+
+    def test_stream(self):
+        self._experiment()
+        f = self.dataset_mgr.finish_hdf5_stream()
+        self.assertIs(f, self.stream)
+        self.assertIsNone(self.dataset_mgr.hdf5_stream)
+
+        with h5py.File(io.BytesIO(), "w") as expected:
+            self.dataset_mgr.write_hdf5(expected)
+            for group in "datasets", "archive":
+                self.assertEqual(set(f[group]), set(expected[group]))
+                for key in f[group]:
+                    numpy.testing.assert_array_equal(f[group][key][()],
+                                                     expected[group][key][()])
+                    self.assertEqual(f[group][key].dtype,
+                                     expected[group][key].dtype)
+                    self.assertEqual(dict(f[group][key].attrs),
+                                     dict(expected[group][key].attrs))
+
+    def test_stream_relative_index(self):
+        self.dataset_mgr.start_hdf5_stream(self.stream, flush_period=3600)
+        self.exp.set("x", [0.0]*5)
+        self.exp.set("y", [0, 0, 0])
+        self.exp.set("array", numpy.zeros((3, 2)))
+        self.dataset_mgr.flush_hdf5_stream()
+        self.exp.mutate_dataset("x", -1, 42.0)
+        self.exp.mutate_dataset("x", (-3, -1), [1.0, 2.0])
+        self.exp.mutate_dataset("y", (None, None, -1), [1, 2, 3])
+        self.exp.mutate_dataset("array", ((-1, None), (0, 1)), 1.0)
+        self.exp.append("x", 7.0)
+        self.exp.append("y", 4)
+        f = self.dataset_mgr.finish_hdf5_stream()
+        self.assertEqual(f["datasets/x"][()].tolist(),
+                         [0.0, 0.0, 1.0, 2.0, 42.0, 7.0])
+        self.assertEqual(f["datasets/y"][()].tolist(), [3, 2, 1, 4])
+        self.assertEqual(f["datasets/array"][()].tolist(),
+                         [[0, 0], [0, 0], [1, 0]])
+
+    def test_stream_options(self):
+        self.dataset_mgr.default_hdf5_options = {"compression": "gzip"}
+        self.dataset_mgr.start_hdf5_stream(self.stream, flush_period=0)
+        self.exp.set("list", [0]*1000)
+        self.exp.append("list", 1)
+        dataset = self.stream["datasets/list"]
+        self.assertEqual(dataset.compression, "gzip")
+        self.assertEqual(dataset.maxshape, (None, ))
+        self.assertEqual(dataset[-2:].tolist(), [0, 1])
+
+
+class HDF5OptionsCase(unittest.TestCase):
+    def setUp(self):
+        self.dataset_mgr = DatasetManager(MockDatasetDB())
+        self.exp = TestExperiment((None, self.dataset_mgr, None, None))
+
+    def _write(self):
+        f = h5py.File(io.BytesIO(), "w")
+        self.addCleanup(f.close)
+        self.dataset_mgr.write_hdf5(f)
+        return f["datasets"]
+
+    def test_options(self):
+        image = numpy.zeros((4, 64, 64), numpy.uint16)
+        self.exp.set("image", image,
+                     hdf5_options={"chunks": (1, 64, 64), "compression": "lzf",
+                                   "shuffle": True})
+        self.exp.set("scalar", 1)
+        self.exp.set("small", numpy.zeros(16))
+        self.exp.set("large", numpy.zeros(1024))
+        self.exp.set("contiguous", numpy.zeros(1024), hdf5_options={})
+
+        datasets = self._write()
+        self.assertEqual(datasets["image"].chunks, (1, 64, 64))
+        self.assertEqual(datasets["image"].compression, "lzf")
+        self.assertTrue(datasets["image"].shuffle)
+        numpy.testing.assert_array_equal(datasets["image"][()], image)
+        for key in datasets:
+            if key != "image":
+                self.assertIsNone(datasets[key].compression)
+
+        self.dataset_mgr.default_hdf5_options = {"compression": "gzip",
+                                                 "compression_opts": 9}
+        datasets = self._write()
+        self.assertEqual(datasets["image"].compression, "lzf")
+        self.assertEqual(datasets["large"].compression, "gzip")
+        self.assertEqual(datasets["large"].compression_opts, 9)
+        # scalars, small arrays and explicitly contiguous datasets
+        for key in "scalar", "small", "contiguous":
+            self.assertIsNone(datasets[key].compression)
+            self.assertIsNone(datasets[key].chunks)
+
+    def test_invalid_options(self):
+        self.exp.set("scalar", 1, hdf5_options={"compression": "gzip"})
+        with self.assertRaises(TypeError):
+            self._write()
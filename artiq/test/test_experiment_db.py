@@ -0,0 +1,136 @@
+import unittest
+import asyncio
+import logging
+import os
+import tempfile
+import textwrap
+
+from artiq.master.experiments import FilesystemBackend, ExperimentDB
+
+
+_experiment_source = textwrap.dedent("""
+    from artiq.experiment import *
+
+    class {name}(EnvExperiment):
+        \"\"\"{title}\"\"\"
+        def build(self):
+            self.setattr_argument("x", NumberValue(1.0))
+
+        def run(self):
+            pass
+""")
+
+
+_lib_experiment_source = textwrap.dedent("""
+    from artiq.experiment import *
+    from lib import DEFAULT
+
+    class L(EnvExperiment):
+        def build(self):
+            self.setattr_argument("x", NumberValue(DEFAULT))
+
+        def run(self):
+            pass
+""")
+
+
+_dataset_experiment_source = textwrap.dedent("""
+    from artiq.experiment import *
+
+    class D(EnvExperiment):
+        def build(self):
+            self.setattr_argument(
+                "x", NumberValue(self.get_dataset("default_x", 1.0)))
+
+        def run(self):
+            pass
+""")
+
+
+class ExperimentDBCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.repository = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.repository.cleanup()
+        self.loop.close()
+
+    def _write(self, filename, content):
+        filename = os.path.join(self.repository.name, filename)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as f:
+            f.write(content)
+
+    def test_scan(self):
+        self._write("a.py", _experiment_source.format(name="A", title="Exp"))
+        self._write("b.py", _experiment_source.format(name="B", title="Exp"))
+        self._write("broken.py", "raise ValueError\n")
+        self._write("sub/c.py", _experiment_source.format(name="C", title="C"))
+
+        explist = self._scan(scan_workers=3)
+        self.assertEqual(set(explist.keys()), {"Exp", "Exp1", "sub/C"})
+        self.assertEqual({explist["Exp"]["class_name"],
+                          explist["Exp1"]["class_name"]}, {"A", "B"})
+        self.assertEqual(explist["sub/C"]["file"], os.path.join("sub", "c.py"))
+        self.assertIn("x", explist["sub/C"]["arginfo"])
+
+    def _scan(self, worker_handlers=None, **kwargs):
+        if worker_handlers is None:
+            worker_handlers = dict()
+        experiment_db = ExperimentDB(FilesystemBackend(self.repository.name),
+                                     worker_handlers, **kwargs)
+        try:
+            self.loop.run_until_complete(experiment_db.scan_repository())
+            return experiment_db.explist.raw_view
+        finally:
+            experiment_db.close()
+
+    def test_incremental_scan(self):
+        self._write("lib.py", "DEFAULT = 1.0\n")
+        self._write("a.py", _experiment_source.format(name="A", title="A"))
+        self._write("l.py", _lib_experiment_source)
+        cache = os.path.join(self.repository.name, ".examine_cache.pyon")
+
+        with self.assertLogs("artiq.master.experiments", logging.INFO) as logs:
+            explist = self._scan(examine_cache=cache)
+        self.assertIn("examining 3 of 3 files", "\n".join(logs.output))
+        self.assertEqual(explist["L"]["arginfo"]["x"][0]["default"], 1.0)
+
+        # Unchanged files are not examined again, even after a restart.
+        with self.assertLogs("artiq.master.experiments", logging.INFO) as logs:
+            explist = self._scan(examine_cache=cache)
+        self.assertIn("examining 0 of 3 files", "\n".join(logs.output))
+        self.assertEqual(set(explist.keys()), {"A", "L"})
+
+        # Changing an imported module invalidates its importers.
+        self._write("lib.py", "DEFAULT = 2.0\n")
+        with self.assertLogs("artiq.master.experiments", logging.INFO) as logs:
+            explist = self._scan(examine_cache=cache)
+        self.assertIn("examining 2 of 3 files", "\n".join(logs.output))
+        self.assertEqual(explist["L"]["arginfo"]["x"][0]["default"], 2.0)
+
+    def test_incremental_scan_datasets(self):
+        self._write("a.py", _experiment_source.format(name="A", title="A"))
+        self._write("d.py", _dataset_experiment_source)
+        cache = os.path.join(self.repository.name, ".examine_cache.pyon")
+        datasets = dict()
+        worker_handlers = {"get_dataset": datasets.__getitem__}
+
+        def scan(examined):
+            with self.assertLogs("artiq.master.experiments", logging.INFO) as logs:
+                explist = self._scan(worker_handlers, examine_cache=cache)
+            self.assertIn("examining {} of 2 files".format(examined),
+                          "\n".join(logs.output))
+            return explist["D"]["arginfo"]["x"][0]["default"]
+
+        self.assertEqual(scan(2), 1.0)
+        self.assertEqual(scan(0), 1.0)
+        # Files reading a dataset that was created or changed since they
+        # were examined are examined again.
+        datasets["default_x"] = 2.0
+        self.assertEqual(scan(1), 2.0)
+        self.assertEqual(scan(0), 2.0)
+        datasets["default_x"] = 3.0
+        self.assertEqual(scan(1), 3.0)
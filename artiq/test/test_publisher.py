@@ -0,0 +1,162 @@
+import asyncio
+import unittest
+
+import numpy
+
+from sipyco.sync_struct import Notifier, Subscriber, process_mod
+
+from artiq.master.publisher import (Publisher, ModQueue,
+                                    filtered_notifier_name)
+
+
+test_address = "::1"
+test_port = 7777
+
+
+class PublisherCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.datasets = Notifier(dict())
+        self.publisher = Publisher({"datasets": self.datasets})
+        self.loop.run_until_complete(
+            self.publisher.start(test_address, test_port))
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.publisher.stop())
+        self.loop.close()
+
+    def _subscribe(self, notifier_name):
+        received = {"mods": []}
+        def init(struct):
+            received["struct"] = struct
+            return struct
+        def mod(mod):
+            if mod["action"] != "init":
+                received["mods"].append(mod)
+        subscriber = Subscriber(notifier_name, init, mod)
+        self.loop.run_until_complete(
+            subscriber.connect(test_address, test_port))
+        return subscriber, received
+
+    def _wait(self, received, predicate, timeout=5.0):
+        async def wait():
+            while not predicate(received):
+                await asyncio.sleep(0.01)
+        self.loop.run_until_complete(asyncio.wait_for(wait(), timeout))
+
+    def test_filter(self):
+        self.datasets["a"] = (False, 1, {})
+        self.datasets["scan.x"] = (False, [], {})
+        self.datasets["other"] = (False, numpy.zeros(100), {})
+        subscribers = [
+            self._subscribe("datasets"),
+            self._subscribe(filtered_notifier_name(
+                "datasets", {"a"}, ["scan."]))
+        ]
+        try:
+            for _, received in subscribers:
+                self._wait(received, lambda r: "struct" in r)
+            self.assertEqual(set(subscribers[0][1]["struct"].keys()),
+                             {"a", "scan.x", "other"})
+            self.assertEqual(set(subscribers[1][1]["struct"].keys()),
+                             {"a", "scan.x"})
+
+            self.datasets["other"][1][0] = 1.0
+            self.datasets["scan.x"][1].append(2)
+            self.datasets["a"] = (False, 3, {})
+            self.datasets["b"] = (False, 4, {})
+            del self.datasets["other"]
+            for _, received in subscribers:
+                self._wait(received, lambda r: len(r["mods"]) >= 2)
+            self._wait(subscribers[0][1], lambda r: len(r["mods"]) == 5)
+            self.assertEqual(subscribers[1][1]["mods"],
+                             [{"action": "append", "path": ["scan.x", 1],
+                               "x": 2},
+                              {"action": "setitem", "path": [], "key": "a",
+                               "value": (False, 3, {})}])
+            self.assertEqual(subscribers[1][1]["struct"]["a"][1], 3)
+            self.assertEqual(subscribers[1][1]["struct"]["scan.x"][1], [2])
+        finally:
+            for subscriber, _ in subscribers:
+                self.loop.run_until_complete(subscriber.close())
+
+    def test_rate_limit(self):
+        self.datasets["x"] = (False, [0]*10, {})
+        self.datasets["y"] = (False, 0, {})
+        subscriber, received = self._subscribe(filtered_notifier_name(
+            "datasets", {"x", "y"}, max_rate=2.0))
+        try:
+            self._wait(received, lambda r: "struct" in r)
+            # wait for the rate limit to take effect
+            self.datasets["y"] = (False, -1, {})
+            self._wait(received, lambda r: len(r["mods"]) == 1)
+            for i in range(100):
+                self.datasets["y"] = (False, i, {})
+                self.datasets["x"][1][i % 10] = i
+            self.datasets["x"][1].append(100)
+            self.datasets["x"][1][0] = 101
+            self._wait(received,
+                       lambda r: r["struct"]["x"][1][0] == 101)
+            self.assertEqual(received["struct"]["y"][1], 99)
+            self.assertEqual(received["struct"]["x"][1],
+                             [101] + list(range(91, 100)) + [100])
+            # superseded modifications were dropped
+            self.assertEqual(len(received["mods"]), 1 + 1 + 9 + 1 + 1)
+        finally:
+            self.loop.run_until_complete(subscriber.close())
+
+
+class ModQueueCase(unittest.TestCase):
+    def test_coalesce(self):
+        mods = [
+            {"action": "setitem", "path": [], "key": "a", "value": 0},
+            {"action": "setitem", "path": ["b", 1], "key": 0, "value": 1},
+            {"action": "append", "path": ["b", 1], "x": 2},
+            {"action": "setitem", "path": ["b", 1], "key": 1, "value": 3},
+            {"action": "setitem", "path": ["b", 1], "key": 0, "value": 4},
+            {"action": "pop", "path": ["b", 1], "i": 0},
+            {"action": "setitem", "path": ["b", 1], "key": 0, "value": 5},
+            {"action": "setitem", "path": [], "key": "a", "value": 6},
+        ]
+        queue = ModQueue()
+        for i, mod in enumerate(mods):
+            queue.put(mod, i)
+        self.assertEqual([i for _, i in queue.take()], [2, 3, 4, 5, 6, 7])
+        self.assertEqual(len(queue), 0)
+
+        queue.put(mods[0], 0)
+        queue.put({"action": "init", "struct": {}}, 1)
+        queue.put(mods[1], 2)
+        self.assertEqual([i for _, i in queue.take()], [1, 2])
+
+        queue = ModQueue(coalesce=False)
+        for i, mod in enumerate(mods):
+            queue.put(mod, i)
+        self.assertEqual(len(queue), len(mods))
+
+    def test_negative_index(self):
+        # An append changes the element that a negative index refers to.
+        mods = [
+            {"action": "setitem", "path": ["x", 1], "key": -1, "value": 10},
+            {"action": "append", "path": ["x", 1], "x": 3},
+            {"action": "setitem", "path": ["x", 1], "key": -1, "value": 20},
+            {"action": "setitem", "path": ["x", 1], "key": -1, "value": 30},
+        ]
+        expected = {"x": (False, [0, 1, 2], {})}
+        received = {"x": (False, [0, 1, 2], {})}
+        queue = ModQueue()
+        for mod in mods:
+            process_mod(expected, mod)
+            queue.put(mod, None)
+        items = queue.take()
+        for mod, _ in items:
+            process_mod(received, mod)
+        self.assertEqual(received, expected)
+        # only the assignment after the append is superseded
+        self.assertEqual(len(items), 3)
+        self.assertEqual(expected["x"][1], [0, 1, 10, 30])
+
+
+if __name__ == "__main__":
+    unittest.main()
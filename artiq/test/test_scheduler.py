@@ -1,11 +1,16 @@
 import unittest
 import logging
 import asyncio
+import random
 import sys
-from time import time, sleep
+from time import time, sleep, monotonic
+
+from sipyco.sync_struct import Notifier
 
 from artiq.experiment import *
-from artiq.master.scheduler import Scheduler
+from artiq.master.worker_ipc import RunFlags
+from artiq.master.scheduler import (Scheduler, Pipeline, Run, RunStatus,
+                                    PrepareStage, RunStage, AnalyzeStage)
 
 
 class EmptyExperiment(EnvExperiment):
@@ -317,3 +322,153 @@ class SchedulerCase(unittest.TestCase):
 
     def tearDown(self):
         self.loop.close()
+
+
+def _best_run(pool, status, now=None):
+    # Reference selection, scanning all runs
+    return max((r for r in pool.runs.values()
+                if r.status == status
+                and (now is None or (r.due_date or 0) < now)),
+               key=lambda r: r.priority_key(), default=None)
+
+
+class RunIndexCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.scheduler = Scheduler(_RIDCounter(0), dict(), None, None)
+        self.pipeline = Pipeline(self.scheduler._ridc, self.scheduler._deleter,
+                                 dict(), Notifier(dict()), None, None)
+        self.scheduler._pipelines["main"] = self.pipeline
+        self.pool = self.pipeline.pool
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _submit(self, n, due_date=None, priorities=range(10)):
+        expid = _get_expid("EmptyExperiment")
+        for _ in range(n):
+            self.pool.submit(expid, random.choice(priorities),
+                             due_date() if due_date else None, False, "main")
+
+    def test_selection(self):
+        random.seed(0)
+        now = time()
+        self._submit(300,
+                     lambda: random.choice([None, now - 10, now + 0.1,
+                                            now + 1000]))
+        prepare = PrepareStage(self.pool, None)
+        run = RunStage(self.pool, None)
+        analyze = AnalyzeStage(self.pool, None)
+        for i in range(1000):
+            r = random.choice(list(self.pool.runs.values()))
+            if r.status == RunStatus.deleting:
+                del self.pool.runs[r.rid]
+            else:
+                r.status = random.choice([RunStatus.pending,
+                                          RunStatus.prepare_done,
+                                          RunStatus.running,
+                                          RunStatus.run_done,
+                                          RunStatus.deleting])
+            if i == 500:
+                # some due dates elapse
+                sleep(0.1)
+            expected = _best_run(self.pool, RunStatus.pending, time())
+            prepared = _best_run(self.pool, RunStatus.prepare_done)
+            if (expected is not None and prepared is not None
+                    and expected.priority_key() < prepared.priority_key()):
+                expected = None
+            candidate = prepare._get_run()
+            if expected is None:
+                self.assertNotIsInstance(candidate, Run)
+            else:
+                self.assertIs(candidate, expected)
+            self.assertIs(run._get_run(), prepared)
+            self.assertIs(analyze._get_run(),
+                          _best_run(self.pool, RunStatus.run_done))
+            running = [r for r in self.pool.runs.values()
+                       if r.status == RunStatus.running]
+            if running:
+                self.assertEqual(
+                    self.scheduler.check_pause(running[0].rid),
+                    prepared is not None
+                    and prepared.priority_key() > running[0].priority_key())
+
+    def test_run_flags(self):
+        for priority in 0, 1, 0:
+            self._submit(1, priorities=[priority])
+        low, high, other = self.pool.runs.values()
+        low.worker.run_flags = RunFlags()
+        # as opened by the worker process
+        flags = RunFlags(low.worker.run_flags.name)
+        try:
+            low.status = RunStatus.running
+            self.assertFalse(flags.check_pause)
+            other.status = RunStatus.prepare_done
+            self.assertFalse(flags.check_pause)
+            high.status = RunStatus.prepare_done
+            self.assertTrue(flags.check_pause)
+            self.assertFalse(flags.termination_requested)
+            high.status = RunStatus.running
+            self.assertFalse(flags.check_pause)
+            self.scheduler.request_termination(low.rid)
+            self.assertTrue(flags.check_pause)
+            self.assertTrue(flags.termination_requested)
+            self.assertEqual(self.scheduler.check_pause(low.rid),
+                             flags.check_pause)
+        finally:
+            flags.close()
+            self.loop.run_until_complete(low.worker.close())
+        self.assertIsNone(low.worker.run_flags)
+
+    def test_run_flags_not_running(self):
+        for priority in 0, 0, 1:
+            self._submit(1, priorities=[priority])
+        preempted, terminated, high = self.pool.runs.values()
+        flags = []
+        for run in preempted, terminated:
+            run.worker.run_flags = RunFlags()
+            flags.append(RunFlags(run.worker.run_flags.name))
+        try:
+            preempted.status = RunStatus.running
+            high.status = RunStatus.prepare_done
+            self.assertTrue(flags[0].check_pause)
+            terminated.status = RunStatus.running
+            self.scheduler.request_termination(terminated.rid)
+            self.assertTrue(flags[1].check_pause)
+
+            # The scheduler answers False for runs that are not running.
+            preempted.status = RunStatus.run_done
+            terminated.status = RunStatus.paused
+            for run, run_flags in zip((preempted, terminated), flags):
+                self.assertFalse(run_flags.check_pause)
+                self.assertFalse(self.scheduler.check_pause(run.rid))
+                self.assertEqual(run_flags.termination_requested,
+                                 self.scheduler.check_termination(run.rid))
+            self.assertTrue(flags[1].termination_requested)
+        finally:
+            for run, run_flags in zip((preempted, terminated), flags):
+                run_flags.close()
+                self.loop.run_until_complete(run.worker.close())
+
+    def test_benchmark(self):
+        now = time()
+        self._submit(10000, lambda: now + random.uniform(100, 10000))
+        self._submit(10)
+        for run in list(self.pool.runs.values())[-10:]:
+            run.status = RunStatus.prepare_done
+        running = list(self.pool.runs.values())[0]
+        running.status = RunStatus.running
+
+        prepare = PrepareStage(self.pool, None)
+        t0 = monotonic()
+        for _ in range(1000):
+            prepare._get_run()
+        t1 = monotonic()
+        for _ in range(1000):
+            self.scheduler.check_pause(running.rid)
+        t2 = monotonic()
+        print()
+        print("10k pending runs: prepare stage selection {:.1f} us, "
+              "check_pause {:.1f} us".format((t1 - t0)*1e3, (t2 - t1)*1e3))
+
@@ -4,6 +4,8 @@ import asyncio
 import sys
 from time import sleep
 
+from sipyco.sync_struct import process_mod
+
 from artiq.experiment import *
 from artiq.master.worker import *
 
@@ -52,6 +54,22 @@ class WatchdogTimeoutInBuild(EnvExperiment):
         pass
 
 
+class DatasetMutations(EnvExperiment):
+    def build(self):
+        pass
+
+    def run(self):
+        self.set_dataset("x", [], broadcast=True)
+        for i in range(10):
+            self.append_to_dataset("x", i)
+        # flushed by the batch delay
+        sleep(0.5)
+        self.append_to_dataset("x", 10)
+        self.mutate_dataset("x", 0, -1)
+        self.set_dataset("y", 1, broadcast=True)
+        self.set_dataset("y", 2, broadcast=True)
+
+
 async def _call_worker(worker, expid):
     try:
         await worker.build(0, "main", None, expid, 0)
@@ -67,14 +85,14 @@ class WorkerCase(unittest.TestCase):
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
 
-    def _run_experiment(self, class_name):
+    def _run_experiment(self, class_name, process_pool=None, handlers={}):
         expid = {
             "log_level": logging.WARNING,
             "file": sys.modules[__name__].__file__,
             "class_name": class_name,
             "arguments": dict()
         }
-        worker = Worker({})
+        worker = Worker(handlers, process_pool=process_pool)
         self.loop.run_until_complete(_call_worker(worker, expid))
 
     def test_simple_run(self):
@@ -99,5 +117,33 @@ class WorkerCase(unittest.TestCase):
         with self.assertRaises(WorkerWatchdogTimeout):
             self._run_experiment("WatchdogTimeoutInBuild")
 
+    def test_dataset_mutations(self):
+        mods = []
+        self._run_experiment("DatasetMutations",
+                             handlers={"update_dataset": mods.append})
+        datasets = dict()
+        for mod in mods:
+            process_mod(datasets, mod)
+        self.assertEqual(datasets, {"x": (False, [-1] + list(range(1, 11)), {}),
+                                    "y": (False, 2, {})})
+        # appends to a dataset set in the same batch, and overwritten
+        # values, are coalesced
+        self.assertEqual(len(mods), 4)
+
+    def test_worker_pool(self):
+        pool = WorkerPool(1, max_runs=2)
+        pool.start(loop=self.loop)
+        try:
+            for i in range(3):
+                self._run_experiment("SimpleExperiment", pool)
+            with self.assertRaises(WorkerInternalException):
+                self._run_experiment("ExceptionTermination", pool)
+            self._run_experiment("SimpleExperiment", pool)
+        finally:
+            self.loop.run_until_complete(pool.stop())
+        stats = pool.get_stats()
+        self.assertEqual(stats["leases"], 5)
+        self.assertEqual(stats["idle"], 0)
+
     def tearDown(self):
         self.loop.close()
@@ -0,0 +1,135 @@
+import io
+import threading
+import time
+import unittest
+
+import numpy
+from sipyco.sync_struct import Notifier, process_mod
+
+from artiq.master import worker_ipc
+
+
+def _roundtrip(obj, binary):
+    stream = io.BytesIO(b"".join(bytes(chunk)
+                                 for chunk in worker_ipc.encode(obj, binary)))
+    def read_exactly(n):
+        return bytearray(stream.read(n))
+    obj = worker_ipc.decode(stream.readline(), read_exactly)
+    # the whole message must have been consumed
+    assert not stream.read()
+    return obj
+
+
+class WorkerIPCCase(unittest.TestCase):
+    def test_roundtrip(self):
+        message = {
+            "action": "update_dataset",
+            "args": ({
+                "action": "setitem",
+                "path": [],
+                "key": "scan",
+                "value": (False, numpy.arange(1000.), {"unit": "V"})
+            }, ),
+            "kwargs": {
+                "small": numpy.arange(3),
+                "image": numpy.ones((64, 48), dtype=numpy.uint16),
+                "transposed": numpy.arange(2000).reshape((40, 50)).T,
+                "list": [1, 2.5, "three", None]
+            }
+        }
+        for binary in False, True:
+            decoded = _roundtrip(message, binary)
+            self.assertEqual(decoded["action"], "update_dataset")
+            value = decoded["args"][0]["value"]
+            self.assertIsInstance(value, tuple)
+            numpy.testing.assert_array_equal(value[1], numpy.arange(1000.))
+            self.assertEqual(value[2], {"unit": "V"})
+            for key in "small", "image", "transposed":
+                array = decoded["kwargs"][key]
+                numpy.testing.assert_array_equal(array,
+                                                 message["kwargs"][key])
+                self.assertEqual(array.dtype, message["kwargs"][key].dtype)
+            self.assertEqual(decoded["kwargs"]["list"], [1, 2.5, "three", None])
+            # datasets may be mutated in place by the receiver
+            value[1][0] = -1
+
+    def test_pyon_fallback(self):
+        # Messages without large arrays are always sent as PYON lines.
+        chunks = worker_ipc.encode({"action": "completed"}, True)
+        self.assertEqual(len(chunks), 1)
+        self.assertFalse(bytes(chunks[0]).startswith(worker_ipc.FRAME_MARKER))
+
+    def test_benchmark(self):
+        print()
+        for size in 1000, 100000, 1000000:
+            message = {"action": "update_dataset",
+                       "args": ({"action": "setitem", "path": [],
+                                 "key": "data",
+                                 "value": (False, numpy.random.rand(size),
+                                           {})}, ),
+                       "kwargs": {}}
+            times = []
+            for binary in False, True:
+                t0 = time.monotonic()
+                for _ in range(5):
+                    _roundtrip(message, binary)
+                times.append((time.monotonic() - t0)/5)
+            print("{:>9} float64: PYON {:8.2f} ms, binary {:8.2f} ms"
+                  .format(size, times[0]*1e3, times[1]*1e3))
+
+
+class DatasetModBatcherCase(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.sent = threading.Event()
+        def send(mods):
+            self.batches.append(mods)
+            self.sent.set()
+        self.batcher = worker_ipc.DatasetModBatcher(send, max_delay=0.001)
+        self.notifier = Notifier(dict())
+        self.notifier.publish = self.batcher.update
+
+    def received(self):
+        self.batcher.flush()
+        datasets = dict()
+        for mods in self.batches:
+            for mod in mods:
+                process_mod(datasets, mod)
+        return datasets
+
+    def test_coalesce(self):
+        self.batcher.max_delay = 60
+        self.notifier["x"] = (False, [], {})
+        for i in range(10):
+            self.notifier["x"][1].append(i)
+        self.notifier["x"][1][0] = -1
+        self.notifier["y"] = (False, 1, {})
+        self.notifier["y"] = (False, 2, {})
+        self.assertEqual(self.received(), self.notifier.raw_view)
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(len(self.batches[0]), 2)
+
+    def test_flush_during_append(self):
+        def publish(mod):
+            # The backing list has already been changed; let the timer
+            # flush the pending set before the modification is queued.
+            self.sent.clear()
+            self.sent.wait(1)
+            self.batcher.update(mod)
+        self.notifier["x"] = (False, [], {})
+        self.notifier.publish = publish
+        for i in range(5):
+            self.notifier["x"][1].append(i)
+        self.assertEqual(self.received(), {"x": (False, list(range(5)), {})})
+
+    def test_host_mutation(self):
+        self.batcher.max_delay = 60
+        value = numpy.zeros(3)
+        self.notifier["x"] = (False, value, {})
+        # not sent to the master
+        value[0] = 1
+        self.assertEqual(self.received()["x"][1].tolist(), [0, 0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()